@@ -3,6 +3,7 @@ import os
 from flask import request
 from app import app
 from app.utils import init_db
+from app.hash_pool import HashPoolBusyError
 
 # 记录应用启动日志
 app.logger.info('应用启动')
@@ -19,6 +20,15 @@ def internal_server_error(e):
     from app.utils import make_json_response
     return make_json_response(500, '服务器内部错误', status_code=500)
 
+# 密码哈希任务排队已满：快速失败，提示客户端稍后重试
+@app.errorhandler(HashPoolBusyError)
+def hash_pool_busy(e):
+    app.logger.warning('密码哈希任务繁忙，拒绝请求: %s', request.path)
+    from app.utils import make_json_response
+    response = make_json_response(503, '服务器繁忙，请稍后重试', status_code=503)
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 # 添加全局异常处理
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -36,6 +46,18 @@ if __name__ == '__main__':
     # 初始化数据库
     with app.app_context():
         init_db()
+        # 加载用户自动补全索引
+        from app import user_suggest_index
+        user_suggest_index.reload()
+    
+    # 预先建立连接池的最少连接
+    from app import mysql, hash_pool
+    mysql.pool.fill()
+    
+    # 预先启动密码哈希工作进程，并按目标校验耗时校准哈希轮数（WSGI部署时在第一次哈希时校准）
+    hash_pool.start()
+    from app.passwords import calibrate_hash_rounds
+    calibrate_hash_rounds()
     
     # 获取环境变量配置
     # 根据FLASK_ENV环境变量设置debug模式，production环境下debug为False，其他为True
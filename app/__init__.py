@@ -1,9 +1,16 @@
-from flask import Flask, session, request
-from flask_mysqldb import MySQL
+from flask import Flask, session, g
 from flask_wtf.csrf import CSRFProtect
 import config
+from app.db_pool import MySQLPool
+from app.db_metrics import QueryMetrics
+from app.query_cache import LRUCache
+from app.permissions import PermissionResolver
+from app.sessions import create_session_interface
+from app.hash_pool import HashPool
+from app.captcha import CaptchaPool, CaptchaTokens
+from app.suggest import PrefixIndex
+from app.rows import RowJSONProvider
 import os
-import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
@@ -51,6 +58,21 @@ def setup_logging(app):
     werkzeug_logger.addHandler(file_handler)
     # 设置日志级别
     werkzeug_logger.setLevel(logging.INFO)
+    
+    # 配置慢查询日志器（单独的日志文件）
+    slow_query_handler = TimedRotatingFileHandler(
+        os.path.join(log_dir, 'slow_query.log'),
+        when='midnight',
+        interval=1,
+        backupCount=0,
+        encoding='utf-8'
+    )
+    slow_query_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger = logging.getLogger('slow_query')
+    slow_query_logger.handlers.clear()
+    slow_query_logger.addHandler(slow_query_handler)
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
 
 # 创建Flask应用实例，显式指定模板目录和静态目录路径
 app = Flask(__name__, 
@@ -60,6 +82,9 @@ app = Flask(__name__,
 # 加载配置
 app.config.from_object(config)
 
+# 使用支持紧凑行对象（Row）的JSON序列化
+app.json = RowJSONProvider(app)
+
 # 根据环境变量设置生产/开发模式
 if os.environ.get('FLASK_ENV') == 'production':
     app.config['DEBUG'] = False
@@ -80,71 +105,80 @@ app.config['X_CONTENT_TYPE_OPTIONS'] = 'nosniff'
 app.config['X_XSS_PROTECTION'] = '1; mode=block'
 app.config['CONTENT_SECURITY_POLICY'] = "default-src 'self'"
 
-# 初始化MySQL
-mysql = MySQL(app)
+# 初始化MySQL连接池（接口与flask_mysqldb一致，通过mysql.connection获取连接）
+mysql = MySQLPool(app)
+
+# 初始化查询指标收集器（按SQL指纹统计延迟和行数，记录慢查询）
+query_metrics = QueryMetrics(app.config.get('SLOW_QUERY_THRESHOLD_MS'))
+
+# 初始化查询结果缓存（execute_db_query(cache=True)使用，写操作按表失效）
+query_cache = LRUCache(
+    max_entries=app.config.get('QUERY_CACHE_MAX_ENTRIES', 1024),
+    ttl=app.config.get('QUERY_CACHE_TTL', 60)
+)
+
+# 初始化个人信息缓存（/api/profile使用，按用户ID缓存，修改个人信息/头像/用户时失效）
+profile_cache = LRUCache(
+    max_entries=app.config.get('PROFILE_CACHE_MAX_ENTRIES', 4096),
+    ttl=app.config.get('PROFILE_CACHE_TTL', 30)
+)
+
+# 初始化用户自动补全索引（/api/users/suggest使用，用户增删改时增量更新）
+user_suggest_index = PrefixIndex(refresh_interval=app.config.get('SUGGEST_REFRESH_INTERVAL', 300))
+
+# 初始化权限解析器（requires_role/requires_permission使用，缓存用户角色和角色权限）
+permission_resolver = PermissionResolver(
+    max_entries=app.config.get('PERMISSION_CACHE_MAX_ENTRIES', 4096),
+    ttl=app.config.get('PERMISSION_CACHE_TTL', 60),
+    claims_ttl=app.config.get('AUTH_CLAIMS_TTL', 300)
+)
+
+# 初始化密码哈希进程池（密码哈希和校验在独立进程中执行，排队数量有上限）
+hash_pool = HashPool(
+    workers=app.config.get('HASH_POOL_WORKERS'),
+    queue_size=app.config.get('HASH_POOL_QUEUE_SIZE', 32),
+    bulk_workers=app.config.get('HASH_POOL_BULK_WORKERS')
+)
+
+# 初始化验证码图片池（后台线程预先绘制验证码，请求时直接取出）
+captcha_pool = CaptchaPool(
+    size=app.config.get('CAPTCHA_POOL_SIZE', 256),
+    refill_interval=app.config.get('CAPTCHA_REFILL_INTERVAL', 1.0),
+    font_path=app.config.get('CAPTCHA_FONT_PATH')
+)
+
+# 初始化无状态验证码令牌（CAPTCHA_MODE=token时使用）
+captcha_tokens = CaptchaTokens(
+    app.secret_key,
+    ttl=app.config.get('CAPTCHA_TOKEN_TTL', 300),
+    replay_cache_size=app.config.get('CAPTCHA_REPLAY_CACHE_SIZE', 100000)
+)
+
+# 会话接口：根据SESSION_TYPE使用签名Cookie会话或服务端会话（均带进程内缓存）
+app.session_interface = create_session_interface(app)
 
 # 初始化CSRF保护
 csrf = CSRFProtect(app)
 
 # 权限列表将从数据库动态获取
 
-# 中间件：解析请求头中的Cookie并加载到Flask session中
-@app.before_request
-def parse_cookie_to_session():
-    if 'Cookie' in request.headers:
-        from flask.sessions import SecureCookieSessionInterface
-        cookie_value = request.headers.get('Cookie')
-        # 查找session=开头的Cookie
-        session_cookie = None
-        for cookie in cookie_value.split(';'):
-            cookie = cookie.strip()
-            if cookie.startswith('session='):
-                session_cookie = cookie[8:]  # 去掉session=前缀
-                break
-        
-        if session_cookie:
-            # 解析并加载session数据
-            interface = SecureCookieSessionInterface()
-            try:
-                session_data = interface.get_signing_serializer(app).loads(session_cookie)
-                # 先清空当前session，然后加载新的session数据
-                session.clear()
-                session.update(session_data)
-            except Exception:
-                # 如果解析失败，忽略该Cookie
-                pass
-
 # 上下文处理器：提供模板中可用的全局函数和变量
 @app.context_processor
 def inject_permission_check():
     def current_user_has_permission(permission):
-        if 'logged_in' in session:
-            from app.utils import execute_db_query
-            
-            # 获取当前用户信息
-            user = execute_db_query('SELECT * FROM users WHERE username = %s', 
-                                  [session['username']], fetch_one=True)
-            
-            if user and user.get('role'):
-                # 获取角色权限
-                role = execute_db_query('SELECT * FROM roles WHERE role = %s', 
-                                      [user['role']], fetch_one=True)
-                
-                if role:
-                    role_permissions = role.get('permissions', '[]')
-                    if isinstance(role_permissions, str):
-                        role_permissions = json.loads(role_permissions)
-                    
-                    # 检查是否有需要的权限
-                    return permission in set(role_permissions)
-        
-        return False
+        if 'logged_in' not in session:
+            return False
+        # 当前用户的权限集合每个请求最多解析一次（来自session中的授权声明），之后的调用只做集合查找
+        permissions = g.get('_current_user_permissions')
+        if permissions is None:
+            permissions = g._current_user_permissions = frozenset(
+                permission_resolver.session_claims(session)['permissions']
+            )
+        return permission in permissions
     
-    # 从数据库获取权限列表
+    # 从缓存的权限目录获取权限列表
     try:
-        from app.utils import execute_db_query
-        permissions = execute_db_query('SELECT permission FROM role_permissions ORDER BY id')
-        PERMISSION_NAMES = [p['permission'] for p in permissions]
+        PERMISSION_NAMES = list(permission_resolver.permission_names())
     except Exception as e:
         app.logger.error(f"获取权限列表失败: {e}")
         PERMISSION_NAMES = []
@@ -162,6 +196,7 @@ from app import user_routes
 from app import role_routes
 from app import audit_routes
 from app import profile_routes
+from app import admin_routes
 
 # 导入定时任务模块
 app.logger.info('正在导入定时任务模块...')
@@ -170,8 +205,10 @@ app.logger.info('定时任务模块导入完成')
 
 # 应用启动时启动调度器
 import os
-# 检查是否在开发环境的重载器中运行
-if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or os.environ.get('FLASK_ENV') == 'production':
+import multiprocessing
+# 检查是否在开发环境的重载器中运行；以spawn方式启动的密码哈希工作进程会重新导入本模块，不能启动调度器
+if multiprocessing.parent_process() is None and (
+        os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or os.environ.get('FLASK_ENV') == 'production'):
     # 在生产环境下直接启动调度器
     # 在开发环境下，只在实际运行的子进程中启动调度器，避免在重载器中启动两次
     app.logger.info('正在启动调度器...')
@@ -0,0 +1,38 @@
+from flask import request, session
+from app import app, csrf, mysql, query_metrics, query_cache, profile_cache, user_suggest_index, permission_resolver, hash_pool, captcha_pool
+from app.utils import make_json_response
+from app.decorators import is_logged_in, requires_role
+
+# 获取数据库运行指标API - RESTful接口
+@app.route('/api/admin/db_stats', methods=['GET'])
+@is_logged_in
+@requires_role('管理员')
+def get_db_stats_api():
+    # 获取请求参数
+    try:
+        limit = max(1, int(request.args.get('limit', 50)))
+    except ValueError:
+        return make_json_response(400, 'limit参数必须是整数', status_code=400)
+    
+    # 汇总连接池状态和按SQL指纹/路由统计的查询耗时
+    stats = query_metrics.snapshot(limit=limit)
+    stats['pool'] = mysql.stats()
+    stats['cache'] = query_cache.stats()
+    stats['permission_cache'] = permission_resolver.stats()
+    stats['profile_cache'] = profile_cache.stats()
+    stats['suggest_index'] = user_suggest_index.stats()
+    stats['session_cache'] = app.session_interface.stats()
+    stats['hash_pool'] = hash_pool.stats()
+    stats['captcha_pool'] = captcha_pool.stats()
+    
+    return make_json_response(200, '获取数据库指标成功', stats)
+
+# 重置数据库运行指标API - RESTful接口
+@app.route('/api/admin/db_stats', methods=['DELETE'])
+@csrf.exempt  # API接口禁用CSRF保护
+@is_logged_in
+@requires_role('管理员')
+def reset_db_stats_api():
+    query_metrics.reset()
+    app.logger.info(f"用户{session.get('username')}重置了数据库查询指标")
+    return make_json_response(200, '数据库指标已重置')
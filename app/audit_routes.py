@@ -1,7 +1,12 @@
-from flask import render_template, request, jsonify, session
+from flask import render_template, request, jsonify, session, Response, stream_with_context
 from app import app
-from app.utils import make_json_response, get_request_data, execute_db_query
+from app.utils import make_json_response, get_request_data, execute_db_query, stream_db_query
+import csv
+import io
+import json
+from datetime import datetime
 from app.decorators import is_logged_in, requires_permission
+from app.pagination import parse_count_mode, count_rows
 
 # 审计日志页面 - Web界面
 @app.route('/admin/audit_logs')
@@ -25,6 +30,8 @@ def get_audit_logs_api():
     details = request.args.get('details', '')
     start_date = request.args.get('start_time', request.args.get('startDate', ''))
     end_date = request.args.get('end_time', request.args.get('endDate', ''))
+    # 总数计算方式：exact、estimate、none，未指定时根据表大小选择
+    count_mode = parse_count_mode(request.args.get('count'))
     
     # 构建查询条件
     where_clause = "WHERE 1=1"
@@ -59,8 +66,7 @@ def get_audit_logs_api():
         params.append(end_date)
     
     # 获取总数
-    count_query = f"SELECT COUNT(*) as count FROM audit_logs {where_clause}"
-    total = execute_db_query(count_query, params, fetch_one=True)['count']
+    total, count_mode = count_rows('audit_logs', where_clause, params, count_mode)
     
     # 计算分页偏移量
     offset = (page - 1) * page_size
@@ -68,7 +74,7 @@ def get_audit_logs_api():
     # 获取审计日志列表
     logs_query = f"SELECT * FROM audit_logs {where_clause} ORDER BY created_at DESC LIMIT %s OFFSET %s"
     params.extend([page_size, offset])
-    logs = execute_db_query(logs_query, params)
+    logs = execute_db_query(logs_query, params, compact=True)
     
     # 格式化审计日志数据
     for log in logs:
@@ -77,8 +83,8 @@ def get_audit_logs_api():
             if isinstance(log['details'], str):
                 log['details'] = json.loads(log['details'])
     
-    # 计算总页数
-    total_pages = (total + page_size - 1) // page_size
+    # 计算总页数（不计算总数时为None）
+    total_pages = (total + page_size - 1) // page_size if total is not None else None
     
     # 返回完整的分页数据
     return make_json_response(200, '获取审计日志列表成功', {
@@ -86,7 +92,8 @@ def get_audit_logs_api():
         'logs': logs,
         'page': page,
         'page_size': page_size,
-        'total_pages': total_pages
+        'total_pages': total_pages,
+        'count_mode': count_mode
     })
 
 # 获取审计日志详情API - RESTful接口
@@ -154,145 +161,140 @@ def export_audit_logs_api():
         where_clause += " AND created_at <= %s"
         params.append(end_date)
     
-    # 优化查询：使用分页分批获取数据，避免一次性加载大量数据
-    logs = []
-    batch_size = 1000
-    page = 0
+    # 使用服务端游标流式读取并逐行输出CSV，内存占用与日志条数无关
+    logs_query = f"SELECT * FROM audit_logs {where_clause} ORDER BY created_at DESC"
     
-    while True:
-        offset = page * batch_size
-        logs_query = f"SELECT * FROM audit_logs {where_clause} ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        batch_params = params + [batch_size, offset]
-        batch_logs = execute_db_query(logs_query, batch_params)
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
         
-        if not batch_logs:
-            break
-            
-        logs.extend(batch_logs)
-        page += 1
+        # 写入标题行
+        writer.writerow(['序号', '用户名', '操作类型', '操作目标', '操作详情', 'IP地址', '创建时间'])
         
-        # 防止无限循环（安全措施）
-        if page > 1000:  # 最多100万条记录
-            break
-    
-    # 生成CSV内容
-    import csv
-    import io
-    from datetime import datetime
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # 写入标题行
-    writer.writerow(['序号', '用户名', '操作类型', '操作目标', '操作详情', 'IP地址', '创建时间'])
-    
-    # 写入数据行
-    for index, log in enumerate(logs):
-        # 使用连续序号，从1开始
-        sequential_number = index + 1
-        details_str = ''
-        if log.get('details'):
-            import json
-            details = log['details']
-            if isinstance(details, str):
-                try:
-                    details = json.loads(details)
-                except:
-                    details_str = details
-                    details = None
-            
-            if isinstance(details, dict):
-                # 优先使用后端提供的格式化详情
-                if details.get('formatted'):
-                    details_str = details['formatted']
-                else:
-                    # 使用与前端相同的格式化逻辑
-                    action = log['action']
-                    try:
-                        if not details: 
-                            details_str = '无详细信息'
-                        elif action == '登录':
-                            error_msg = details.get('error') or details.get('reason') or ''
-                            result = '成功' if details.get('result') == '成功' else f'失败：{error_msg}'
-                            details_str = f"登录{result}"
-                        elif action in ['注销', '退出登录']:
-                            details_str = '用户退出登录系统'
-                        elif action == '创建用户':
-                            details_str = f"创建用户：{details.get('username')} (角色：{details.get('role')})"
-                        elif action == '编辑用户':
-                            if details.get('old_role') and details.get('new_role') and details.get('old_role') != details.get('new_role'):
-                                details_str = f"更新用户角色设置，从 {details.get('old_role')} 改为 {details.get('new_role')}"
-                            else:
-                                details_str = '更新用户信息'
-                        elif action == '删除用户':
-                            details_str = f"删除用户：{details.get('username')}"
-                        elif action == '重置密码':
-                            details_str = f"重置用户密码：{details.get('username')}"
-                        elif action == '批量重置密码':
-                            usernames = details.get('usernames', [])
-                            if usernames:
-                                details_str = f"批量重置密码：{', '.join(usernames)}"
-                            else:
-                                details_str = f"批量重置密码：共{details.get('count', 0)}个用户"
-                        elif action == '修改密码':
-                            details_str = '修改个人密码'
-                        elif action == '更新角色':
-                            details_str = f"更新角色 {details.get('role') or details.get('new_role_name')} 权限设置"
-                        elif action == '删除角色':
-                            details_str = f"删除角色：{details.get('role') or details.get('role_name')}"
-                        elif action == '批量删除角色':
-                            if details.get('roles') and details['roles']:
-                                details_str = f"批量删除角色：{', '.join(details['roles'])}"
-                            else:
-                                details_str = f"批量删除角色：共{details.get('count', 0)}个"
-                        elif action == '创建角色':
-                            details_str = f"创建角色 {details.get('role_name')}，包含 {len(details.get('permissions') or [])} 个权限"
-                        elif action == '更换头像':
-                            details_str = '更换个人头像'
-                        elif action == '修改资料':
-                            details_str = '修改个人资料'
-                        else:
-                            # 通用格式
-                            key_map = {
-                                'result': '结果',
-                                'username': '用户名',
-                                'role': '角色',
-                                'old_role': '原角色',
-                                'new_role': '新角色',
-                                'role_name': '角色名称',
-                                'permissions': '权限数量',
-                                'error': '错误',
-                                'reason': '原因',
-                                'name': '名称'
-                            }
-                            entries = []
-                            for key, value in details.items():
-                                if key != 'formatted' and value:
-                                    display_key = key_map.get(key, key)
-                                    if key == 'permissions' and isinstance(value, list):
-                                        display_value = f"{len(value)}个"
-                                    else:
-                                        display_value = value
-                                    entries.append(f"{display_key}：{display_value}")
-                            details_str = '；'.join(entries) if entries else '无详细信息'
-                    except:
-                        details_str = json.dumps(details, ensure_ascii=False)
+        # 写入数据行
+        for index, log in enumerate(stream_db_query(logs_query, params)):
+            # 使用连续序号，从1开始
+            sequential_number = index + 1
+            writer.writerow([
+                sequential_number,
+                log['username'],
+                log['action'],
+                log['target'],
+                format_export_details(log),
+                log['ip_address'],
+                log['created_at']
+            ])
             
-        writer.writerow([
-            sequential_number,
-            log['username'],
-            log['action'],
-            log['target'],
-            details_str,
-            log['ip_address'],
-            log['created_at']
-        ])
+            # 攒够一批再输出，减少分块数量
+            if output.tell() >= 64 * 1024:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+        
+        yield output.getvalue()
     
     # 设置响应头
-    output.seek(0)
-    from flask import make_response
-    response = make_response(output.getvalue())
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename=audit_logs_{datetime.now().strftime("%Y%m%d%H%M%S")}.csv'
     response.headers['Content-Type'] = 'text/csv; charset=utf-8'
     
     return response
+
+# 辅助函数：格式化导出CSV中的操作详情
+def format_export_details(log):
+    """
+    将审计日志的details字段格式化为导出CSV中的“操作详情”文本
+    
+    参数:
+        log (dict): 审计日志记录
+    
+    返回:
+        str: 格式化后的操作详情
+    """
+    details_str = ''
+    if log.get('details'):
+        details = log['details']
+        if isinstance(details, str):
+            try:
+                details = json.loads(details)
+            except:
+                details_str = details
+                details = None
+        
+        if isinstance(details, dict):
+            # 优先使用后端提供的格式化详情
+            if details.get('formatted'):
+                details_str = details['formatted']
+            else:
+                # 使用与前端相同的格式化逻辑
+                action = log['action']
+                try:
+                    if not details: 
+                        details_str = '无详细信息'
+                    elif action == '登录':
+                        error_msg = details.get('error') or details.get('reason') or ''
+                        result = '成功' if details.get('result') == '成功' else f'失败：{error_msg}'
+                        details_str = f"登录{result}"
+                    elif action in ['注销', '退出登录']:
+                        details_str = '用户退出登录系统'
+                    elif action == '创建用户':
+                        details_str = f"创建用户：{details.get('username')} (角色：{details.get('role')})"
+                    elif action == '编辑用户':
+                        if details.get('old_role') and details.get('new_role') and details.get('old_role') != details.get('new_role'):
+                            details_str = f"更新用户角色设置，从 {details.get('old_role')} 改为 {details.get('new_role')}"
+                        else:
+                            details_str = '更新用户信息'
+                    elif action == '删除用户':
+                        details_str = f"删除用户：{details.get('username')}"
+                    elif action == '重置密码':
+                        details_str = f"重置用户密码：{details.get('username')}"
+                    elif action == '批量重置密码':
+                        usernames = details.get('usernames', [])
+                        if usernames:
+                            details_str = f"批量重置密码：{', '.join(usernames)}"
+                        else:
+                            details_str = f"批量重置密码：共{details.get('count', 0)}个用户"
+                    elif action == '修改密码':
+                        details_str = '修改个人密码'
+                    elif action == '更新角色':
+                        details_str = f"更新角色 {details.get('role') or details.get('new_role_name')} 权限设置"
+                    elif action == '删除角色':
+                        details_str = f"删除角色：{details.get('role') or details.get('role_name')}"
+                    elif action == '批量删除角色':
+                        if details.get('roles') and details['roles']:
+                            details_str = f"批量删除角色：{', '.join(details['roles'])}"
+                        else:
+                            details_str = f"批量删除角色：共{details.get('count', 0)}个"
+                    elif action == '创建角色':
+                        details_str = f"创建角色 {details.get('role_name')}，包含 {len(details.get('permissions') or [])} 个权限"
+                    elif action == '更换头像':
+                        details_str = '更换个人头像'
+                    elif action == '修改资料':
+                        details_str = '修改个人资料'
+                    else:
+                        # 通用格式
+                        key_map = {
+                            'result': '结果',
+                            'username': '用户名',
+                            'role': '角色',
+                            'old_role': '原角色',
+                            'new_role': '新角色',
+                            'role_name': '角色名称',
+                            'permissions': '权限数量',
+                            'error': '错误',
+                            'reason': '原因',
+                            'name': '名称'
+                        }
+                        entries = []
+                        for key, value in details.items():
+                            if key != 'formatted' and value:
+                                display_key = key_map.get(key, key)
+                                if key == 'permissions' and isinstance(value, list):
+                                    display_value = f"{len(value)}个"
+                                else:
+                                    display_value = value
+                                entries.append(f"{display_key}：{display_value}")
+                        details_str = '；'.join(entries) if entries else '无详细信息'
+                except:
+                    details_str = json.dumps(details, ensure_ascii=False)
+    return details_str
@@ -1,8 +1,10 @@
 from flask import render_template, request, jsonify, session, redirect, url_for, flash
-from app import app, csrf
-from app.utils import make_json_response, get_request_data, execute_db_query, log_audit, generate_captcha
+from app import app, csrf, permission_resolver
+from app.utils import make_json_response, get_request_data, execute_db_query, log_audit, generate_captcha, verify_captcha
 from app.decorators import is_logged_in
-from passlib.hash import sha256_crypt
+from app.passwords import verify_password, needs_rehash, hash_password
+from app.hash_pool import HashPoolBusyError
+from app.sessions import regenerate_session
 
 # 生成随机验证码
 @app.route('/api/captcha')
@@ -26,16 +28,9 @@ def login_api():
     # 验证验证码 - 2873为万能验证码
     if captcha == '2873':
         pass  # 万能验证码通过验证
-    else:
-        # 检查会话中的验证码
-        session_captcha = session.get('captcha', '')
-        
-        # 确保验证码不为空且匹配
-        if not captcha or not session_captcha or captcha.upper() != session_captcha.upper():
-            return make_json_response(400, '验证码错误', status_code=400)
-    
-    # 验证码验证通过后，清空会话中的验证码以防止重复使用
-    session.pop('captcha', None)
+    elif not verify_captcha(captcha, data.get('captcha_token')):
+        # 检查验证码（会话模式对比会话中的验证码，无状态模式校验验证码令牌）
+        return make_json_response(400, '验证码错误', status_code=400)
     
     # 检查用户名是否存在
     user = execute_db_query('SELECT * FROM users WHERE username = %s', [username], fetch_one=True)
@@ -45,11 +40,23 @@ def login_api():
         password = user['password']
         
         # 验证密码
-        if sha256_crypt.verify(password_candidate, password):
-            # 登录成功，设置会话数据
+        if verify_password(password_candidate, password):
+            # 登录成功，更换会话ID后设置会话数据
+            regenerate_session(session)
             session['logged_in'] = True
             session['username'] = username
             session['user_id'] = user['id']
+            # 写入签名的授权声明（角色、权限和版本戳），之后的权限检查无需查询数据库
+            session['auth'] = permission_resolver.issue_claims(username, user['role'])
+            
+            # 已保存哈希的参数与当前策略不一致时，用本次登录的明文密码重新计算哈希
+            if needs_rehash(password):
+                try:
+                    execute_db_query('UPDATE users SET password = %s WHERE id = %s',
+                                     (hash_password(password_candidate), user['id']), commit=True)
+                except HashPoolBusyError:
+                    # 哈希任务繁忙时跳过，下次登录再更新
+                    pass
             
             # 记录登录成功的审计日志
             log_audit(
@@ -0,0 +1,245 @@
+# 验证码模块
+# 后台线程预先绘制好验证码图片（文本, PNG数据）放入环形缓冲区，
+# 请求处理时只需取出一张，不再在请求线程上加载字体、绘图和PNG编码；
+# 验证码答案可以签名为无状态令牌随图片下发，不需要写入session
+import io
+import hmac
+import time
+import base64
+import random
+import string
+import hashlib
+import logging
+import secrets
+import threading
+from collections import deque
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.query_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 依次尝试加载的字体（Windows自带arial，Linux常见DejaVuSans），都不可用时使用Pillow内置字体
+_FONT_CANDIDATES = ('arial.ttf', 'DejaVuSans.ttf')
+
+CAPTCHA_WIDTH, CAPTCHA_HEIGHT = 100, 38
+
+
+def load_captcha_font(font_path=None, size=20):
+    """
+    加载验证码字体
+
+    参数:
+        font_path: 配置的字体文件路径（可选）
+        size: 字号
+
+    返回:
+        ImageFont: 字体对象
+    """
+    for candidate in ((font_path,) if font_path else ()) + _FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def random_captcha_text(length=4):
+    """生成随机验证码文本（大写字母和数字）"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+
+
+def render_captcha_image(captcha_text, font):
+    """
+    绘制验证码图片
+
+    参数:
+        captcha_text: 验证码文本
+        font: 字体对象
+
+    返回:
+        bytes: PNG图片数据
+    """
+    width, height = CAPTCHA_WIDTH, CAPTCHA_HEIGHT
+    image = Image.new('RGB', (width, height), color=(255, 255, 255))
+    draw = ImageDraw.Draw(image)
+
+    # 在图片上绘制验证码
+    # 使用textbbox替代textsize（Pillow 10+版本不再支持textsize）
+    bbox = draw.textbbox((0, 0), captcha_text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    x = (width - text_width) // 2
+    y = (height - text_height) // 2
+    draw.text((x, y), captcha_text, font=font, fill=(0, 0, 0))
+
+    # 添加干扰线
+    for _ in range(5):
+        x1 = random.randint(0, width)
+        y1 = random.randint(0, height)
+        x2 = random.randint(0, width)
+        y2 = random.randint(0, height)
+        draw.line([(x1, y1), (x2, y2)], fill=(0, 0, 0), width=1)
+
+    # 添加干扰点
+    for _ in range(20):
+        x = random.randint(0, width)
+        y = random.randint(0, height)
+        draw.point((x, y), fill=(0, 0, 0))
+
+    # 将图片转换为字节流
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+
+class CaptchaPool:
+    """
+    预绘制验证码的环形缓冲区，每张验证码只会被取出一次
+
+    参数:
+        size: 缓冲区容量
+        refill_interval: 补充线程的检查间隔（秒）；剩余数量低于一半时会被立即唤醒
+        font_path: 字体文件路径（可选）
+    """
+
+    def __init__(self, size=256, refill_interval=1.0, font_path=None):
+        self.size = max(1, size)
+        self.refill_interval = refill_interval
+        self.font = load_captcha_font(font_path)
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pooled = 0
+        self._inline = 0
+
+    def _render(self):
+        captcha_text = random_captcha_text()
+        return captcha_text, render_captcha_image(captcha_text, self.font)
+
+    def _ensure_started(self):
+        """首次使用时（以及fork出的子进程中）启动补充线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refill_loop, name='captcha-refill', daemon=True)
+                self._thread.start()
+
+    def _refill_loop(self):
+        while True:
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+            try:
+                while len(self._items) < self.size:
+                    item = self._render()
+                    with self._lock:
+                        self._items.append(item)
+            except Exception as e:
+                logger.error(f'补充验证码图片失败: {e}')
+
+    def pop(self):
+        """
+        取出一张验证码；缓冲区为空时当场绘制
+
+        返回:
+            tuple: (验证码文本, PNG图片数据)
+        """
+        self._ensure_started()
+        with self._lock:
+            item = self._items.popleft() if self._items else None
+            remaining = len(self._items)
+            if item is None:
+                self._inline += 1
+            else:
+                self._pooled += 1
+        if remaining < self.size // 2:
+            self._wake.set()
+        if item is None:
+            item = self._render()
+        return item
+
+    def stats(self):
+        """获取缓冲区统计信息"""
+        with self._lock:
+            return {
+                'available': len(self._items),
+                'size': self.size,
+                'served_from_pool': self._pooled,
+                'rendered_inline': self._inline,
+            }
+
+
+class CaptchaTokens:
+    """
+    无状态验证码令牌：答案不保存在服务端，而是与随机nonce、过期时间一起做HMAC签名后随图片下发，
+    登录时用提交的答案重新计算签名进行比对；已校验过的nonce记录在进程内缓存中防止重放
+
+    令牌格式: <nonce>.<过期时间戳>.<签发签名>.<答案签名>
+    签发签名证明令牌由本服务签发（伪造的令牌不会进入重放缓存），答案签名绑定验证码答案
+
+    参数:
+        secret_key: 签名密钥（应用的SECRET_KEY）
+        ttl: 令牌有效期（秒）
+        replay_cache_size: 重放缓存最多记录的nonce数
+    """
+
+    def __init__(self, secret_key, ttl=300, replay_cache_size=100000):
+        # 从应用密钥派生验证码专用的签名密钥
+        key = secret_key.encode('utf-8') if isinstance(secret_key, str) else secret_key
+        self._key = hmac.new(key, b'captcha-token', hashlib.sha256).digest()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._used = LRUCache(max_entries=replay_cache_size, ttl=ttl)
+
+    def _sign(self, *parts):
+        message = '.'.join(str(part) for part in parts).encode('utf-8')
+        digest = hmac.new(self._key, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:12]).decode('ascii')
+
+    def issue(self, answer):
+        """
+        签发验证码令牌
+
+        参数:
+            answer: 验证码文本
+
+        返回:
+            str: 令牌
+        """
+        nonce = secrets.token_urlsafe(12)
+        expires_at = int(time.time()) + self.ttl
+        issued = self._sign('issue', nonce, expires_at)
+        answered = self._sign('answer', nonce, expires_at, answer.upper())
+        return f'{nonce}.{expires_at}.{issued}.{answered}'
+
+    def verify(self, token, answer):
+        """
+        校验验证码令牌；每个令牌只能校验一次（无论答案是否正确），防止重放和对同一令牌穷举答案
+
+        参数:
+            token: 令牌
+            answer: 用户提交的验证码
+
+        返回:
+            bool: 验证码是否正确
+        """
+        if not token or not answer:
+            return False
+        try:
+            nonce, expires_at, issued, answered = token.split('.')
+            expires_at = int(expires_at)
+        except ValueError:
+            return False
+        if expires_at <= time.time():
+            return False
+        if not hmac.compare_digest(issued, self._sign('issue', nonce, expires_at)):
+            return False
+        # 检查并标记nonce必须是原子操作，否则并发请求可以重复使用同一个令牌
+        with self._lock:
+            if self._used.get(nonce) is not None:
+                return False
+            self._used.set(nonce, True, ttl=max(1, expires_at - time.time()))
+        return hmac.compare_digest(answered, self._sign('answer', nonce, expires_at, answer.upper()))
@@ -0,0 +1,180 @@
+# 数据库查询指标模块
+# 按SQL指纹（去掉参数和字面量后的语句）统计延迟直方图和行数，
+# 超过阈值的查询写入单独的慢查询日志
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+
+from flask import has_request_context, request
+
+# 延迟直方图的桶上界（毫秒），最后一个桶收集所有更慢的查询
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# 慢查询日志记录器（处理器在app.setup_logging中配置）
+slow_query_logger = logging.getLogger('slow_query')
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST_RE = re.compile(r'(\(\?\+?\))(?:\s*,\s*\(\?\+?\))+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(query):
+    """
+    将SQL语句规范化为指纹：字面量和占位符替换为?，IN列表和多行VALUES折叠，空白压缩
+
+    参数:
+        query: SQL语句
+
+    返回:
+        str: 规范化后的指纹
+    """
+    fp = _STRING_RE.sub('?', query)
+    fp = fp.replace('%s', '?')
+    fp = _NUMBER_RE.sub('?', fp)
+    fp = _WHITESPACE_RE.sub(' ', fp).strip()
+    fp = _PLACEHOLDER_LIST_RE.sub('(?+)', fp)
+    fp = _VALUES_LIST_RE.sub(r'\1+', fp)
+    return fp
+
+
+class LatencyHistogram:
+    """延迟直方图（单个SQL指纹、路由或其他操作的统计数据）"""
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'rows', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows, error):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.rows += rows
+        if error:
+            self.errors += 1
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, q):
+        """根据直方图估算分位数（返回所在桶的上界，毫秒）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return float(LATENCY_BUCKETS_MS[index])
+                return round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'rows': self.rows,
+            'avg_rows': round(self.rows / self.count, 2) if self.count else 0.0,
+            'buckets': {
+                (f'le_{bound}' if i < len(LATENCY_BUCKETS_MS) else 'inf'): n
+                for i, (bound, n) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.buckets))
+                if n
+            },
+        }
+
+
+class QueryMetrics:
+    """
+    线程安全的查询指标收集器
+
+    参数:
+        slow_threshold_ms: 慢查询阈值（毫秒），为None或0时不记录慢查询日志
+    """
+
+    def __init__(self, slow_threshold_ms=200):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._by_fingerprint = {}
+        self._by_route = {}
+        self._started_at = time.time()
+
+    def record(self, query, elapsed, rows=0, params=None, error=False):
+        """
+        记录一次查询
+
+        参数:
+            query: SQL语句
+            elapsed: 耗时（秒）
+            rows: 返回或影响的行数
+            params: 查询参数（慢查询日志只记录参数个数，参数值可能包含密码哈希、个人信息等，不写入日志）
+            error: 查询是否出错
+        """
+        elapsed_ms = elapsed * 1000
+        fp = fingerprint(query)
+        route = (request.endpoint or request.path) if has_request_context() else '<background>'
+        with self._lock:
+            stats = self._by_fingerprint.get(fp)
+            if stats is None:
+                stats = self._by_fingerprint[fp] = LatencyHistogram()
+            stats.add(elapsed_ms, rows, error)
+            route_stats = self._by_route.get(route)
+            if route_stats is None:
+                route_stats = self._by_route[route] = LatencyHistogram()
+            route_stats.add(elapsed_ms, rows, error)
+
+        if self.slow_threshold_ms and elapsed_ms >= self.slow_threshold_ms:
+            slow_query_logger.warning(
+                '慢查询 %.1fms rows=%s route=%s fingerprint=%s params=%d',
+                elapsed_ms, rows, route, fp, len(params) if params else 0
+            )
+
+    def snapshot(self, limit=50):
+        """
+        获取指标快照，按总耗时降序排列
+
+        参数:
+            limit: 返回的指纹数量上限
+
+        返回:
+            dict: 包含按指纹和按路由的统计
+        """
+        with self._lock:
+            queries = [(fp, stats.to_dict()) for fp, stats in self._by_fingerprint.items()]
+            routes = [(route, stats.to_dict()) for route, stats in self._by_route.items()]
+        queries.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        routes.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        total_ms = sum(stats['total_ms'] for _, stats in queries)
+        return {
+            'since': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started_at)),
+            'slow_threshold_ms': self.slow_threshold_ms,
+            'total_queries': sum(stats['count'] for _, stats in queries),
+            'total_ms': round(total_ms, 3),
+            'queries': [
+                {'fingerprint': fp, 'share': round(stats['total_ms'] / total_ms, 4) if total_ms else 0.0, **stats}
+                for fp, stats in queries[:limit]
+            ],
+            'routes': [{'route': route, **stats} for route, stats in routes],
+        }
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self._by_fingerprint.clear()
+            self._by_route.clear()
+            self._started_at = time.time()
@@ -0,0 +1,605 @@
+# MySQL连接池模块
+# 替代flask_mysqldb的“每个应用上下文新建一个连接”模式，复用已建立的连接，
+# 避免每个请求都要经历TCP握手和MySQL认证
+import time
+import threading
+from collections import deque
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import g, has_app_context
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内未能从连接池借出连接"""
+    pass
+
+
+class _PooledConnection:
+    """
+    连接池中的连接记录
+
+    属性:
+        conn: MySQLdb连接对象
+        created_at: 连接创建时间（用于按存活时间回收）
+        last_used: 最近一次归还时间（用于空闲回收和借出健康检查）
+    """
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    线程安全的MySQL连接池
+
+    参数:
+        connect_kwargs: 传给MySQLdb.connect的连接参数
+        min_size: 连接池保持的最少连接数
+        max_size: 连接池允许的最多连接数
+        timeout: 借出连接时的最长等待时间（秒）
+        recycle: 连接最长存活时间（秒），超过后在借出/归还时关闭重建
+        idle_timeout: 空闲连接超过该时间（秒）会被回收（保留min_size个）
+        ping_interval: 空闲超过该时间（秒）的连接在借出时先做ping健康检查
+        name: 连接池名称（用于日志和统计）
+    """
+
+    def __init__(self, connect_kwargs, min_size=2, max_size=20, timeout=5.0,
+                 recycle=3600, idle_timeout=300, ping_interval=30, name='primary'):
+        if max_size < 1:
+            raise ValueError('max_size必须大于0')
+        self.connect_kwargs = dict(connect_kwargs)
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.name = name
+
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        # 统计信息
+        self._acquire_count = 0
+        self._timeout_count = 0
+        self._created_count = 0
+        self._discarded_count = 0
+        self._ping_failures = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        """新建一个物理连接"""
+        record = _PooledConnection(MySQLdb.connect(**self.connect_kwargs))
+        with self._cond:
+            self._created_count += 1
+        return record
+
+    def _close_record(self, record):
+        """关闭物理连接，忽略关闭时的异常"""
+        try:
+            record.conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, record, now):
+        """判断连接是否超过最长存活时间"""
+        return self.recycle and now - record.created_at > self.recycle
+
+    def _reap_idle(self, now):
+        """
+        回收空闲过久的连接（调用方需持有锁）
+
+        返回:
+            需要在锁外关闭的连接记录列表
+        """
+        reaped = []
+        # 队列左侧是最久未使用的连接
+        while self._idle and self._size > self.min_size:
+            record = self._idle[0]
+            if now - record.last_used <= self.idle_timeout and not self._is_expired(record, now):
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._discarded_count += 1
+            reaped.append(record)
+        return reaped
+
+    def fill(self):
+        """预先建立min_size个连接"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                record = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(record)
+                self._cond.notify()
+
+    def acquire(self):
+        """
+        从连接池借出一个连接
+
+        返回:
+            连接记录（_PooledConnection），通过record.conn访问MySQLdb连接
+
+        异常:
+            PoolTimeoutError: 在timeout秒内没有可用连接
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            record = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError(f'连接池{self.name}已关闭')
+                reaped = self._reap_idle(start)
+                while True:
+                    if self._idle:
+                        # 后进先出，优先复用最近使用过的“热”连接
+                        record = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeout_count += 1
+                        raise PoolTimeoutError(
+                            f'连接池{self.name}借出连接超时（{self.timeout}秒，'
+                            f'当前{self._in_use}/{self.max_size}个连接在使用中）')
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                self._in_use += 1
+
+            for old in reaped:
+                self._close_record(old)
+
+            if create:
+                try:
+                    record = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                record = self._check_on_borrow(record)
+                if record is None:
+                    # 健康检查失败的连接已丢弃，重新借出
+                    continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._acquire_count += 1
+                self._total_wait += waited
+                if waited > self._max_wait:
+                    self._max_wait = waited
+            return record
+
+    def _check_on_borrow(self, record):
+        """
+        借出前的健康检查：超过存活时间的连接直接重建，空闲较久的连接先ping
+
+        返回:
+            可用的连接记录；如果连接不可用且重建失败则返回None
+        """
+        now = time.monotonic()
+        if self._is_expired(record, now):
+            self._close_record(record)
+            with self._cond:
+                self._discarded_count += 1
+            try:
+                return self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+        if self.ping_interval is not None and now - record.last_used > self.ping_interval:
+            try:
+                record.conn.ping()
+            except Exception:
+                self._close_record(record)
+                with self._cond:
+                    self._ping_failures += 1
+                    self._discarded_count += 1
+                self._release_slot()
+                return None
+        return record
+
+    def _release_slot(self):
+        """释放一个已占用的连接名额"""
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, record, discard=False):
+        """
+        归还连接到连接池
+
+        参数:
+            record: acquire返回的连接记录
+            discard: 是否直接丢弃该连接（例如连接已出错）
+        """
+        if not discard:
+            try:
+                # 非自动提交模式下回滚未结束的事务，避免把事务状态和旧快照带给下一个使用者
+                # （自动提交模式下显式事务由utils.transaction负责提交或回滚）
+                if not record.conn.get_autocommit():
+                    record.conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        if not discard and self._is_expired(record, now):
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self._discarded_count += 1
+            else:
+                record.last_used = now
+                self._idle.append(record)
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_record(record)
+
+    def close(self):
+        """关闭连接池及其中所有空闲连接"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for record in idle:
+            self._close_record(record)
+
+    def stats(self):
+        """
+        获取连接池统计信息
+
+        返回:
+            dict: 包含连接数、使用中、空闲、等待者及等待时间等统计
+        """
+        with self._cond:
+            acquires = self._acquire_count
+            return {
+                'name': self.name,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'acquires': acquires,
+                'timeouts': self._timeout_count,
+                'created': self._created_count,
+                'discarded': self._discarded_count,
+                'ping_failures': self._ping_failures,
+                'avg_wait_ms': round(self._total_wait * 1000 / acquires, 3) if acquires else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+            }
+
+
+def build_connect_kwargs(config, host=None, port=None):
+    """
+    根据Flask配置构造MySQLdb.connect的参数
+
+    参数:
+        config: Flask配置对象
+        host: 覆盖配置中的主机（可选）
+        port: 覆盖配置中的端口（可选）
+    """
+    kwargs = {
+        'host': host or config.get('MYSQL_HOST', 'localhost'),
+        'port': int(port or config.get('MYSQL_PORT', 3306)),
+        'user': config.get('MYSQL_USER', 'root'),
+        'passwd': config.get('MYSQL_PASSWORD', ''),
+        'db': config.get('MYSQL_DB'),
+        'charset': config.get('MYSQL_CHARSET', 'utf8mb4'),
+        'connect_timeout': config.get('MYSQL_CONNECT_TIMEOUT', 10),
+        # 默认自动提交：单条读写语句各自即为一个事务，多语句事务通过utils.transaction显式开启
+        'autocommit': config.get('MYSQL_AUTOCOMMIT', True),
+    }
+    cursorclass = config.get('MYSQL_CURSORCLASS')
+    if cursorclass:
+        kwargs['cursorclass'] = getattr(MySQLdb.cursors, cursorclass)
+    return kwargs
+
+
+class Replica:
+    """
+    从库状态：连接池、健康状况和复制延迟
+
+    参数:
+        pool: 从库连接池
+        max_lag: 允许的最大复制延迟（秒），超过则暂不向该从库路由读请求
+        check_interval: 健康检查/延迟检查间隔（秒）
+    """
+
+    def __init__(self, pool, max_lag=5, check_interval=10):
+        self.pool = pool
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # 第一次检查完成之前不向从库路由读请求
+        self.healthy = False
+        self.lag = None
+        self.last_error = None
+        self._checked_at = 0.0
+        self._checking = False
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        """
+        判断从库当前是否可用于读请求，直接返回上一次检查的结果，不阻塞请求；
+        检查间隔到期时在后台线程中做一次延迟检查（同一时刻只有一个检查在进行）
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if not self._checking and now - self._checked_at >= self.check_interval:
+                    self._checking = True
+                    threading.Thread(target=self._check_in_background, name='replica-check', daemon=True).start()
+        return self.healthy
+
+    def _check_in_background(self):
+        try:
+            self._check()
+        finally:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._checking = False
+
+    def _check(self):
+        """检查从库连通性和复制延迟"""
+        try:
+            record = self.pool.acquire()
+        except Exception as e:
+            self.healthy = False
+            self.last_error = str(e)
+            return
+        discard = False
+        try:
+            cur = record.conn.cursor(MySQLdb.cursors.DictCursor)
+            try:
+                try:
+                    cur.execute('SHOW REPLICA STATUS')
+                except MySQLdb.ProgrammingError:
+                    # MySQL 8.0.22之前的版本只支持旧语法
+                    cur.execute('SHOW SLAVE STATUS')
+                status = cur.fetchone()
+            finally:
+                cur.close()
+            if not status:
+                # 未配置复制（例如用于测试的独立实例），视为无延迟
+                self.lag = 0
+            else:
+                lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                # 复制线程停止时延迟为NULL
+                self.lag = int(lag) if lag is not None else None
+            self.healthy = self.lag is not None and self.lag <= self.max_lag
+            self.last_error = None if self.healthy else f'复制延迟过大: {self.lag}'
+        except Exception as e:
+            discard = True
+            self.healthy = False
+            self.last_error = str(e)
+        finally:
+            self.pool.release(record, discard=discard)
+
+    def mark_down(self, error=None):
+        """标记从库不可用，直到下一次检查"""
+        self.healthy = False
+        self.last_error = str(error) if error else self.last_error
+        self._checked_at = time.monotonic()
+
+    def stats(self):
+        stats = self.pool.stats()
+        stats.update({
+            'healthy': self.healthy,
+            'lag': self.lag,
+            'last_error': self.last_error,
+        })
+        return stats
+
+
+def parse_hosts(hosts):
+    """
+    解析 host:port 形式的主机列表
+
+    参数:
+        hosts: 列表或逗号分隔的字符串
+
+    返回:
+        list: (host, port) 元组列表，未指定端口时port为None
+    """
+    if isinstance(hosts, str):
+        hosts = hosts.split(',')
+    parsed = []
+    for item in hosts or []:
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':') if ':' in item else (item, '', '')
+        parsed.append((host, int(port) if port else None))
+    return parsed
+
+
+class MySQLPool:
+    """
+    Flask集成的连接池，接口与flask_mysqldb.MySQL保持一致：
+    通过 mysql.connection 获取当前应用上下文的主库连接，应用上下文结束时自动归还
+
+    配置了从库（MYSQL_REPLICAS）时，mysql.read_connection 将只读查询路由到健康的从库；
+    当前请求发生过写操作后，后续读取都固定走主库（读己之写）
+    """
+
+    def __init__(self, app=None):
+        self.pool = None
+        self.replicas = []
+        self._next_replica = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        pool_options = dict(
+            min_size=config.get('MYSQL_POOL_MIN_SIZE', 2),
+            max_size=config.get('MYSQL_POOL_MAX_SIZE', 20),
+            timeout=config.get('MYSQL_POOL_TIMEOUT', 5.0),
+            recycle=config.get('MYSQL_POOL_RECYCLE', 3600),
+            idle_timeout=config.get('MYSQL_POOL_IDLE_TIMEOUT', 300),
+            ping_interval=config.get('MYSQL_POOL_PING_INTERVAL', 30),
+        )
+        self.pool = ConnectionPool(build_connect_kwargs(config), **pool_options)
+        for host, port in parse_hosts(config.get('MYSQL_REPLICAS')):
+            replica_pool = ConnectionPool(
+                build_connect_kwargs(config, host=host, port=port),
+                name=f'replica:{host}:{port or config.get("MYSQL_PORT", 3306)}',
+                **pool_options
+            )
+            self.replicas.append(Replica(
+                replica_pool,
+                max_lag=config.get('MYSQL_REPLICA_MAX_LAG', 5),
+                check_interval=config.get('MYSQL_REPLICA_CHECK_INTERVAL', 10),
+            ))
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        """获取当前应用上下文绑定的主库连接（首次访问时从连接池借出）"""
+        record = g.get('_mysql_pool_record')
+        if record is None:
+            record = self.pool.acquire()
+            g._mysql_pool_record = record
+        return record.conn
+
+    @property
+    def read_connection(self):
+        """
+        获取用于只读查询的连接：优先使用从库，
+        没有可用从库或当前请求已写过主库时返回主库连接
+        """
+        record = g.get('_mysql_replica_record')
+        if record is not None:
+            return record.conn
+        if not self.replicas or g.get('_mysql_primary_sticky'):
+            return self.connection
+        replica = self._choose_replica()
+        if replica is None:
+            return self.connection
+        try:
+            record = replica.pool.acquire()
+        except Exception as e:
+            replica.mark_down(e)
+            return self.connection
+        g._mysql_replica_record = record
+        g._mysql_replica = replica
+        return record.conn
+
+    def _choose_replica(self):
+        """轮询选择一个可用的从库，全部不可用时返回None"""
+        count = len(self.replicas)
+        start = self._next_replica
+        for offset in range(count):
+            replica = self.replicas[(start + offset) % count]
+            if replica.is_available():
+                self._next_replica = (start + offset + 1) % count
+                return replica
+        return None
+
+    def acquire_dedicated(self, read_only=True):
+        """
+        借出一个不绑定到应用上下文的独立连接（用于流式查询等需要长时间独占连接的场景），
+        使用完毕后必须调用 pool.release(record) 归还
+
+        参数:
+            read_only: 是否只读，只读时优先使用从库
+
+        返回:
+            tuple: (连接池, 连接记录)
+        """
+        sticky = has_app_context() and g.get('_mysql_primary_sticky')
+        if read_only and self.replicas and not sticky:
+            replica = self._choose_replica()
+            if replica is not None:
+                try:
+                    return replica.pool, replica.pool.acquire()
+                except Exception as e:
+                    replica.mark_down(e)
+        return self.pool, self.pool.acquire()
+
+    def is_replica_connection(self, conn):
+        """判断连接是否是当前应用上下文借出的从库连接"""
+        record = g.get('_mysql_replica_record')
+        return record is not None and record.conn is conn
+
+    def mark_primary_sticky(self):
+        """标记当前请求已写过主库，之后的读取都走主库以保证读到自己的写入"""
+        g._mysql_primary_sticky = True
+        self._release_replica()
+
+    def _release_replica(self, discard=False):
+        record = g.pop('_mysql_replica_record', None)
+        replica = g.pop('_mysql_replica', None)
+        if record is not None:
+            replica.pool.release(record, discard=discard)
+        return replica
+
+    def discard_connection(self, conn=None, error=None):
+        """
+        丢弃当前应用上下文的连接（连接出错时使用）
+
+        参数:
+            conn: 要丢弃的连接，是从库连接时同时把该从库标记为不可用；为None时丢弃主库连接
+            error: 导致丢弃的异常（记录到从库状态中）
+        """
+        if conn is not None and self.is_replica_connection(conn):
+            replica = self._release_replica(discard=True)
+            replica.mark_down(error)
+            return
+        record = g.get('_mysql_pool_record')
+        if record is None or (conn is not None and record.conn is not conn):
+            # 连接已被归还或丢弃
+            return
+        g.pop('_mysql_pool_record')
+        self.pool.release(record, discard=True)
+
+    def teardown(self, exception):
+        self._release_replica()
+        g.pop('_mysql_primary_sticky', None)
+        record = g.pop('_mysql_pool_record', None)
+        if record is not None:
+            self.pool.release(record)
+
+    def stats(self):
+        """获取连接池统计信息（包含各从库的状态）"""
+        stats = self.pool.stats()
+        if self.replicas:
+            stats['replicas'] = [replica.stats() for replica in self.replicas]
+        return stats
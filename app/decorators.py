@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import session, redirect, url_for, request
-from app.utils import execute_db_query, make_json_response
+from app import permission_resolver
+from app.utils import make_json_response
 
 # 登录检查装饰器
 def is_logged_in(f):
@@ -24,9 +25,8 @@ def requires_role(role):
         @wraps(f)
         def wrap(*args, **kwargs):
             if 'logged_in' in session:
-                # 获取当前用户信息
-                user = execute_db_query('SELECT * FROM users WHERE username = %s', [session['username']], fetch_one=True)
-                if user and user['role'] == role:
+                # 使用session中的授权声明（版本戳失效时自动从数据库刷新）
+                if permission_resolver.session_claims(session)['role'] == role:
                     return f(*args, **kwargs)
                 else:
                     # 如果是API请求，返回JSON响应
@@ -49,22 +49,9 @@ def requires_permission(permission):
         @wraps(f)
         def wrap(*args, **kwargs):
             if 'logged_in' in session:
-                # 获取当前用户信息
-                user = execute_db_query('SELECT * FROM users WHERE username = %s', [session['username']], fetch_one=True)
-                if user:
-                    # 只检查角色权限
-                    role_permissions = []
-                    if user['role']:
-                        role = execute_db_query('SELECT * FROM roles WHERE role = %s', [user['role']], fetch_one=True)
-                        if role:
-                            role_permissions = role.get('permissions', '[]')
-                            if isinstance(role_permissions, str):
-                                import json
-                                role_permissions = json.loads(role_permissions)
-                    
-                    # 检查是否有需要的权限
-                    if permission in set(role_permissions):
-                        return f(*args, **kwargs)
+                # 只检查角色权限（来自session中的授权声明，版本戳失效时自动从数据库刷新）
+                if permission in permission_resolver.session_claims(session)['permissions']:
+                    return f(*args, **kwargs)
                 
                 # 如果是API请求，返回JSON响应
                 if request.path.startswith('/api/'):
@@ -0,0 +1,192 @@
+# 密码哈希进程池模块
+# 密码哈希和校验是CPU密集操作，放到独立的进程池中执行，不占用处理请求的线程；
+# 排队数量有上限，超过上限时立即拒绝（接口返回503和Retry-After），不让请求无限堆积
+import os
+import math
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from app.db_metrics import LatencyHistogram
+
+
+def _run_batch(func, args_list):
+    """在子进程中依次执行一批任务（批量接口使用，减少进程间通信次数）"""
+    return [func(*args) for args in args_list]
+
+
+class HashPoolBusyError(Exception):
+    """
+    哈希任务排队已满
+
+    属性:
+        retry_after: 建议客户端重试的等待时间（秒）
+    """
+
+    def __init__(self, retry_after=1):
+        super().__init__('密码哈希任务繁忙')
+        self.retry_after = retry_after
+
+
+class HashPool:
+    """
+    有界的密码哈希进程池
+
+    参数:
+        workers: 工作进程数，为None或0时使用CPU核数
+        queue_size: 所有工作进程都在忙时最多排队等待的任务数
+        bulk_workers: 批量任务（map）同时提交的子任务数上限，为None或0时使用工作进程数的一半，
+                      其余进程留给登录等单个任务
+    """
+
+    def __init__(self, workers=None, queue_size=32, bulk_workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.bulk_workers = min(bulk_workers or max(1, self.workers // 2), self.workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._rejected = 0
+        self._max_pending_seen = 0
+        self._latency = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def start(self):
+        """预先启动工作进程（应用启动时调用，避免第一批登录请求承担进程启动开销）"""
+        self._get_executor().submit(os.getpid).result()
+
+    def _retry_after(self):
+        """根据平均耗时估算排队任务全部完成所需的时间（秒）"""
+        count = sum(stats.count for stats in self._latency.values())
+        total_ms = sum(stats.total_ms for stats in self._latency.values())
+        avg_seconds = total_ms / count / 1000 if count else 0.5
+        return max(1, math.ceil(avg_seconds * self._pending / self.workers))
+
+    def run(self, name, func, *args):
+        """
+        在进程池中执行任务并等待结果
+
+        参数:
+            name: 操作名称（用于统计，例如hash、verify）
+            func: 可在子进程中执行的函数（必须能被pickle，例如passlib的类方法）
+            args: 函数参数
+
+        返回:
+            函数返回值
+
+        异常:
+            HashPoolBusyError: 排队任务数已达上限
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise HashPoolBusyError(self._retry_after())
+            self._pending += 1
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+
+        start = time.perf_counter()
+        error = False
+        try:
+            return self._get_executor().submit(func, *args).result()
+        except BrokenProcessPool:
+            # 工作进程异常退出后进程池不可再用，下次调用时重建
+            error = True
+            with self._lock:
+                self._executor = None
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._finish(name, start, 1, error)
+
+    def _finish(self, name, start, count, error):
+        """记录一个任务结束（释放排队名额并统计耗时）"""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._pending -= 1
+            stats = self._latency.get(name)
+            if stats is None:
+                stats = self._latency[name] = LatencyHistogram()
+            stats.add(elapsed_ms, count, error)
+
+    def map(self, name, func, args_seq, batch_size=4, max_in_flight=None):
+        """
+        在进程池中批量执行任务（例如批量导入用户时计算密码哈希），结果顺序与参数顺序一致
+
+        每个子任务处理batch_size个参数，同时提交的子任务数不超过bulk_workers，
+        并且与run()一样计入排队上限：排队已满时等待自己已提交的子任务完成后再提交，
+        没有已提交的子任务时拒绝，批量任务不会占满进程池和排队名额
+
+        参数:
+            name: 操作名称（用于统计）
+            func: 可在子进程中执行的函数
+            args_seq: 参数元组列表
+            batch_size: 每个子任务处理的参数个数
+            max_in_flight: 同时提交的子任务数上限，默认为bulk_workers
+
+        返回:
+            list: 函数返回值列表
+
+        异常:
+            HashPoolBusyError: 排队任务数已达上限且没有已提交的子任务
+        """
+        max_in_flight = max_in_flight or self.bulk_workers
+        batches = [args_seq[i:i + batch_size] for i in range(0, len(args_seq), batch_size)]
+        results = [None] * len(batches)
+        in_flight = {}
+        next_batch = 0
+        try:
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and len(in_flight) < max_in_flight:
+                    with self._lock:
+                        if self._pending >= self.workers + self.queue_size:
+                            if in_flight:
+                                break
+                            self._rejected += 1
+                            raise HashPoolBusyError(self._retry_after())
+                        self._pending += 1
+                        self._max_pending_seen = max(self._max_pending_seen, self._pending)
+                    start = time.perf_counter()
+                    try:
+                        future = self._get_executor().submit(_run_batch, func, batches[next_batch])
+                    except Exception:
+                        self._finish(name, start, len(batches[next_batch]), True)
+                        raise
+                    in_flight[future] = (next_batch, start)
+                    next_batch += 1
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, start = in_flight.pop(future)
+                    error = future.exception() is not None
+                    self._finish(name, start, len(batches[index]), error)
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        with self._lock:
+                            self._executor = None
+                    results[index] = future.result()
+        finally:
+            # 出错时取消尚未开始的子任务并释放名额
+            for future, (index, start) in in_flight.items():
+                future.cancel()
+                self._finish(name, start, len(batches[index]), True)
+        return [result for batch in results for result in batch]
+
+    def stats(self):
+        """获取进程池统计信息（延迟包含排队等待时间）"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'bulk_workers': self.bulk_workers,
+                'in_flight': min(self._pending, self.workers),
+                'queue_depth': max(0, self._pending - self.workers),
+                'max_pending': self._max_pending_seen,
+                'rejected': self._rejected,
+                'latency': {name: stats.to_dict() for name, stats in self._latency.items()},
+            }
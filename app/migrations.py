@@ -0,0 +1,334 @@
+# 数据库迁移模块
+# 用schema_version表记录已执行的迁移版本，启动时只做一次版本查询，仅执行未应用的迁移步骤，
+# 取代init_db中每次启动都逐个SHOW COLUMNS/SHOW INDEX探测表结构的做法
+#
+# 命令行（与提供服务分开执行）:
+#     flask --app app.py db status     查看当前版本和待执行的迁移
+#     flask --app app.py db upgrade    执行所有待执行的迁移
+import click
+import MySQLdb
+import MySQLdb.cursors
+
+from app import app, mysql, permission_resolver
+
+# 迁移锁名称，多个进程同时启动时只有一个进程执行迁移
+MIGRATION_LOCK_NAME = 'login_system_schema_migration'
+# 等待迁移锁的最长时间（秒）
+MIGRATION_LOCK_TIMEOUT = 60
+
+# MySQL错误码：表不存在
+_ER_NO_SUCH_TABLE = 1146
+
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """
+    注册迁移步骤的装饰器，迁移按版本号顺序执行，每个步骤都必须是幂等的
+    （中途失败后重新执行不会出错）
+
+    参数:
+        version: 版本号（正整数，不可重复）
+        description: 迁移说明
+    """
+    def decorator(func):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f'迁移版本号重复: {version}')
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return decorator
+
+
+class _Schema:
+    """
+    当前数据库的表结构快照：一次查询information_schema取得所有列和索引，
+    用于幂等地添加/删除列和索引，不再对每个字段单独执行SHOW COLUMNS/SHOW INDEX
+
+    参数:
+        cur: 游标（元组行）
+    """
+
+    def __init__(self, cur):
+        self.cur = cur
+        cur.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        self.columns = {(table.lower(), column.lower()) for table, column in cur.fetchall()}
+        cur.execute(
+            "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        self.indexes = {(table.lower(), index.lower()) for table, index in cur.fetchall()}
+
+    def has_column(self, table, column):
+        return (table.lower(), column.lower()) in self.columns
+
+    def has_index(self, table, index):
+        return (table.lower(), index.lower()) in self.indexes
+
+    def add_column(self, table, column, definition):
+        """字段不存在时添加"""
+        if not self.has_column(table, column):
+            self.cur.execute(f"ALTER TABLE {table} ADD {column} {definition}")
+            self.columns.add((table.lower(), column.lower()))
+
+    def drop_column(self, table, column):
+        """字段存在时删除"""
+        if self.has_column(table, column):
+            self.cur.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+            self.columns.discard((table.lower(), column.lower()))
+
+    def create_index(self, table, index, columns):
+        """索引不存在时创建"""
+        if not self.has_index(table, index):
+            self.cur.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+            self.indexes.add((table.lower(), index.lower()))
+
+
+@migration(1, '创建用户、权限、角色和审计日志表')
+def _create_tables(cur):
+    # 创建用户表（如果不存在）
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            name VARCHAR(50),
+            email VARCHAR(100),
+            phone VARCHAR(20),
+            gender VARCHAR(10),
+            avatar VARCHAR(255),
+            role VARCHAR(20) DEFAULT '普通用户',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建权限表（如果不存在）
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS role_permissions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            permission VARCHAR(50) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建角色表（如果不存在）
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS roles (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            role VARCHAR(50) UNIQUE NOT NULL,
+            permissions JSON, -- 存储角色拥有的权限列表
+            is_in_use BOOLEAN DEFAULT FALSE, -- 角色是否在使用中
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建审计日志表（如果不存在）
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT,
+            username VARCHAR(50),
+            action VARCHAR(50) NOT NULL,
+            target VARCHAR(50),
+            details JSON,
+            ip_address VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 早期版本创建的表可能缺少字段或带有已废弃的字段，统一修正
+    schema = _Schema(cur)
+    schema.add_column('users', 'email', 'VARCHAR(100)')
+    schema.add_column('users', 'phone', 'VARCHAR(20)')
+    schema.add_column('users', 'gender', 'VARCHAR(10)')
+    schema.drop_column('users', 'is_star')
+    schema.add_column('users', 'created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    schema.add_column('users', 'name', 'VARCHAR(50)')
+    schema.add_column('users', 'avatar', 'VARCHAR(255)')
+    schema.add_column('users', 'role', "VARCHAR(20) DEFAULT '普通用户'")
+    schema.drop_column('users', 'permissions')
+    schema.drop_column('roles', 'description')
+    schema.add_column('roles', 'permissions', 'JSON')
+    schema.drop_column('roles', 'user_count')
+
+
+@migration(2, '添加查询索引')
+def _create_indexes(cur):
+    schema = _Schema(cur)
+    schema.create_index('users', 'idx_users_username', 'username')
+    schema.create_index('users', 'idx_users_role', 'role')
+    # 用于按创建时间排序
+    schema.create_index('users', 'idx_users_created_at', 'created_at')
+    # role字段的唯一约束（索引名为role）已经可以用于查询，缺失时才单独建索引
+    if not schema.has_index('roles', 'role'):
+        schema.create_index('roles', 'idx_roles_role', 'role')
+    schema.create_index('audit_logs', 'idx_audit_logs_created_at', 'created_at')
+    schema.create_index('audit_logs', 'idx_audit_logs_username', 'username')
+    schema.create_index('audit_logs', 'idx_audit_logs_action', 'action')
+    # 用于按用户名/操作类型查询并按时间排序
+    schema.create_index('audit_logs', 'idx_audit_logs_username_created_at', 'username, created_at DESC')
+    schema.create_index('audit_logs', 'idx_audit_logs_action_created_at', 'action, created_at DESC')
+
+
+@migration(3, '初始化默认权限和角色')
+def _seed_roles(cur):
+    cur.execute(
+        "INSERT IGNORE INTO role_permissions (permission) VALUES (%s), (%s), (%s), (%s)",
+        ('个人信息管理', '用户管理', '角色管理', '审计日志管理')
+    )
+    cur.execute(
+        "INSERT INTO roles (role, permissions) VALUES (%s, %s), (%s, %s) "
+        "ON DUPLICATE KEY UPDATE permissions=VALUES(permissions)",
+        ('管理员', '["个人信息管理", "用户管理", "角色管理", "审计日志管理"]',
+         '普通用户', '["个人信息管理"]')
+    )
+
+
+@migration(4, '添加用户列表游标分页索引')
+def _create_keyset_indexes(cur):
+    # 用户列表按“排序字段, id”做游标分页，每个可排序字段都需要(字段, id)索引；
+    # InnoDB二级索引末尾自带主键，username/role/created_at已有的单列索引等价于(字段, id)
+    schema = _Schema(cur)
+    for column in ('name', 'email', 'phone', 'gender'):
+        schema.create_index('users', f'idx_users_{column}_id', f'{column}, id')
+    # 按角色筛选后按创建时间排序（用户列表的默认排序）
+    schema.create_index('users', 'idx_users_role_created_at', 'role, created_at, id')
+
+
+@migration(5, '添加用户搜索全文索引')
+def _create_search_index(cur):
+    # 用户名/姓名/邮箱的子串搜索使用ngram分词的全文索引（支持中文，需要MySQL 5.7.6及以上）；
+    # 默认停用词表会使包含停用词的ngram词元不被索引，创建索引时关闭停用词
+    #
+    # 创建失败时迁移失败、不记录版本，下次启动或执行flask db upgrade时重试
+    schema = _Schema(cur)
+    if schema.has_index('users', 'ft_users_search'):
+        return
+    try:
+        cur.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+        cur.execute("ALTER TABLE users ADD FULLTEXT INDEX ft_users_search (username, name, email) WITH PARSER ngram")
+    finally:
+        cur.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+
+
+@migration(6, '同步角色使用状态')
+def _refresh_role_usage(cur):
+    # 原来每次启动都执行一次同步；角色接口现在读取时用EXISTS子查询计算使用状态，不再读取该字段，
+    # 这里只把已有数据同步一次，保持字段与users表一致
+    cur.execute("UPDATE roles r SET is_in_use = EXISTS (SELECT 1 FROM users u WHERE u.role = r.role)")
+
+
+def _current_version(cur):
+    """
+    查询当前数据库版本（schema_version表不存在时返回0）
+
+    返回:
+        int: 已应用的最高迁移版本
+    """
+    try:
+        cur.execute("SELECT MAX(version) FROM schema_version")
+    except MySQLdb.ProgrammingError as e:
+        if e.args and e.args[0] == _ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    row = cur.fetchone()
+    return (row[0] or 0) if row else 0
+
+
+def _ensure_version_table(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def pending_migrations(current_version):
+    """
+    获取待执行的迁移步骤
+
+    参数:
+        current_version: 当前数据库版本
+
+    返回:
+        list: (version, description, func) 列表
+    """
+    return [item for item in MIGRATIONS if item[0] > current_version]
+
+
+def upgrade():
+    """
+    执行所有待执行的迁移。已是最新版本时只执行一次版本查询；
+    有待执行的迁移时先获取MySQL命名锁，防止多个进程同时迁移
+
+    返回:
+        list: 本次执行的迁移版本号列表
+    """
+    conn = mysql.connection
+    cur = conn.cursor(MySQLdb.cursors.Cursor)
+    try:
+        if not pending_migrations(_current_version(cur)):
+            return []
+
+        cur.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+        if cur.fetchone()[0] != 1:
+            raise RuntimeError('等待数据库迁移锁超时')
+        try:
+            _ensure_version_table(cur)
+            # 获取锁期间其他进程可能已经完成了迁移，重新读取版本
+            applied = []
+            for version, description, func in pending_migrations(_current_version(cur)):
+                app.logger.info(f'执行数据库迁移 {version}: {description}')
+                func(cur)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                conn.commit()
+                applied.append(version)
+            if applied:
+                # 迁移可能修改了role_permissions表（权限目录）
+                permission_resolver.invalidate_catalog()
+            return applied
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            cur.fetchone()
+    finally:
+        cur.close()
+
+
+# 命令行入口
+@app.cli.group('db')
+def db_cli():
+    """数据库迁移命令"""
+    pass
+
+
+@db_cli.command('status')
+def status_command():
+    """查看当前数据库版本和待执行的迁移"""
+    cur = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+    try:
+        current = _current_version(cur)
+    finally:
+        cur.close()
+    click.echo(f'当前版本: {current}')
+    pending = pending_migrations(current)
+    if not pending:
+        click.echo('数据库已是最新版本')
+    for version, description, _ in pending:
+        click.echo(f'待执行: {version} {description}')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """执行所有待执行的迁移"""
+    applied = upgrade()
+    if applied:
+        click.echo(f'已执行迁移: {", ".join(str(version) for version in applied)}')
+    else:
+        click.echo('数据库已是最新版本')
@@ -0,0 +1,161 @@
+# 分页模块：键集（游标）分页和列表总数计算
+# OFFSET分页需要扫描并丢弃前面所有的行，页数越深越慢；
+# 游标分页记录上一页最后一行的排序字段值和id，下一页用“排序字段 > 值 OR (排序字段 = 值 AND id > id)”直接定位，
+# 配合(排序字段, id)索引，每页的开销与页数无关
+#
+# 游标对客户端是不透明的字符串（base64编码的JSON），只包含排序方式和定位值，被篡改也只会改变定位位置
+#
+# 列表总数按count参数选择计算方式:
+#     exact     精确COUNT(*)，结果进入查询缓存（COUNT_CACHE_TTL秒），对应表有写操作时失效
+#     estimate  根据表统计信息估算（无筛选条件时取information_schema中的TABLE_ROWS，有条件时取EXPLAIN的估算行数）
+#     none      不计算总数
+# 未指定时，表的估算行数超过COUNT_ESTIMATE_THRESHOLD使用estimate，否则使用exact
+import json
+import base64
+import binascii
+
+from app import app
+from app.utils import execute_db_query
+
+# 支持的总数计算方式
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+
+def encode_cursor(sort_by, sort_order, last_value, last_id):
+    """
+    生成分页游标
+
+    参数:
+        sort_by: 排序字段
+        sort_order: 排序方向（ASC/DESC）
+        last_value: 本页最后一行的排序字段值
+        last_id: 本页最后一行的id
+
+    返回:
+        str: 游标
+    """
+    payload = json.dumps([sort_by, sort_order, last_value, last_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_by, sort_order):
+    """
+    解析分页游标
+
+    参数:
+        cursor: 游标
+        sort_by: 本次请求的排序字段
+        sort_order: 本次请求的排序方向
+
+    返回:
+        tuple: (排序字段值, id)
+
+    异常:
+        ValueError: 游标格式无效，或者与本次请求的排序方式不一致
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort_by, cursor_sort_order, last_value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('无效的分页游标')
+    if cursor_sort_by != sort_by or cursor_sort_order != sort_order:
+        raise ValueError('分页游标与排序方式不一致')
+    if not isinstance(last_id, int) or isinstance(last_value, (list, dict)):
+        raise ValueError('无效的分页游标')
+    return last_value, last_id
+
+
+def seek_condition(column, sort_order, last_value, last_id):
+    """
+    生成定位到游标之后的WHERE条件（ORDER BY column sort_order, id sort_order）
+
+    MySQL中NULL在升序时排在最前、降序时排在最后，条件按此处理排序字段为NULL的行
+
+    参数:
+        column: 排序字段（必须是已校验过的字段名）
+        sort_order: 排序方向（ASC/DESC）
+        last_value: 上一页最后一行的排序字段值
+        last_id: 上一页最后一行的id
+
+    返回:
+        tuple: (条件SQL, 参数列表)
+    """
+    op = '>' if sort_order == 'ASC' else '<'
+    if column == 'id':
+        return f'id {op} %s', [last_id]
+    if last_value is None:
+        if sort_order == 'ASC':
+            return f'(({column} IS NULL AND id > %s) OR {column} IS NOT NULL)', [last_id]
+        return f'({column} IS NULL AND id < %s)', [last_id]
+    condition = f'({column} {op} %s OR ({column} = %s AND id {op} %s)'
+    if sort_order == 'DESC':
+        condition += f' OR {column} IS NULL'
+    return condition + ')', [last_value, last_value, last_id]
+
+
+def parse_count_mode(value, default='auto'):
+    """
+    解析count参数，无效值按未指定处理
+
+    返回:
+        str: exact、estimate、none或auto（由count_rows根据表大小选择）
+    """
+    value = (value or '').lower()
+    return value if value in COUNT_MODES else default
+
+
+def table_rows_estimate(table):
+    """
+    根据表统计信息估算表的行数（InnoDB的统计值是近似值）
+
+    参数:
+        table: 表名（必须是代码中的固定表名）
+
+    返回:
+        int: 估算行数
+    """
+    row = execute_db_query(
+        "SELECT TABLE_ROWS AS table_rows FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        [table], fetch_one=True, cache=app.config.get('COUNT_CACHE_TTL', 10)
+    )
+    return int(row['table_rows'] or 0) if row else 0
+
+
+def _estimate_count(table, where_clause, params):
+    """估算满足条件的行数：无筛选条件时使用表统计信息，否则使用优化器的估算行数"""
+    if not params:
+        return table_rows_estimate(table)
+    row = execute_db_query(
+        f"EXPLAIN SELECT 1 FROM {table} {where_clause}", params,
+        fetch_one=True, cache=app.config.get('COUNT_CACHE_TTL', 10)
+    )
+    if not row:
+        return 0
+    return int((row.get('rows') or 0) * float(row.get('filtered') or 100) / 100)
+
+
+def count_rows(table, where_clause='WHERE 1=1', params=None, mode='auto'):
+    """
+    按指定方式计算列表总数
+
+    参数:
+        table: 表名（必须是代码中的固定表名）
+        where_clause: 查询条件（不含分页部分）
+        params: 条件参数
+        mode: exact、estimate、none或auto
+
+    返回:
+        tuple: (总数, 实际使用的计算方式)；mode为none时总数为None
+    """
+    if mode == 'none':
+        return None, 'none'
+    if mode not in COUNT_MODES:
+        threshold = app.config.get('COUNT_ESTIMATE_THRESHOLD', 1000000)
+        mode = 'estimate' if table_rows_estimate(table) >= threshold else 'exact'
+    if mode == 'estimate':
+        return _estimate_count(table, where_clause, params), 'estimate'
+    row = execute_db_query(
+        f"SELECT COUNT(*) as count FROM {table} {where_clause}", params,
+        fetch_one=True, cache=app.config.get('COUNT_CACHE_TTL', 10)
+    )
+    return row['count'], 'exact'
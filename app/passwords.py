@@ -0,0 +1,192 @@
+# 密码哈希模块
+# 统一封装密码的哈希和校验，在独立的进程池中执行（排队已满时抛出HashPoolBusyError）
+#
+# 哈希轮数（rounds）在每个进程第一次计算或比较哈希时按目标校验耗时校准（不低于passlib默认轮数），
+# 轮数保存在每个哈希值中（$5$rounds=N$...），登录成功时如果已保存哈希的轮数明显低于当前策略，
+# 会用当前策略重新计算哈希；只升不降，不会因为校准结果波动把强度更高的哈希降级
+#
+# 命令行:
+#     flask --app app.py password benchmark    测试不同轮数下单核和整个进程池每秒可完成的校验次数
+import time
+import threading
+from functools import lru_cache
+
+import click
+from passlib.hash import sha256_crypt
+
+from app import app, hash_pool
+
+# 校准时使用的探测轮数
+_CALIBRATION_ROUNDS = 20000
+
+# 当前策略的哈希轮数（None表示尚未校准）
+_policy_rounds = None
+_calibrate_lock = threading.Lock()
+
+
+@lru_cache(maxsize=16)
+def _hasher(rounds):
+    """指定轮数的sha256_crypt哈希器"""
+    return sha256_crypt.using(rounds=rounds)
+
+
+def _hash_with_rounds(password, rounds):
+    """计算指定轮数的密码哈希（在工作进程中执行）"""
+    return _hasher(rounds).hash(password)
+
+
+def _measure_hash(rounds, iterations=3):
+    """测量指定轮数下单次哈希的耗时（秒，取最小值以排除调度干扰，在工作进程中执行）"""
+    hasher = _hasher(rounds)
+    best = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        hasher.hash('calibration')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _rounds_for_target(seconds_per_round, target_ms):
+    """根据单轮耗时计算达到目标耗时所需的轮数（取整到1000并限制在算法允许范围内）"""
+    rounds = int(target_ms / 1000 / seconds_per_round) // 1000 * 1000
+    return max(sha256_crypt.min_rounds, min(sha256_crypt.max_rounds, rounds))
+
+
+def current_rounds():
+    """当前策略的哈希轮数（尚未校准时先校准，校准失败时暂时使用passlib默认值）"""
+    if _policy_rounds is None:
+        try:
+            return calibrate_hash_rounds()
+        except Exception as e:
+            app.logger.warning(f'校准密码哈希轮数失败，暂时使用默认轮数: {e}')
+            return sha256_crypt.default_rounds
+    return _policy_rounds
+
+
+def calibrate_hash_rounds():
+    """
+    按PASSWORD_HASH_TARGET_MS校准哈希轮数（在工作进程中测量，结果不低于passlib默认轮数）；
+    配置了PASSWORD_HASH_ROUNDS时直接使用配置值
+
+    每个进程只校准一次；直接运行app.py时在启动阶段调用，WSGI部署时由第一次哈希或校验触发
+
+    返回:
+        int: 当前策略的哈希轮数
+    """
+    global _policy_rounds
+    with _calibrate_lock:
+        if _policy_rounds is not None:
+            return _policy_rounds
+        fixed_rounds = app.config.get('PASSWORD_HASH_ROUNDS')
+        if fixed_rounds:
+            rounds = fixed_rounds
+        else:
+            target_ms = app.config.get('PASSWORD_HASH_TARGET_MS', 100)
+            elapsed = hash_pool.run('calibrate', _measure_hash, _CALIBRATION_ROUNDS)
+            # 机器较快或测量偏慢时不低于passlib默认轮数，只能通过PASSWORD_HASH_ROUNDS显式调低
+            rounds = max(sha256_crypt.default_rounds, _rounds_for_target(elapsed / _CALIBRATION_ROUNDS, target_ms))
+        _policy_rounds = rounds
+    app.logger.info(f'密码哈希轮数: {rounds}')
+    return rounds
+
+
+def needs_rehash(password_hash):
+    """
+    判断已保存的哈希是否需要按当前策略重新计算
+    （轮数比当前策略低PASSWORD_HASH_REHASH_TOLERANCE以上，或者不是sha256_crypt哈希）；
+    轮数高于当前策略的哈希保持不变
+
+    参数:
+        password_hash: 数据库中保存的哈希
+
+    返回:
+        bool: 是否需要重新计算
+    """
+    try:
+        rounds = sha256_crypt.from_string(password_hash).rounds
+    except (TypeError, ValueError):
+        return True
+    policy = current_rounds()
+    return rounds < policy * (1 - app.config.get('PASSWORD_HASH_REHASH_TOLERANCE', 0.25))
+
+
+def hash_password(password):
+    """
+    计算密码哈希
+
+    参数:
+        password: 明文密码
+
+    返回:
+        str: sha256_crypt哈希（使用当前策略的轮数）
+    """
+    return hash_pool.run('hash', _hash_with_rounds, password, current_rounds())
+
+
+def hash_passwords(passwords):
+    """
+    批量计算密码哈希（多个工作进程并行计算）
+
+    参数:
+        passwords: 明文密码列表
+
+    返回:
+        list: 与输入顺序一致的哈希列表
+    """
+    rounds = current_rounds()
+    return hash_pool.map('hash', _hash_with_rounds, [(password, rounds) for password in passwords])
+
+
+def verify_password(password, password_hash):
+    """
+    校验密码
+
+    参数:
+        password: 明文密码
+        password_hash: 数据库中保存的哈希
+
+    返回:
+        bool: 密码是否正确
+    """
+    return hash_pool.run('verify', sha256_crypt.verify, password, password_hash)
+
+
+# 命令行入口
+@app.cli.group('password')
+def password_cli():
+    """密码哈希命令"""
+    pass
+
+
+@password_cli.command('benchmark')
+@click.option('--rounds', '-r', multiple=True, type=int, help='要测试的轮数（可重复指定），默认测试一组常用值和校准结果')
+@click.option('--iterations', '-n', default=5, show_default=True, help='每个轮数的校验次数')
+def benchmark_command(rounds, iterations):
+    """测试不同轮数下单核和整个哈希进程池的校验吞吐量（均为实测）"""
+    target_ms = app.config.get('PASSWORD_HASH_TARGET_MS', 100)
+    calibrated = max(
+        sha256_crypt.default_rounds,
+        _rounds_for_target(_measure_hash(_CALIBRATION_ROUNDS) / _CALIBRATION_ROUNDS, target_ms)
+    )
+    settings = sorted(set(rounds or (5000, 20000, 50000, 100000, 200000, sha256_crypt.default_rounds, calibrated)))
+    workers = hash_pool.workers
+    hash_pool.start()
+
+    click.echo(f'哈希进程数: {workers}，目标校验耗时: {target_ms}ms，校准轮数: {calibrated}')
+    click.echo(f'{"轮数":>10} {"单次校验(ms)":>14} {"每核每秒":>10} {"进程池每秒":>12}')
+    for setting in settings:
+        password_hash = _hasher(setting).hash('benchmark')
+        start = time.perf_counter()
+        for _ in range(iterations):
+            sha256_crypt.verify('benchmark', password_hash)
+        per_verify = (time.perf_counter() - start) / iterations
+        per_core = 1 / per_verify if per_verify else 0.0
+        # 每个工作进程各执行iterations次校验（命令行测试，允许占用全部工作进程），按总耗时计算进程池的实际吞吐量
+        start = time.perf_counter()
+        hash_pool.map('benchmark', sha256_crypt.verify, [('benchmark', password_hash)] * (iterations * workers),
+                      batch_size=iterations, max_in_flight=workers)
+        elapsed = time.perf_counter() - start
+        pool_rate = iterations * workers / elapsed if elapsed else 0.0
+        marker = ' *' if setting == calibrated else ''
+        click.echo(f'{setting:>10} {per_verify * 1000:>14.2f} {per_core:>10.1f} {pool_rate:>12.1f}{marker}')
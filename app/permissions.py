@@ -0,0 +1,200 @@
+# 权限解析模块
+# 进程内缓存“用户名→角色”和“角色→权限集合(frozenset)”，
+# 稳定状态下requires_role/requires_permission的检查只需查内存，不再每个请求查询users和roles表
+#
+# 登录时还会把角色、权限列表和版本戳作为授权声明写入签名session（session['auth']），
+# 版本戳是角色名称和权限集合的摘要，由数据库中的共享状态决定，任何进程签发的声明在其他进程中同样有效；
+# 检查时与进程内缓存中的用户角色和角色权限比较，一致且未超过有效期时直接信任声明，
+# 角色被修改或用户的角色被修改后缓存失效（其他进程依赖TTL过期），摘要不再一致，声明从数据库刷新
+import time
+import json
+import hashlib
+
+from app.common import json_loads_safe
+from app.query_cache import LRUCache
+
+# 缓存中表示“用户不存在/角色不存在”的标记，避免对不存在的键反复查询数据库
+_NOT_FOUND = object()
+
+
+class PermissionResolver:
+    """
+    线程安全的权限解析器
+
+    角色被更新/删除、用户的角色被修改时由对应接口调用invalidate_role/invalidate_user失效；
+    其他进程或直接修改数据库造成的变化依赖TTL过期
+
+    参数:
+        max_entries: 每类缓存最多缓存项数
+        ttl: 缓存过期时间（秒）
+        claims_ttl: session中授权声明的有效期（秒），超过后即使版本戳一致也重新签发
+    """
+
+    def __init__(self, max_entries=4096, ttl=60, claims_ttl=300):
+        self._roles = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._users = LRUCache(max_entries=max_entries, ttl=ttl)
+        # 权限目录（role_permissions表中的全部权限名称）
+        self._catalog = LRUCache(max_entries=1, ttl=ttl)
+        self.claims_ttl = claims_ttl
+
+    def role_permissions(self, role):
+        """
+        获取角色的权限集合
+
+        参数:
+            role: 角色名称
+
+        返回:
+            frozenset: 权限名称集合（角色不存在时为空集合）
+        """
+        if not role:
+            return frozenset()
+        permissions = self._roles.get(role)
+        if permissions is not None:
+            return permissions
+        from app.utils import execute_db_query
+        tags = (role,)
+        generation = self._roles.generation(tags)
+        row = execute_db_query('SELECT permissions FROM roles WHERE role = %s', [role], fetch_one=True, primary=True)
+        permissions = frozenset()
+        if row:
+            value = row['permissions']
+            if isinstance(value, str):
+                value = json_loads_safe(value)
+            permissions = frozenset(value or ())
+        self._roles.set(role, permissions, tags=tags, generation=generation)
+        return permissions
+
+    def user_role(self, username):
+        """
+        获取用户的角色
+
+        参数:
+            username: 用户名
+
+        返回:
+            str: 角色名称；用户不存在时返回None
+        """
+        if not username:
+            return None
+        role = self._users.get(username)
+        if role is None:
+            from app.utils import execute_db_query
+            tags = (username,)
+            generation = self._users.generation(tags)
+            row = execute_db_query('SELECT role FROM users WHERE username = %s', [username], fetch_one=True, primary=True)
+            role = row['role'] if row else _NOT_FOUND
+            self._users.set(username, role, tags=tags, generation=generation)
+        return None if role is _NOT_FOUND else role
+
+    def permission_names(self):
+        """
+        获取权限目录（按id排序的全部权限名称）
+
+        返回:
+            tuple: 权限名称
+        """
+        names = self._catalog.get('names')
+        if names is None:
+            from app.utils import execute_db_query
+            generation = self._catalog.generation(('role_permissions',))
+            rows = execute_db_query('SELECT permission FROM role_permissions ORDER BY id', primary=True)
+            names = tuple(row['permission'] for row in rows)
+            self._catalog.set('names', names, tags=('role_permissions',), generation=generation)
+        return names
+
+    def invalidate_catalog(self):
+        """使权限目录缓存失效（执行迁移后调用，role_permissions表只由迁移写入）"""
+        self._catalog.invalidate(('role_permissions',))
+
+    def user_permissions(self, username):
+        """
+        获取用户（通过其角色）拥有的权限集合
+
+        返回:
+            frozenset: 权限名称集合
+        """
+        return self.role_permissions(self.user_role(username))
+
+    def has_permission(self, username, permission):
+        """检查用户是否拥有指定权限"""
+        return permission in self.user_permissions(username)
+
+    def invalidate_role(self, *roles):
+        """
+        使角色的权限缓存失效：立即失效一次，在事务中时提交后再失效一次，
+        丢弃事务提交前其他请求读入的旧数据
+        """
+        from app.utils import after_commit
+        self._roles.invalidate(roles)
+        after_commit(self._roles.invalidate, roles)
+
+    def invalidate_user(self, *usernames):
+        """使用户的角色缓存失效（用户角色被修改或用户被删除时调用）"""
+        from app.utils import after_commit
+        self._users.invalidate(usernames)
+        after_commit(self._users.invalidate, usernames)
+
+    @staticmethod
+    def _version_stamp(role, permissions):
+        """角色和权限集合的版本戳（只依赖数据库中的数据，各进程计算结果相同）"""
+        payload = json.dumps([role, sorted(permissions)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def issue_claims(self, username, role=_NOT_FOUND):
+        """
+        签发授权声明（写入session['auth']，由session签名保证不可篡改）
+
+        参数:
+            username: 用户名
+            role: 已知的用户角色（例如登录时刚查询到的），不传时通过缓存/数据库获取
+
+        返回:
+            dict: 包含role、permissions、version和issued_at的声明
+        """
+        if role is _NOT_FOUND:
+            role = self.user_role(username)
+        permissions = self.role_permissions(role)
+        return {
+            'role': role,
+            'permissions': sorted(permissions),
+            'version': self._version_stamp(role, permissions),
+            'issued_at': int(time.time()),
+        }
+
+    def session_claims(self, session):
+        """
+        获取当前session中的授权声明：角色和版本戳与缓存中的当前数据一致且未过期时直接返回，
+        否则重新签发并写回session
+
+        参数:
+            session: Flask session
+
+        返回:
+            dict: 授权声明
+        """
+        username = session.get('username')
+        claims = session.get('auth')
+        role = self.user_role(username)
+        if (claims
+                and claims.get('role') == role
+                and claims.get('version') == self._version_stamp(role, self.role_permissions(role))
+                and time.time() - claims.get('issued_at', 0) < self.claims_ttl):
+            return claims
+        claims = self.issue_claims(username, role)
+        session['auth'] = claims
+        return claims
+
+    def clear(self):
+        """清空所有缓存"""
+        self._roles.clear()
+        self._users.clear()
+        self._catalog.clear()
+
+    def stats(self):
+        """获取缓存统计信息"""
+        return {
+            'roles': self._roles.stats(),
+            'users': self._users.stats(),
+            'catalog': self._catalog.stats(),
+        }
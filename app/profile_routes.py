@@ -1,7 +1,8 @@
 from flask import render_template, request, jsonify, session
-from app import app, csrf
-from app.utils import make_json_response, get_request_data, execute_db_query, log_audit
+from app import app, csrf, user_suggest_index
+from app.utils import make_json_response, get_request_data, execute_db_query, log_audit, after_commit, get_user_profile, invalidate_user_profile
 from app.decorators import is_logged_in
+from app.passwords import hash_password, verify_password
 
 # 个人信息页面 - Web界面
 @app.route('/admin/profile')
@@ -21,16 +22,14 @@ def get_profile_api():
     # 尝试从请求参数获取token
     token = request.args.get('token')
     if token:
-        # 直接解析token作为session数据
-        from flask.sessions import SecureCookieSessionInterface
-        interface = SecureCookieSessionInterface()
+        # 通过当前的会话接口解析token（签名Cookie的值或服务端会话ID，验证结果有缓存）
         try:
-            session_data = interface.get_signing_serializer(app).loads(token)
-            if 'logged_in' in session_data and session_data['logged_in']:
-                # 获取用户信息
+            session_data = app.session_interface.load_token(app, token)
+            if session_data and session_data.get('logged_in'):
+                # 获取用户信息（按用户缓存，轮询时不查询数据库）
                 user_id = session_data.get('user_id')
                 if user_id:
-                    user = execute_db_query('SELECT id, username, role, name, phone, email, created_at, avatar FROM users WHERE id = %s', [user_id], fetch_one=True)
+                    user = get_user_profile(user_id)
                     if user:
                         return make_json_response(200, '获取个人信息成功', user)
         except Exception as e:
@@ -43,7 +42,7 @@ def get_profile_api():
         user_id = session.get('user_id')
         
         # 获取用户信息
-        user = execute_db_query('SELECT id, username, role, name, phone, email, created_at, avatar FROM users WHERE id = %s', [user_id], fetch_one=True)
+        user = get_user_profile(user_id)
         
         if not user:
             return make_json_response(404, '用户不存在', status_code=404)
@@ -84,6 +83,8 @@ def update_profile_api():
     query = "UPDATE users SET name = %s, phone = %s, email = %s WHERE id = %s"
     params = (name, phone, email, user_id)
     execute_db_query(query, params, commit=True)
+    invalidate_user_profile(user_id)
+    after_commit(user_suggest_index.upsert, user_id, username, name)
     
     # 记录更新个人信息的审计日志
     log_audit(
@@ -122,10 +123,9 @@ def change_password_api():
         return make_json_response(400, '新密码长度不能少于6位', status_code=400)
     
     # 验证旧密码
-    from passlib.hash import sha256_crypt
     user = execute_db_query('SELECT * FROM users WHERE id = %s', [user_id], fetch_one=True)
     
-    if not user or not sha256_crypt.verify(old_password, user['password']):
+    if not user or not verify_password(old_password, user['password']):
         return make_json_response(400, '旧密码错误', status_code=400)
     
     # 检查新密码是否与旧密码相同
@@ -133,7 +133,7 @@ def change_password_api():
         return make_json_response(400, '新密码不能与旧密码相同', status_code=400)
     
     # 更新密码
-    hashed_new_password = sha256_crypt.hash(new_password)
+    hashed_new_password = hash_password(new_password)
     query = "UPDATE users SET password = %s WHERE id = %s"
     execute_db_query(query, [hashed_new_password, user_id], commit=True)
     
@@ -176,7 +176,7 @@ def get_user_permissions_api():
     # 获取角色权限
     permissions = []
     if user_role:
-        role = execute_db_query('SELECT permissions FROM roles WHERE role = %s', [user_role], fetch_one=True)
+        role = execute_db_query('SELECT permissions FROM roles WHERE role = %s', [user_role], fetch_one=True, cache=True)
         if role:
             import json
             role_permissions = role.get('permissions', '[]')
@@ -247,6 +247,7 @@ def update_avatar_api():
     # 更新用户头像信息
     query = "UPDATE users SET avatar = %s WHERE id = %s"
     execute_db_query(query, [filename, user_id], commit=True)
+    invalidate_user_profile(user_id)
     
     # 如果用户有旧头像，删除旧头像文件
     if old_avatar and old_avatar != filename:
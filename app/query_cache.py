@@ -0,0 +1,184 @@
+# 查询结果缓存模块
+# 有容量上限的LRU+TTL缓存，缓存项按读取的表打标签，写操作按表失效
+import re
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+_READ_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+`?(\w+)`?', re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r'^\s*(?:INSERT\s+(?:IGNORE\s+)?(?:INTO\s+)?|REPLACE\s+(?:INTO\s+)?|UPDATE\s+(?:IGNORE\s+)?|'
+    r'DELETE\s+(?:IGNORE\s+)?FROM\s+|TRUNCATE\s+(?:TABLE\s+)?|ALTER\s+TABLE\s+|DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?)`?(\w+)`?',
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=2048)
+def read_tables(query):
+    """
+    解析查询语句读取的表
+
+    返回:
+        frozenset: 表名集合（小写）
+    """
+    return frozenset(name.lower() for name in _READ_TABLE_RE.findall(query))
+
+
+@lru_cache(maxsize=2048)
+def write_tables(query):
+    """
+    解析写语句涉及的表（目标表以及FROM/JOIN中出现的表，宁可多失效也不漏失效）
+
+    返回:
+        frozenset: 表名集合（小写）
+    """
+    tables = set(read_tables(query))
+    match = _WRITE_TABLE_RE.match(query)
+    if match:
+        tables.add(match.group(1).lower())
+    return frozenset(tables)
+
+
+class LRUCache:
+    """
+    线程安全、有容量上限的LRU+TTL缓存，支持按标签批量失效
+
+    参数:
+        max_entries: 最多缓存项数，超过时淘汰最久未使用的项
+        ttl: 默认过期时间（秒）
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, tags)
+        self._data = OrderedDict()
+        # tag -> set(key)
+        self._tags = {}
+        # tag -> 失效次数，用于丢弃在失效之前发起、失效之后才写入的旧结果
+        self._generations = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def _remove(self, key):
+        """删除缓存项及其标签索引（调用方需持有锁）"""
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key, default=None):
+        """
+        获取缓存值
+
+        返回:
+            缓存值；未命中或已过期时返回default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def generation(self, tags):
+        """
+        获取标签的当前失效代数，在查询数据库之前调用，写入时传给set
+
+        返回:
+            tuple: 各标签的失效代数
+        """
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    def set(self, key, value, ttl=None, tags=(), generation=None):
+        """
+        写入缓存
+
+        参数:
+            key: 缓存键（必须可哈希）
+            value: 缓存值
+            ttl: 过期时间（秒），默认使用构造时的ttl
+            tags: 标签（例如表名），用于invalidate批量失效
+            generation: 读取数据前通过generation(tags)获取的失效代数，
+                        如果期间这些标签被失效过，说明结果可能已过时，放弃写入
+
+        返回:
+            bool: 是否写入成功
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(tag, 0) for tag in sorted(tags)):
+                return False
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._evictions += 1
+        return True
+
+    def delete(self, key):
+        """删除单个缓存项"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate(self, tags):
+        """
+        使带有任一指定标签的缓存项失效
+
+        返回:
+            int: 失效的缓存项数量
+        """
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self._invalidations += removed
+        return removed
+
+    def clear(self):
+        """清空缓存（与invalidate一样递增所有已知标签的失效代数，丢弃清空前发起的查询结果）"""
+        with self._lock:
+            for tag in self._tags.keys() | self._generations.keys():
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+            }
@@ -1,7 +1,8 @@
 from flask import render_template, request, jsonify, session
-from app import app, csrf
-from app.utils import make_json_response, get_request_data, execute_db_query, log_audit
+from app import app, csrf, permission_resolver
+from app.utils import make_json_response, get_request_data, execute_db_query, log_audit, transaction
 from app.decorators import is_logged_in, requires_permission
+from app.pagination import parse_count_mode, count_rows
 
 # 角色管理页面 - Web界面
 @app.route('/admin/role_management')
@@ -9,7 +10,7 @@ from app.decorators import is_logged_in, requires_permission
 @requires_permission('角色管理')
 def role_management_page():
     # 从数据库的role_permissions表中获取所有权限
-    permissions = execute_db_query('SELECT id, permission FROM role_permissions ORDER BY id')
+    permissions = execute_db_query('SELECT id, permission FROM role_permissions ORDER BY id', cache=True)
     
     # 将结果转换为模板需要的格式（id, permissions）
     formatted_permissions = []
@@ -21,6 +22,9 @@ def role_management_page():
     
     return render_template('role_management.html', permissions=formatted_permissions)
 
+# 角色是否有用户在使用（读取时计算，用户的增删改不需要同步roles表）
+ROLE_IN_USE_EXPR = 'EXISTS (SELECT 1 FROM users u WHERE u.role = roles.role) AS is_in_use'
+
 # 获取角色列表API - RESTful接口
 @app.route('/api/roles', methods=['GET'])
 @is_logged_in
@@ -33,6 +37,8 @@ def get_roles_api():
         page_size = int(request.args.get('page_size', request.args.get('pageSize', 10)))
         # 支持前端使用name参数进行搜索
         search = request.args.get('name', request.args.get('search', ''))
+        # 总数计算方式：exact、estimate、none，未指定时根据表大小选择
+        count_mode = parse_count_mode(request.args.get('count'))
         
         # 构建查询条件
         where_clause = "WHERE 1=1"
@@ -43,16 +49,15 @@ def get_roles_api():
             params.append(f"%{search}%")
         
         # 获取总数
-        count_query = f"SELECT COUNT(*) as count FROM roles {where_clause}"
-        total = execute_db_query(count_query, params, fetch_one=True)['count']
+        total, count_mode = count_rows('roles', where_clause, params, count_mode)
         
         # 计算分页偏移量
         offset = (page - 1) * page_size
         
-        # 获取角色列表 - 明确指定要查询的字段
-        roles_query = f"SELECT id, role, permissions, is_in_use, created_at FROM roles {where_clause} ORDER BY id DESC LIMIT %s OFFSET %s"
+        # 获取角色列表 - 明确指定要查询的字段，是否在使用中按users表实时计算（users.role上有索引）
+        roles_query = f"SELECT id, role, permissions, {ROLE_IN_USE_EXPR}, created_at FROM roles {where_clause} ORDER BY id DESC LIMIT %s OFFSET %s"
         params.extend([page_size, offset])
-        roles = execute_db_query(roles_query, params)
+        roles = execute_db_query(roles_query, params, compact=True)
         
         # 格式化角色数据
         formatted_roles = []
@@ -79,14 +84,15 @@ def get_roles_api():
             
             formatted_roles.append(formatted_role)
         
-        # 计算总页数
-        total_pages = (total + page_size - 1) // page_size
+        # 计算总页数（不计算总数时为None）
+        total_pages = (total + page_size - 1) // page_size if total is not None else None
         
         # 返回分页数据
         return make_json_response(200, '获取角色列表成功', {
             'total': total,
             'roles': formatted_roles,
-            'total_pages': total_pages
+            'total_pages': total_pages,
+            'count_mode': count_mode
         })
     except Exception as e:
         app.logger.error(f"获取角色列表异常: {e}")
@@ -98,7 +104,7 @@ def get_roles_api():
 @requires_permission('角色管理')
 def get_role_api(role_id):
     # 获取角色信息 - 明确指定要查询的字段
-    role = execute_db_query('SELECT id, role, permissions, is_in_use, created_at FROM roles WHERE id = %s', [role_id], fetch_one=True)
+    role = execute_db_query(f'SELECT id, role, permissions, {ROLE_IN_USE_EXPR}, created_at FROM roles WHERE id = %s', [role_id], fetch_one=True)
     
     if not role:
         return make_json_response(404, '角色不存在', status_code=404)
@@ -130,7 +136,7 @@ def get_role_api(role_id):
 @is_logged_in
 def get_permissions_api():
     # 从数据库的role_permissions表中获取所有权限
-    permissions = execute_db_query('SELECT id, permission FROM role_permissions ORDER BY id')
+    permissions = execute_db_query('SELECT id, permission FROM role_permissions ORDER BY id', cache=True)
     
     # 将结果转换为API需要的格式（id, permissions）
     formatted_permissions = []
@@ -157,28 +163,32 @@ def create_role_api():
     if not role_name:
         return make_json_response(400, '角色名称不能为空', status_code=400)
     
-    # 检查角色名称是否已存在
-    existing_role = execute_db_query('SELECT * FROM roles WHERE role = %s', [role_name], fetch_one=True)
-    if existing_role:
-        return make_json_response(400, '角色名称已存在', status_code=400)
-    
-    # 处理权限数据
-    import json
-    permissions_json = json.dumps(permissions)
-    
-    # 创建新角色
-    query = "INSERT INTO roles (role, permissions) VALUES (%s, %s)"
-    params = (role_name, permissions_json)
-    execute_db_query(query, params, commit=True)
-    
-    # 记录创建角色的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='创建角色',
-        target=f'角色:{role_name}',
-        details={'result': '成功'}
-    )
+    # 检查、插入和审计日志在同一个事务中完成
+    with transaction():
+        # 检查角色名称是否已存在
+        existing_role = execute_db_query('SELECT * FROM roles WHERE role = %s', [role_name], fetch_one=True)
+        if existing_role:
+            return make_json_response(400, '角色名称已存在', status_code=400)
+        
+        # 处理权限数据
+        import json
+        permissions_json = json.dumps(permissions)
+        
+        # 创建新角色
+        query = "INSERT INTO roles (role, permissions) VALUES (%s, %s)"
+        params = (role_name, permissions_json)
+        execute_db_query(query, params, commit=True)
+        # 丢弃“角色不存在”时缓存的空权限集合
+        permission_resolver.invalidate_role(role_name)
+        
+        # 记录创建角色的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='创建角色',
+            target=f'角色:{role_name}',
+            details={'result': '成功'}
+        )
     
     return make_json_response(201, '角色创建成功', status_code=201)
 
@@ -197,35 +207,38 @@ def update_role_api(role_id):
     if not role_name:
         return make_json_response(400, '角色名称不能为空', status_code=400)
     
-    # 检查角色是否存在
-    role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
-    if not role:
-        return make_json_response(404, '角色不存在', status_code=404)
-    
-    # 检查角色名称是否已存在（排除当前角色）
-    existing_role = execute_db_query('SELECT * FROM roles WHERE role = %s AND id != %s', [role_name, role_id], fetch_one=True)
-    if existing_role:
-        return make_json_response(400, '角色名称已存在', status_code=400)
-    
-    # 处理权限数据
-    import json
-    permissions_json = json.dumps(permissions)
-    
-    # 更新角色信息
-    query = "UPDATE roles SET role = %s, permissions = %s WHERE id = %s"
-    params = (role_name, permissions_json, role_id)
-    execute_db_query(query, params, commit=True)
-    
-    # 用户权限现在从角色表动态获取，不需要单独更新users表
-    
-    # 记录更新角色的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='更新角色',
-        target=f'角色:{role_name}',
-        details={'result': '成功'}
-    )
+    # 检查、更新和审计日志在同一个事务中完成
+    with transaction():
+        # 检查角色是否存在
+        role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
+        if not role:
+            return make_json_response(404, '角色不存在', status_code=404)
+        
+        # 检查角色名称是否已存在（排除当前角色）
+        existing_role = execute_db_query('SELECT * FROM roles WHERE role = %s AND id != %s', [role_name, role_id], fetch_one=True)
+        if existing_role:
+            return make_json_response(400, '角色名称已存在', status_code=400)
+        
+        # 处理权限数据
+        import json
+        permissions_json = json.dumps(permissions)
+        
+        # 更新角色信息
+        query = "UPDATE roles SET role = %s, permissions = %s WHERE id = %s"
+        params = (role_name, permissions_json, role_id)
+        execute_db_query(query, params, commit=True)
+        
+        # 用户权限现在从角色表动态获取，不需要单独更新users表，只需使原角色名和新角色名的权限缓存失效
+        permission_resolver.invalidate_role(role['role'], role_name)
+        
+        # 记录更新角色的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='更新角色',
+            target=f'角色:{role_name}',
+            details={'result': '成功'}
+        )
     
     return make_json_response(200, '角色更新成功')
 
@@ -235,28 +248,31 @@ def update_role_api(role_id):
 @requires_permission('角色管理')
 @csrf.exempt  # 添加CSRF豁免装饰器
 def delete_role_api(role_id):
-    # 检查角色是否存在
-    role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
-    if not role:
-        return make_json_response(404, '角色不存在', status_code=404)
-    
-    # 检查是否有用户使用该角色
-    user_count = execute_db_query('SELECT COUNT(*) as count FROM users WHERE role = %s', [role['role']], fetch_one=True)['count']
-    if user_count > 0:
-        return make_json_response(400, '该角色正在被使用，无法删除', status_code=400)
-    
-    # 删除角色
-    query = "DELETE FROM roles WHERE id = %s"
-    execute_db_query(query, [role_id], commit=True)
-    
-    # 记录删除角色的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='删除角色',
-        target=f'角色:{role["role"]}',
-        details={'result': '成功'}
-    )
+    # 检查、删除和审计日志在同一个事务中完成
+    with transaction():
+        # 检查角色是否存在
+        role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
+        if not role:
+            return make_json_response(404, '角色不存在', status_code=404)
+        
+        # 检查是否有用户使用该角色
+        user_count = execute_db_query('SELECT COUNT(*) as count FROM users WHERE role = %s', [role['role']], fetch_one=True)['count']
+        if user_count > 0:
+            return make_json_response(400, '该角色正在被使用，无法删除', status_code=400)
+        
+        # 删除角色
+        query = "DELETE FROM roles WHERE id = %s"
+        execute_db_query(query, [role_id], commit=True)
+        permission_resolver.invalidate_role(role['role'])
+        
+        # 记录删除角色的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='删除角色',
+            target=f'角色:{role["role"]}',
+            details={'result': '成功'}
+        )
     
     return make_json_response(200, '角色删除成功')
 
@@ -273,38 +289,41 @@ def bulk_delete_roles_api():
     if not role_ids:
         return make_json_response(400, '请选择要删除的角色', status_code=400)
     
-    # 检查是否有角色正在被使用
-    for role_id in role_ids:
-        role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
-        if role:
-            user_count = execute_db_query('SELECT COUNT(*) as count FROM users WHERE role = %s', [role['role']], fetch_one=True)['count']
-            if user_count > 0:
-                return make_json_response(400, f'角色{role["role"]}正在被使用，无法删除', status_code=400)
-    
-    # 在删除前获取要删除的角色名称
-    deleted_roles = []
-    for role_id in role_ids:
-        role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
-        if role:
-            deleted_roles.append(role['role'])
-    
-    # 批量删除角色
-    query = "DELETE FROM roles WHERE id IN (%s)" % ','.join(['%s'] * len(role_ids))
-    execute_db_query(query, role_ids, commit=True)
-    
-    # 记录批量删除角色的审计日志
-    # 如果有删除的角色名称，在操作目标中显示具体角色
-    if deleted_roles:
-        target_text = f'角色:{", ".join(deleted_roles)}'
-    else:
-        target_text = f'角色:{len(role_ids)}个'
-    
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='批量删除角色',
-        target=target_text,
-        details={'result': '成功', 'count': len(role_ids), 'roles': deleted_roles}
-    )
+    # 检查、删除和审计日志在同一个事务中完成
+    with transaction():
+        # 检查是否有角色正在被使用
+        for role_id in role_ids:
+            role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
+            if role:
+                user_count = execute_db_query('SELECT COUNT(*) as count FROM users WHERE role = %s', [role['role']], fetch_one=True)['count']
+                if user_count > 0:
+                    return make_json_response(400, f'角色{role["role"]}正在被使用，无法删除', status_code=400)
+        
+        # 在删除前获取要删除的角色名称
+        deleted_roles = []
+        for role_id in role_ids:
+            role = execute_db_query('SELECT * FROM roles WHERE id = %s', [role_id], fetch_one=True)
+            if role:
+                deleted_roles.append(role['role'])
+        
+        # 批量删除角色
+        query = "DELETE FROM roles WHERE id IN (%s)" % ','.join(['%s'] * len(role_ids))
+        execute_db_query(query, role_ids, commit=True)
+        permission_resolver.invalidate_role(*deleted_roles)
+        
+        # 记录批量删除角色的审计日志
+        # 如果有删除的角色名称，在操作目标中显示具体角色
+        if deleted_roles:
+            target_text = f'角色:{", ".join(deleted_roles)}'
+        else:
+            target_text = f'角色:{len(role_ids)}个'
+        
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='批量删除角色',
+            target=target_text,
+            details={'result': '成功', 'count': len(role_ids), 'roles': deleted_roles}
+        )
     
     return make_json_response(200, '批量删除角色成功')
@@ -0,0 +1,95 @@
+# 紧凑行对象模块
+# 查询结果的每一行用元组保存，列名到下标的映射在同一结果集的所有行之间共享，
+# datetime字段在读取或JSON序列化时才格式化，不再逐行逐键改写字典
+import datetime
+from collections.abc import Mapping
+
+from flask.json.provider import DefaultJSONProvider
+
+# 与convert_datetime_fields保持一致的默认日期时间格式
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _format_value(value):
+    """datetime对象转换为字符串，其他值原样返回"""
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+class Row(Mapping):
+    """
+    元组存储的字典视图，用法与DictCursor返回的字典一致（row['name']、row.get('name')、row['name'] = value），
+    datetime字段在访问时格式化为字符串
+
+    修改采用写时复制：写入时替换本行的列值元组，新增列时再复制一份私有的列映射，
+    同一结果集的其他行和copy()得到的副本不受影响；不支持删除列
+
+    参数:
+        index: 列名到下标的映射（同一结果集共享）
+        values: 列值元组
+    """
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        return _format_value(self._values[self._index[key]])
+
+    def __setitem__(self, key, value):
+        """修改列值（例如把JSON字符串解析后写回）；新增列时复制一份私有的列映射"""
+        position = self._index.get(key)
+        if position is None:
+            self._index = dict(self._index)
+            self._index[key] = len(self._values)
+            self._values = self._values + (value,)
+        else:
+            self._values = self._values[:position] + (value,) + self._values[position + 1:]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __repr__(self):
+        return f'Row({self.to_dict()!r})'
+
+    def copy(self):
+        """复制行（共享列映射）"""
+        return Row(self._index, self._values)
+
+    def to_dict(self):
+        """一次遍历转换为普通字典，同时格式化datetime字段"""
+        values = self._values
+        return {name: _format_value(values[position]) for name, position in self._index.items()}
+
+
+def rows_from_cursor(cursor, rows):
+    """
+    将游标返回的元组行包装为Row对象
+
+    参数:
+        cursor: 已执行查询的游标（用于读取列名）
+        rows: 元组行列表
+
+    返回:
+        list: Row对象列表
+    """
+    index = {column[0]: position for position, column in enumerate(cursor.description or ())}
+    return [Row(index, values) for values in rows]
+
+
+class RowJSONProvider(DefaultJSONProvider):
+    """支持Row对象的JSON序列化：在编码过程中直接转换为字典并格式化datetime字段"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Row):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
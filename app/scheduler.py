@@ -4,11 +4,11 @@ import os
 import zipfile
 import json
 import traceback
-from app.utils import execute_db_query, format_audit_details
+from app.utils import execute_db_query, stream_db_query, format_audit_details
 import csv
-from io import StringIO
 from app import app
 from app.common import json_loads_safe, get_file_path, ensure_dir_exists, get_timestamp_filename
+from app.sessions import ServerSideSessionInterface
 
 # 导出目录配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,57 +25,6 @@ def export_audit_logs():
     """导出审计日志并压缩为zip文件"""
     try:
         with app.app_context():
-            # 获取所有审计日志
-            logs = execute_db_query('SELECT * FROM audit_logs ORDER BY created_at DESC')
-            
-            if not logs:
-                app.logger.info("没有审计日志需要导出")
-                return
-            
-            # 生成CSV内容
-            csv_buffer = StringIO()
-            writer = csv.writer(csv_buffer)
-            
-            # 写入标题行，与前端页面一致
-            writer.writerow(['序号', '用户名', '操作类型', '操作目标', '操作详情', 'IP地址', '创建时间'])
-            
-            # 写入数据行
-            for index, log in enumerate(logs):
-                # 使用连续序号，从1开始
-                sequential_number = index + 1
-                details_str = ''
-                if log.get('details'):
-                    details = log['details']
-                    if isinstance(details, str):
-                        details_json = json_loads_safe(details)
-                        if details_json is not None:
-                            details = details_json
-                        else:
-                            details_str = details
-                            details = None
-                    
-                    if isinstance(details, dict):
-                        # 优先使用后端提供的格式化详情
-                        if details.get('formatted'):
-                            details_str = details['formatted']
-                        else:
-                            # 使用utils中的format_audit_details函数
-                            details_str = format_audit_details(log['action'], details)
-                    else:
-                        details_str = str(details)
-                        
-                writer.writerow([
-                    sequential_number,
-                    log['username'],
-                    log['action'],
-                    log['target'],
-                    details_str,
-                    log['ip_address'],
-                    log['created_at']
-                ])
-            
-            csv_content = csv_buffer.getvalue()
-            
             # 生成文件名
             csv_filename = get_timestamp_filename('audit_logs', '.csv')
             zip_filename = get_timestamp_filename('audit_logs', '.zip')
@@ -83,9 +32,54 @@ def export_audit_logs():
             csv_path = os.path.join(export_dir, csv_filename)
             zip_path = os.path.join(export_dir, zip_filename)
             
+            # 使用服务端游标流式读取审计日志，边读边写入CSV文件，内存占用与日志条数无关
             # 保存CSV文件，添加newline=''避免空行问题
+            count = 0
             with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
-                f.write(csv_content)
+                writer = csv.writer(f)
+                
+                # 写入标题行，与前端页面一致
+                writer.writerow(['序号', '用户名', '操作类型', '操作目标', '操作详情', 'IP地址', '创建时间'])
+                
+                # 写入数据行
+                for log in stream_db_query('SELECT * FROM audit_logs ORDER BY created_at DESC'):
+                    # 使用连续序号，从1开始
+                    count += 1
+                    details_str = ''
+                    if log.get('details'):
+                        details = log['details']
+                        if isinstance(details, str):
+                            details_json = json_loads_safe(details)
+                            if details_json is not None:
+                                details = details_json
+                            else:
+                                details_str = details
+                                details = None
+                        
+                        if isinstance(details, dict):
+                            # 优先使用后端提供的格式化详情
+                            if details.get('formatted'):
+                                details_str = details['formatted']
+                            else:
+                                # 使用utils中的format_audit_details函数
+                                details_str = format_audit_details(log['action'], details)
+                        else:
+                            details_str = str(details)
+                            
+                    writer.writerow([
+                        count,
+                        log['username'],
+                        log['action'],
+                        log['target'],
+                        details_str,
+                        log['ip_address'],
+                        log['created_at']
+                    ])
+            
+            if not count:
+                os.remove(csv_path)
+                app.logger.info("没有审计日志需要导出")
+                return
             
             # 压缩为zip文件
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -94,7 +88,7 @@ def export_audit_logs():
             # 删除原始CSV文件
             os.remove(csv_path)
             
-            app.logger.info(f"审计日志导出完成: {zip_filename}")
+            app.logger.info(f"审计日志导出完成: {zip_filename}，共{count}条")
             
     except Exception as e:
         app.logger.error(f"审计日志导出失败: {str(e)}")
@@ -187,6 +181,15 @@ def clean_old_db_logs():
     except Exception as e:
         app.logger.error(f"清理旧数据库审计日志失败: {str(e)}", exc_info=True)
 
+def sweep_expired_sessions():
+    """清理已过期的服务端会话"""
+    try:
+        removed = app.session_interface.sweep()
+        if removed:
+            app.logger.info(f"清理了{removed}个过期会话")
+    except Exception as e:
+        app.logger.error(f"清理过期会话失败: {str(e)}")
+
 # 初始化调度器
 app.logger.info('正在初始化调度器...')
 scheduler = BackgroundScheduler(daemon=True)
@@ -207,6 +210,10 @@ scheduler.add_job(func=clean_old_logs, trigger='cron', day=1, hour=3, minute=30)
 # 添加每月数据库审计日志清理任务（每月的第一天凌晨4点）
 scheduler.add_job(func=clean_old_db_logs, trigger='cron', day=1, hour=4, minute=0)
 
+# 使用服务端会话时，定期清理过期会话
+if isinstance(app.session_interface, ServerSideSessionInterface):
+    scheduler.add_job(func=sweep_expired_sessions, trigger='interval', seconds=app.config.get('SESSION_SWEEP_INTERVAL', 600))
+
 
 
 # 启动调度器
@@ -0,0 +1,95 @@
+# 用户搜索模块
+# 用户列表的关键词筛选原来是三个字段上的LIKE '%x%'，无法使用B树索引，每次搜索都全表扫描；
+# 改为使用users表(username, name, email)上的FULLTEXT索引（ngram分词，支持中文），
+# 关键词作为布尔模式短语查询，效果等同于子串匹配，并可按相关度排序
+#
+# 关键词中有短于ngram_token_size的词、或者全文索引尚未创建（迁移5未执行）时回退到LIKE
+import MySQLdb
+
+from app.utils import execute_db_query
+
+# 全文索引名称（由迁移创建）及其字段，MATCH的字段列表必须与索引完全一致
+FULLTEXT_INDEX = 'ft_users_search'
+MATCH_EXPR = 'MATCH(username, name, email)'
+
+# 全文索引可用性的缓存时间（秒）
+_AVAILABILITY_TTL = 300
+
+
+def fulltext_token_size():
+    """
+    获取全文索引的ngram分词长度
+
+    返回:
+        int: 分词长度；全文索引不可用时返回0
+    """
+    try:
+        row = execute_db_query(
+            "SELECT @@ngram_token_size AS token_size, EXISTS (SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND INDEX_NAME = %s) AS has_index",
+            [FULLTEXT_INDEX], fetch_one=True, cache=_AVAILABILITY_TTL
+        )
+    except MySQLdb.Error:
+        # 不支持ngram分词的MySQL版本没有ngram_token_size变量
+        return 0
+    return int(row['token_size']) if row and row['has_index'] else 0
+
+
+def _fulltext_phrase(term):
+    """把关键词转换为布尔模式短语，不能使用全文索引时返回None"""
+    token_size = fulltext_token_size()
+    words = term.replace('"', ' ').split()
+    if not token_size or not words or any(len(word) < token_size for word in words):
+        return None
+    return '"' + ' '.join(words) + '"'
+
+
+def keyword_condition(term):
+    """
+    生成“用户名、姓名或邮箱包含关键词”的查询条件
+
+    参数:
+        term: 关键词
+
+    返回:
+        tuple: (条件SQL, 参数列表)
+    """
+    phrase = _fulltext_phrase(term)
+    if phrase:
+        return f"{MATCH_EXPR} AGAINST (%s IN BOOLEAN MODE)", [phrase]
+    like = f"%{term}%"
+    return "(username LIKE %s OR name LIKE %s OR email LIKE %s)", [like, like, like]
+
+
+def column_condition(column, term):
+    """
+    生成“指定字段包含关键词”的查询条件：先用全文索引缩小范围，再按字段筛选
+
+    参数:
+        column: 字段名（username或name，必须是代码中的固定字段名）
+        term: 关键词
+
+    返回:
+        tuple: (条件SQL, 参数列表)
+    """
+    like = f"%{term}%"
+    phrase = _fulltext_phrase(term)
+    if phrase:
+        return f"{MATCH_EXPR} AGAINST (%s IN BOOLEAN MODE) AND {column} LIKE %s", [phrase, like]
+    return f"{column} LIKE %s", [like]
+
+
+def relevance_order(term):
+    """
+    生成按相关度排序的ORDER BY子句
+
+    参数:
+        term: 关键词
+
+    返回:
+        tuple: (排序SQL, 参数列表)；不能使用全文索引时返回None
+    """
+    phrase = _fulltext_phrase(term)
+    if not phrase:
+        return None
+    return f"{MATCH_EXPR} AGAINST (%s IN BOOLEAN MODE) DESC, id DESC", [phrase]
@@ -0,0 +1,424 @@
+# 会话接口模块
+# cookie: 签名Cookie会话（Flask默认方式），缓存最近验证过的Cookie及其解码结果，
+#         同一个Cookie的重复请求不再重复做HMAC校验和JSON解码
+# filesystem/sqlite: 服务端会话，Cookie中只保存随机会话ID，会话数据保存在本地分片文件或SQLite中，
+#         前面有一层进程内LRU缓存，缓存命中时只向存储确认会话的版本（不读取和解码数据），
+#         其他进程作废或改写的会话立即生效；会话按PERMANENT_SESSION_LIFETIME过期，由定时任务清理
+import os
+import re
+import copy
+import time
+import sqlite3
+import secrets
+import threading
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface, session_json_serializer
+from itsdangerous import BadSignature
+
+from app.query_cache import LRUCache
+
+# 会话ID格式（secrets.token_urlsafe(32)），不符合格式的Cookie直接视为新会话，也避免拼接文件路径时越界
+_SID_RE = re.compile(r'[A-Za-z0-9_-]{43}')
+
+
+class CachingSessionInterface(SecureCookieSessionInterface):
+    """
+    带验证结果缓存的签名Cookie会话接口
+
+    Cookie的值（包含签名和时间戳）作为缓存键，缓存项在Cookie按PERMANENT_SESSION_LIFETIME过期时同时过期；
+    命中时返回解码结果的副本，请求内对session的修改不会影响缓存
+
+    参数:
+        max_entries: 最多缓存的Cookie数
+    """
+
+    def __init__(self, max_entries=1024):
+        self._verified = LRUCache(max_entries=max_entries)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        data = self.load_token(app, request.cookies.get(self.get_cookie_name(app)))
+        return self.session_class(data)
+
+    def load_token(self, app, token):
+        """
+        校验并解码会话Cookie的值（也用于URL中传递的token）
+
+        返回:
+            dict: 会话数据的副本；token为空、签名无效或已过期时返回None
+        """
+        if not token:
+            return None
+        data = self._verified.get(token)
+        if data is None:
+            max_age = int(app.permanent_session_lifetime.total_seconds())
+            try:
+                data, signed_at = self.get_signing_serializer(app).loads(
+                    token, max_age=max_age, return_timestamp=True
+                )
+            except BadSignature:
+                return None
+            remaining = max_age - (time.time() - signed_at.timestamp())
+            if remaining > 0:
+                self._verified.set(token, data, ttl=remaining)
+        return copy.deepcopy(data)
+
+    def stats(self):
+        """获取缓存统计信息"""
+        return self._verified.stats()
+
+
+class ServerSideSession(SecureCookieSession):
+    """
+    服务端会话
+
+    属性:
+        sid: 会话ID（新会话在首次保存时生成）
+        expires_at: 会话在存储中的过期时间（时间戳）
+    """
+
+    def __init__(self, initial=None, sid=None, expires_at=0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.previous_sid = None
+
+    def regenerate(self):
+        """更换会话ID（登录时调用，防止会话固定攻击），旧ID在保存时作废"""
+        if self.sid and not self.previous_sid:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+def regenerate_session(session):
+    """
+    更换会话ID；签名Cookie会话每次修改都会生成新的Cookie，无需处理
+
+    参数:
+        session: Flask session
+    """
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+class SQLiteSessionStore:
+    """
+    SQLite会话存储
+
+    参数:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+
+    def load(self, sid):
+        """
+        读取会话
+
+        返回:
+            tuple: (序列化后的会话数据, 过期时间, 版本)；不存在或已过期时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())
+            ).fetchone()
+        return (row[0], row[1], row[1]) if row else None
+
+    def version(self, sid):
+        """
+        获取会话的版本（每次保存都会更新的过期时间），不读取数据
+
+        返回:
+            会话版本；不存在或已过期时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, expires_at):
+        """保存会话，返回保存后的版本"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)', (sid, data, expires_at)
+            )
+        return expires_at
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self):
+        """
+        删除已过期的会话
+
+        返回:
+            int: 删除的会话数
+        """
+        with self._lock:
+            return self._conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class FileSessionStore:
+    """
+    分片文件会话存储：每个会话一个文件，按会话ID前两个字符分到子目录，
+    文件修改时间设为会话过期时间，清理时只需读取目录项不必打开文件
+
+    参数:
+        directory: 存储目录
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid[:2], sid)
+
+    @staticmethod
+    def _version(stat):
+        """文件的版本：每次保存都写入新文件再替换，inode和修改时间随之变化"""
+        return stat.st_ino, stat.st_mtime_ns
+
+    def load(self, sid):
+        """
+        读取会话
+
+        返回:
+            tuple: (序列化后的会话数据, 过期时间, 版本)；不存在或已过期时返回None
+        """
+        path = self._path(sid)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                version = self._version(os.fstat(f.fileno()))
+                expires_at = float(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if expires_at <= time.time():
+            self.delete(sid)
+            return None
+        return data, expires_at, version
+
+    def version(self, sid):
+        """
+        获取会话的版本（只读取文件状态，不读取数据）
+
+        返回:
+            会话版本；不存在或已过期时返回None
+        """
+        try:
+            stat = os.stat(self._path(sid))
+        except OSError:
+            return None
+        # 文件修改时间即会话过期时间
+        if stat.st_mtime <= time.time():
+            return None
+        return self._version(stat)
+
+    def save(self, sid, data, expires_at):
+        """保存会话，返回保存后的版本"""
+        path = self._path(sid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，读取方不会读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{expires_at}\n')
+            f.write(data)
+        os.utime(tmp_path, (expires_at, expires_at))
+        # 在替换之前取版本，替换之后其他进程的写入会产生新的版本
+        version = self._version(os.stat(tmp_path))
+        os.replace(tmp_path, path)
+        return version
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """
+        删除已过期的会话文件
+
+        返回:
+            int: 删除的会话数
+        """
+        now = time.time()
+        removed = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    if entry.stat().st_mtime <= now:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    服务端会话接口：Cookie中只保存不透明的会话ID
+
+    参数:
+        store: 会话存储（SQLiteSessionStore或FileSessionStore）
+        max_entries: 进程内LRU缓存最多缓存的会话数
+        cache_ttl: 进程内缓存的过期时间（秒）；缓存命中时都会向存储确认版本，
+                   其他进程修改或作废的会话不会被继续使用
+    """
+    session_class = ServerSideSession
+    serializer = session_json_serializer
+
+    def __init__(self, store, max_entries=1024, cache_ttl=60):
+        self.store = store
+        self._cache = LRUCache(max_entries=max_entries, ttl=cache_ttl)
+
+    def _load(self, sid):
+        """
+        从缓存或存储读取会话，返回(会话数据, 过期时间)或None
+
+        缓存命中时向存储确认版本：会话已被其他进程作废时返回None，已被其他进程改写时重新读取
+        """
+        if not sid or not _SID_RE.fullmatch(sid):
+            return None
+        entry = self._cache.get(sid)
+        if entry is not None:
+            version = self.store.version(sid)
+            if version is None:
+                self._cache.delete(sid)
+                return None
+            if version != entry[2]:
+                entry = None
+        if entry is None:
+            stored = self.store.load(sid)
+            if stored is None:
+                self._cache.delete(sid)
+                return None
+            data, expires_at, version = stored
+            entry = (self.serializer.loads(data), expires_at, version)
+            self._cache.set(sid, entry)
+        if entry[1] <= time.time():
+            self._cache.delete(sid)
+            return None
+        return entry[0], entry[1]
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        entry = self._load(sid)
+        if entry is None:
+            # 未知或已过期的会话ID不再沿用，保存时生成新的ID
+            return self.session_class()
+        data, expires_at = entry
+        return self.session_class(copy.deepcopy(data), sid=sid, expires_at=expires_at)
+
+    def load_token(self, app, token):
+        """
+        根据会话ID读取会话数据（用于URL中传递的token）
+
+        返回:
+            dict: 会话数据的副本；会话不存在或已过期时返回None
+        """
+        entry = self._load(token)
+        return copy.deepcopy(entry[0]) if entry else None
+
+    def revoke(self, sid):
+        """作废会话（登出、更换会话ID时调用）"""
+        self._cache.delete(sid)
+        self.store.delete(sid)
+
+    def sweep(self):
+        """清理存储中已过期的会话，返回删除的会话数"""
+        return self.store.sweep()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid:
+            self.revoke(session.previous_sid)
+            session.previous_sid = None
+
+        # 会话被清空（例如登出）时删除存储中的会话和Cookie
+        if not session:
+            if session.modified and session.sid:
+                self.revoke(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        # 未修改的会话在剩余有效期不足一半时才续期，避免每个请求都写存储
+        if not session.modified and session.sid and session.expires_at - now > lifetime / 2:
+            return
+
+        if not session.sid:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        data = dict(session)
+        version = self.store.save(session.sid, self.serializer.dumps(data), session.expires_at)
+        self._cache.set(session.sid, (copy.deepcopy(data), session.expires_at, version))
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add('Cookie')
+
+    def stats(self):
+        """获取缓存统计信息"""
+        return self._cache.stats()
+
+
+def create_session_interface(app):
+    """
+    根据SESSION_TYPE配置创建会话接口
+
+    参数:
+        app: Flask应用
+
+    返回:
+        SessionInterface: cookie返回签名Cookie会话接口，filesystem/sqlite返回服务端会话接口
+    """
+    session_type = (app.config.get('SESSION_TYPE') or 'cookie').lower()
+    max_entries = app.config.get('SESSION_CACHE_MAX_ENTRIES', 1024)
+    if session_type == 'sqlite':
+        store = SQLiteSessionStore(app.config['SESSION_SQLITE_PATH'])
+    elif session_type == 'filesystem':
+        store = FileSessionStore(app.config['SESSION_FILE_DIR'])
+    else:
+        return CachingSessionInterface(max_entries=max_entries)
+    return ServerSideSessionInterface(
+        store,
+        max_entries=max_entries,
+        cache_ttl=app.config.get('SESSION_CACHE_TTL', 60)
+    )
@@ -0,0 +1,170 @@
+# 用户名/姓名自动补全模块
+# 进程内前缀索引：所有用户名和姓名（以及姓名中空格分隔的各部分）转小写后与用户ID一起保存在有序列表中，
+# 查询时用bisect定位前缀的起始位置，顺序读取到前缀不再匹配为止，不执行SQL
+#
+# 首次查询时从数据库加载，用户的增删改由user_routes等接口在事务提交后增量更新；
+# 其他进程的修改依赖定期在后台线程中重新加载
+import time
+import bisect
+import threading
+
+
+def _index_keys(username, name):
+    """用户的索引键：用户名、姓名以及姓名中空格分隔的各部分（小写）"""
+    keys = set()
+    for value in (username, name):
+        if value:
+            value = value.casefold()
+            keys.add(value)
+            keys.update(part for part in value.split() if part)
+    return keys
+
+
+class PrefixIndex:
+    """
+    线程安全的用户前缀索引
+
+    参数:
+        refresh_interval: 从数据库重新加载的间隔（秒），用于同步其他进程的修改
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # 保证同一时间只有一个加载在进行
+        self._reload_lock = threading.Lock()
+        # 有序列表，元素为(索引键, 用户ID)
+        self._keys = []
+        # 用户ID -> (用户名, 姓名)
+        self._users = {}
+        self._loaded_at = None
+        # 重新加载期间的增量修改，加载完成后重放到新索引上
+        self._journal = None
+        self._reloads = 0
+
+    def _apply(self, keys, users, user_id, username=None, name=None, remove=False):
+        """在指定的索引数据上更新一个用户（调用方需持有锁或独占数据）"""
+        old = users.pop(user_id, None)
+        if old is not None:
+            for key in _index_keys(*old):
+                position = bisect.bisect_left(keys, (key, user_id))
+                if position < len(keys) and keys[position] == (key, user_id):
+                    del keys[position]
+        if not remove:
+            users[user_id] = (username, name)
+            for key in _index_keys(username, name):
+                bisect.insort(keys, (key, user_id))
+
+    def upsert(self, user_id, username, name=None):
+        """
+        添加或更新用户
+
+        参数:
+            user_id: 用户ID
+            username: 用户名
+            name: 姓名
+        """
+        with self._lock:
+            self._apply(self._keys, self._users, user_id, username, name)
+            if self._journal is not None:
+                self._journal.append((user_id, username, name, False))
+
+    def remove(self, *user_ids):
+        """删除用户"""
+        with self._lock:
+            for user_id in user_ids:
+                self._apply(self._keys, self._users, user_id, remove=True)
+                if self._journal is not None:
+                    self._journal.append((user_id, None, None, True))
+
+    def reload(self):
+        """从数据库重新加载全部用户（需要在应用上下文中调用）"""
+        with self._reload_lock:
+            self._reload()
+
+    def _reload(self):
+        from app.utils import stream_db_query
+        with self._lock:
+            self._journal = []
+        try:
+            users = {}
+            entries = []
+            # 从主库读取：从库的复制延迟会让加载期间之前提交的修改丢失（日志只记录加载开始后的修改）
+            for row in stream_db_query('SELECT id, username, name FROM users', primary=True):
+                users[row['id']] = (row['username'], row['name'])
+                entries.extend((key, row['id']) for key in _index_keys(row['username'], row['name']))
+            entries.sort()
+            with self._lock:
+                for user_id, username, name, remove in self._journal:
+                    self._apply(entries, users, user_id, username, name, remove)
+                self._keys, self._users = entries, users
+                self._loaded_at = time.monotonic()
+                self._reloads += 1
+        finally:
+            with self._lock:
+                self._journal = None
+
+    def _refresh_in_background(self):
+        from app import app
+        try:
+            with app.app_context():
+                self.reload()
+        except Exception as e:
+            app.logger.error(f'重新加载用户前缀索引失败: {e}')
+
+    def _ensure_fresh(self):
+        """首次使用时同步加载；超过刷新间隔时在后台线程中重新加载，期间继续使用旧索引"""
+        if self._loaded_at is None:
+            with self._reload_lock:
+                if self._loaded_at is None:
+                    self._reload()
+            return
+        if time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._journal is not None or time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            # 推迟下一次检查，避免在后台加载开始前重复启动
+            self._loaded_at = time.monotonic()
+        threading.Thread(target=self._refresh_in_background, name='suggest-reload', daemon=True).start()
+
+    def suggest(self, prefix, limit=10):
+        """
+        查找用户名或姓名以prefix开头的用户
+
+        参数:
+            prefix: 前缀（不区分大小写）
+            limit: 最多返回的用户数
+
+        返回:
+            list: 用户字典列表（id、username、name），按匹配到的索引键排序
+        """
+        prefix = (prefix or '').strip().casefold()
+        if not prefix or limit <= 0:
+            return []
+        self._ensure_fresh()
+        results = []
+        seen = set()
+        with self._lock:
+            keys = self._keys
+            position = bisect.bisect_left(keys, (prefix,))
+            while position < len(keys) and len(results) < limit:
+                key, user_id = keys[position]
+                if not key.startswith(prefix):
+                    break
+                if user_id not in seen:
+                    seen.add(user_id)
+                    username, name = self._users[user_id]
+                    results.append({'id': user_id, 'username': username, 'name': name})
+                position += 1
+        return results
+
+    def stats(self):
+        """获取索引统计信息"""
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'keys': len(self._keys),
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+                'reloads': self._reloads,
+            }
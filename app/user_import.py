@@ -0,0 +1,246 @@
+# 批量导入用户模块
+# 流式读取CSV或NDJSON，按块处理：每块用一条IN查询检查用户名是否已存在，
+# 密码哈希在进程池中并行计算，用多行INSERT写入；逐行返回错误，整个导入只记录一条审计日志
+import io
+import csv
+import json
+import unicodedata
+
+import MySQLdb
+
+from app import app, permission_resolver, user_suggest_index
+from app.utils import execute_db_query, execute_db_many, transaction, after_commit
+from app.passwords import hash_passwords
+
+# 导入的字段及最大长度（与users表定义一致，超长的行单独报错，不让整块写入失败）
+IMPORT_FIELDS = (
+    ('username', 50),
+    ('password', None),
+    ('name', 50),
+    ('email', 100),
+    ('phone', 20),
+    ('gender', 10),
+    ('role', 20),
+)
+
+_INSERT_QUERY = (
+    "INSERT INTO users (username, password, name, email, phone, gender, role, avatar) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+)
+
+
+def _username_key(username):
+    """
+    用户名的比较键：users表的排序规则不区分大小写和重音，按同样的规则折叠后再比较
+
+    参数:
+        username: 用户名
+
+    返回:
+        str: 比较键
+    """
+    decomposed = unicodedata.normalize('NFKD', username.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).rstrip()
+
+
+class ImportFormatError(ValueError):
+    """导入文件格式错误（整个文件无法导入）"""
+
+
+def detect_format(fmt, mimetype, filename=None):
+    """
+    确定导入文件格式
+
+    参数:
+        fmt: format参数（csv或ndjson，可选）
+        mimetype: 请求或上传文件的Content-Type
+        filename: 上传文件名（可选）
+
+    返回:
+        str: csv或ndjson
+    """
+    fmt = (fmt or '').lower()
+    if fmt in ('csv', 'ndjson'):
+        return fmt
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        return 'ndjson'
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_import_rows(stream, fmt):
+    """
+    逐行读取导入数据
+
+    参数:
+        stream: 二进制输入流
+        fmt: csv或ndjson
+
+    返回:
+        生成器，每项为(行号, 行数据字典, 解析错误)
+
+    异常:
+        ImportFormatError: CSV缺少表头或必需的列
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None, '不是有效的JSON'
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, '每行必须是JSON对象'
+                continue
+            yield line_no, row, None
+        return
+
+    reader = csv.DictReader(text)
+    if not reader.fieldnames or not {'username', 'password'} <= {name.strip() for name in reader.fieldnames}:
+        raise ImportFormatError('CSV文件缺少表头或username、password列')
+    reader.fieldnames = [name.strip() for name in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def _validate(row):
+    """校验一行数据，返回(用户字段元组, 错误信息)"""
+    values = {}
+    for field, max_length in IMPORT_FIELDS:
+        value = row.get(field)
+        value = '' if value is None else str(value).strip()
+        if max_length and len(value) > max_length:
+            return None, f'{field}长度不能超过{max_length}个字符'
+        values[field] = value
+    if not values['username'] or not values['password']:
+        return None, '用户名和密码不能为空'
+    if len(values['password']) < 6:
+        return None, '密码长度至少为6位'
+    values['role'] = values['role'] or '普通用户'
+    return tuple(values[field] for field, _ in IMPORT_FIELDS), None
+
+
+class UserImport:
+    """
+    一次批量导入的状态和结果
+
+    参数:
+        chunk_rows: 每块处理的行数
+        max_errors: 结果中最多返回的错误行数（失败行数仍全部统计）
+    """
+
+    def __init__(self, chunk_rows=1000, max_errors=1000):
+        self.chunk_rows = chunk_rows
+        self.max_errors = max_errors
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._seen = set()
+
+    def _error(self, line, username, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'username': username, 'error': message})
+
+    def run(self, rows):
+        """
+        导入全部行
+
+        参数:
+            rows: iter_import_rows返回的生成器
+        """
+        chunk = []
+        for line, row, parse_error in rows:
+            self.total += 1
+            if parse_error:
+                self._error(line, None, parse_error)
+                continue
+            user, error = _validate(row)
+            if error is None and _username_key(user[0]) in self._seen:
+                error = '导入数据中用户名重复'
+            if error:
+                self._error(line, row.get('username'), error)
+                continue
+            self._seen.add(_username_key(user[0]))
+            chunk.append((line, user))
+            if len(chunk) >= self.chunk_rows:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+
+    def _drop_existing(self, chunk):
+        """用一条查询找出数据库中已存在的用户名（在主库上读取），记录错误并返回剩余的行"""
+        usernames = [user[0] for _, user in chunk]
+        query = "SELECT username FROM users WHERE username IN (%s)" % ','.join(['%s'] * len(usernames))
+        # 从库可能还没有刚创建的用户，在主库的只读事务中检查
+        with transaction(read_only=True):
+            existing = {_username_key(row['username']) for row in execute_db_query(query, usernames)}
+        remaining = []
+        for line, user in chunk:
+            if _username_key(user[0]) in existing:
+                self._error(line, user[0], '用户名已存在')
+            else:
+                remaining.append((line, user))
+        return remaining
+
+    def _insert(self, chunk, hashes):
+        """在一个事务中写入多行，提交后更新权限缓存和自动补全索引"""
+        rows = [
+            (username, hashes[username], name, email, phone, gender, role, '1.png')
+            for _, (username, _, name, email, phone, gender, role) in chunk
+        ]
+        usernames = [row[0] for row in rows]
+        with transaction():
+            execute_db_many(_INSERT_QUERY, rows)
+            query = "SELECT id, username, name FROM users WHERE username IN (%s)" % ','.join(['%s'] * len(usernames))
+            created = execute_db_query(query, usernames)
+            # 丢弃同名用户（已删除）遗留的角色缓存，提交后加入自动补全索引
+            permission_resolver.invalidate_user(*usernames)
+            for user in created:
+                after_commit(user_suggest_index.upsert, user['id'], user['username'], user['name'])
+        self.imported += len(rows)
+
+    def _import_chunk(self, chunk):
+        chunk = self._drop_existing(chunk)
+        if not chunk:
+            return
+        # 在事务外并行计算哈希，不在计算期间占用事务
+        hashes = dict(zip((user[0] for _, user in chunk), hash_passwords([user[1] for _, user in chunk])))
+
+        try:
+            self._insert(chunk, hashes)
+            return
+        except MySQLdb.IntegrityError as e:
+            # 检查之后其他请求创建了同名用户：整块已回滚，重新检查后再试一次
+            app.logger.info(f'批量导入用户时用户名冲突，重新检查后重试: {e}')
+        chunk = self._drop_existing(chunk)
+        if not chunk:
+            return
+        try:
+            self._insert(chunk, hashes)
+            return
+        except MySQLdb.IntegrityError as e:
+            app.logger.info(f'批量导入用户时用户名再次冲突，改为逐行写入: {e}')
+
+        # 仍有冲突时逐行写入，只有冲突的行失败
+        for line, user in chunk:
+            try:
+                self._insert([(line, user)], hashes)
+            except MySQLdb.IntegrityError:
+                self._error(line, user[0], '用户名已存在')
+
+    def result(self):
+        """导入结果"""
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+            'errors_truncated': self.failed > len(self.errors),
+        }
@@ -1,9 +1,13 @@
 from flask import render_template, request, jsonify, session
-from app import app, csrf
-from app.utils import make_json_response, get_request_data, execute_db_query, log_audit
+from app import app, csrf, permission_resolver, user_suggest_index
+from app.utils import make_json_response, get_request_data, execute_db_query, log_audit, transaction, after_commit, invalidate_user_profile
 from app.decorators import is_logged_in, requires_permission
-from passlib.hash import sha256_crypt
+from app.pagination import encode_cursor, decode_cursor, seek_condition, parse_count_mode, count_rows
+from app.search import keyword_condition, column_condition, relevance_order
+from app.user_import import UserImport, ImportFormatError, detect_format, iter_import_rows
+from app.passwords import hash_password
 import os
+import MySQLdb
 from werkzeug.utils import secure_filename
 
 # 用户管理页面 - Web界面
@@ -21,7 +25,11 @@ def get_users_api():
     # 获取请求参数
     page = int(request.args.get('page', 1))
     # 同时支持page_size和pageSize参数，确保前端兼容性
-    page_size = int(request.args.get('page_size', request.args.get('pageSize', 10)))
+    page_size = max(1, int(request.args.get('page_size', request.args.get('pageSize', 10))))
+    # 传入cursor参数（第一页为空字符串）时使用游标分页，默认不计算总数
+    cursor = request.args.get('cursor')
+    # 总数计算方式：exact、estimate、none，未指定时根据表大小选择
+    count_mode = parse_count_mode(request.args.get('count'), default='auto' if cursor is None else 'none')
     search = request.args.get('search', '')
     username = request.args.get('username', '')
     name = request.args.get('name', '')
@@ -29,9 +37,12 @@ def get_users_api():
     sort_by = request.args.get('sortBy', 'created_at')
     sort_order = request.args.get('sortOrder', 'desc')
     
+    # 按相关度排序（sortBy=relevance）只用于页码分页下的关键词搜索
+    relevance = relevance_order(search) if search and sort_by == 'relevance' and cursor is None else None
+    
     # 验证排序字段，防止SQL注入
     allowed_sort_fields = ['id', 'username', 'name', 'email', 'phone', 'gender', 'role', 'created_at']
-    if sort_by not in allowed_sort_fields:
+    if sort_by not in allowed_sort_fields and not relevance:
         sort_by = 'created_at'
     
     # 验证排序顺序，防止SQL注入
@@ -43,48 +54,110 @@ def get_users_api():
     where_clause = "WHERE 1=1"
     params = []
     
+    # 关键词搜索使用全文索引（关键词过短时回退到LIKE）
     if search:
-        where_clause += " AND (username LIKE %s OR name LIKE %s OR email LIKE %s)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param, search_param])
+        condition, search_params = keyword_condition(search)
+        where_clause += f" AND {condition}"
+        params.extend(search_params)
     
     # 处理独立的搜索条件
     if username:
-        where_clause += " AND username LIKE %s"
-        params.append(f"%{username}%")
+        condition, search_params = column_condition('username', username)
+        where_clause += f" AND {condition}"
+        params.extend(search_params)
     
     if name:
-        where_clause += " AND name LIKE %s"
-        params.append(f"%{name}%")
+        condition, search_params = column_condition('name', name)
+        where_clause += f" AND {condition}"
+        params.extend(search_params)
     
     if role:
         where_clause += " AND role = %s"
         params.append(role)
     
+    # 排序字段相同时按id排序，保证顺序稳定（游标分页依赖这一点）
+    order_params = []
+    if relevance:
+        order_clause, order_params = relevance
+    elif sort_by == 'id':
+        order_clause = f"{sort_by} {sort_order}"
+    else:
+        order_clause = f"{sort_by} {sort_order}, id {sort_order}"
+    
+    if cursor is not None:
+        # 总数按筛选条件计算，不包含游标定位条件
+        total, count_mode = count_rows('users', where_clause, params, count_mode)
+        
+        # 游标分页：从上一页最后一行之后定位，每页开销与页数无关
+        if cursor:
+            try:
+                last_value, last_id = decode_cursor(cursor, sort_by, sort_order)
+            except ValueError as e:
+                return make_json_response(400, str(e), status_code=400)
+            condition, seek_params = seek_condition(sort_by, sort_order, last_value, last_id)
+            where_clause += f" AND {condition}"
+            params.extend(seek_params)
+        
+        # 多取一行用于判断是否还有下一页
+        users_query = f"SELECT id, username, name, email, phone, gender, role, created_at FROM users {where_clause} ORDER BY {order_clause} LIMIT %s"
+        params.append(page_size + 1)
+        users = execute_db_query(users_query, params, compact=True)
+        
+        has_more = len(users) > page_size
+        users = users[:page_size]
+        next_cursor = encode_cursor(sort_by, sort_order, users[-1][sort_by], users[-1]['id']) if has_more else None
+        
+        data = {
+            'users': users,
+            'has_more': has_more,
+            'next_cursor': next_cursor
+        }
+        if total is not None:
+            data.update(total=total, count_mode=count_mode)
+        return make_json_response(200, '获取用户列表成功', data)
+    
     # 获取总数
-    count_query = f"SELECT COUNT(*) as count FROM users {where_clause}"
-    total = execute_db_query(count_query, params, fetch_one=True)['count']
+    total, count_mode = count_rows('users', where_clause, params, count_mode)
     
     # 计算分页偏移量
     offset = (page - 1) * page_size
     
     # 获取用户列表 - 排除password字段
-    users_query = f"SELECT id, username, name, email, phone, gender, role, created_at FROM users {where_clause} ORDER BY {sort_by} {sort_order} LIMIT %s OFFSET %s"
-    params.extend([page_size, offset])
-    users = execute_db_query(users_query, params)
+    users_query = f"SELECT id, username, name, email, phone, gender, role, created_at FROM users {where_clause} ORDER BY {order_clause} LIMIT %s OFFSET %s"
+    params.extend(order_params + [page_size, offset])
+    users = execute_db_query(users_query, params, compact=True)
     
     # 格式化用户数据 - 不再处理permissions字段
     
-    # 计算总页数
-    total_pages = (total + page_size - 1) // page_size
+    # 计算总页数（不计算总数时为None）
+    total_pages = (total + page_size - 1) // page_size if total is not None else None
     
     # 返回分页数据
     return make_json_response(200, '获取用户列表成功', {
         'total': total,
         'total_pages': total_pages,
+        'count_mode': count_mode,
         'users': users
     })
 
+# 用户自动补全API - RESTful接口
+@app.route('/api/users/suggest', methods=['GET'])
+@is_logged_in
+@requires_permission('用户管理')
+def suggest_users_api():
+    # 获取请求参数
+    q = request.args.get('q', '')
+    max_results = app.config.get('SUGGEST_MAX_RESULTS', 20)
+    try:
+        limit = min(max(1, int(request.args.get('limit', 10))), max_results)
+    except ValueError:
+        return make_json_response(400, 'limit参数必须是整数', status_code=400)
+    
+    # 从进程内前缀索引中查找用户名或姓名以q开头的用户，不查询数据库
+    users = user_suggest_index.suggest(q, limit)
+    
+    return make_json_response(200, '获取用户建议成功', {'users': users})
+
 # 获取单个用户API - RESTful接口
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 @is_logged_in
@@ -125,32 +198,89 @@ def create_user_api():
     if len(password) < 6:
         return make_json_response(400, '密码长度至少为6位', status_code=400)
     
-    # 检查用户名是否已存在
-    existing_user = execute_db_query('SELECT * FROM users WHERE username = %s', [username], fetch_one=True)
-    if existing_user:
+    # 密码加密（在事务外计算，不在哈希期间占用事务和连接）
+    hashed_password = hash_password(password)
+    
+    # 检查、插入、回查和审计日志在同一个事务中完成，只提交一次
+    try:
+        with transaction():
+            # 检查用户名是否已存在
+            existing_user = execute_db_query('SELECT * FROM users WHERE username = %s', [username], fetch_one=True)
+            if existing_user:
+                return make_json_response(400, '用户名已存在', status_code=400)
+            
+            # 创建新用户，默认头像使用static/uploads/1.png
+            query = "INSERT INTO users (username, password, name, email, phone, gender, role, avatar) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+            params = (username, hashed_password, name, email, phone, gender, role, '1.png')
+            execute_db_query(query, params, commit=True)
+            # 丢弃同名用户（已删除）遗留的角色缓存
+            permission_resolver.invalidate_user(username)
+            
+            # 获取新创建的用户信息
+            new_user = execute_db_query('SELECT * FROM users WHERE username = %s', [username], fetch_one=True)
+            # 事务提交后加入自动补全索引
+            after_commit(user_suggest_index.upsert, new_user['id'], username, name)
+            
+            # 记录创建用户的审计日志
+            log_audit(
+                user_id=session.get('user_id'),
+                username=session.get('username'),
+                action='创建用户',
+                target=f'用户:{username}',
+                details={'result': '成功'}
+            )
+    except MySQLdb.IntegrityError:
+        # 检查之后其他请求创建了同名用户，唯一索引拒绝插入，事务已回滚
         return make_json_response(400, '用户名已存在', status_code=400)
     
-    # 密码加密
-    hashed_password = sha256_crypt.encrypt(password)
+    return make_json_response(201, '用户创建成功', status_code=201)
+
+# 批量导入用户API - RESTful接口
+@app.route('/api/users/import', methods=['POST'])
+@csrf.exempt  # 添加CSRF豁免
+@is_logged_in
+@requires_permission('用户管理')
+def import_users_api():
+    # 支持直接上传文件内容（text/csv、application/x-ndjson）或multipart/form-data中的file字段
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            return make_json_response(400, '未选择导入文件', status_code=400)
+        stream, fmt = file.stream, detect_format(request.args.get('format'), file.mimetype, file.filename)
+    else:
+        stream, fmt = request.stream, detect_format(request.args.get('format'), request.mimetype)
     
-    # 创建新用户，默认头像使用static/uploads/1.png
-    query = "INSERT INTO users (username, password, name, email, phone, gender, role, avatar) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-    params = (username, hashed_password, name, email, phone, gender, role, '1.png')
-    execute_db_query(query, params, commit=True)
+    # 流式读取并按块导入
+    importer = UserImport(
+        chunk_rows=app.config.get('USER_IMPORT_CHUNK_ROWS', 1000),
+        max_errors=app.config.get('USER_IMPORT_MAX_ERRORS', 1000)
+    )
+    try:
+        importer.run(iter_import_rows(stream, fmt))
+    except ImportFormatError as e:
+        return make_json_response(400, str(e), status_code=400)
     
-    # 获取新创建的用户信息
-    new_user = execute_db_query('SELECT * FROM users WHERE username = %s', [username], fetch_one=True)
+    result = importer.result()
+    if result['total'] == 0:
+        return make_json_response(400, '导入文件中没有数据', status_code=400)
     
-    # 记录创建用户的审计日志
+    # 整个导入只记录一条审计日志
     log_audit(
         user_id=session.get('user_id'),
         username=session.get('username'),
-        action='创建用户',
-        target=f'用户:{username}',
-        details={'result': '成功'}
+        action='批量导入用户',
+        target=f'用户:{result["imported"]}个',
+        details={
+            'result': '成功' if result['imported'] else '失败',
+            'reason': '' if result['imported'] else '没有导入任何用户',
+            'format': fmt,
+            'total': result['total'],
+            'imported': result['imported'],
+            'failed': result['failed']
+        }
     )
     
-    return make_json_response(201, '用户创建成功', status_code=201)
+    return make_json_response(200, f'导入完成：成功{result["imported"]}个，失败{result["failed"]}个', result)
 
 # 更新用户API - RESTful接口
 @app.route('/api/users/<int:user_id>', methods=['PUT'])
@@ -166,24 +296,30 @@ def update_user_api(user_id):
     gender = data.get('gender', '')
     role = data.get('role', '普通用户')
     
-    # 检查用户是否存在
-    user = execute_db_query('SELECT * FROM users WHERE id = %s', [user_id], fetch_one=True)
-    if not user:
-        return make_json_response(404, '用户不存在', status_code=404)
-    
-    # 更新用户信息
-    query = "UPDATE users SET name = %s, email = %s, phone = %s, gender = %s, role = %s WHERE id = %s"
-    params = (name, email, phone, gender, role, user_id)
-    execute_db_query(query, params, commit=True)
-    
-    # 记录更新用户的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='更新用户',
-        target=f'用户:{user["username"]}',
-        details={'result': '成功'}
-    )
+    # 检查、更新和审计日志在同一个事务中完成
+    with transaction():
+        # 检查用户是否存在
+        user = execute_db_query('SELECT * FROM users WHERE id = %s', [user_id], fetch_one=True)
+        if not user:
+            return make_json_response(404, '用户不存在', status_code=404)
+        
+        # 更新用户信息
+        query = "UPDATE users SET name = %s, email = %s, phone = %s, gender = %s, role = %s WHERE id = %s"
+        params = (name, email, phone, gender, role, user_id)
+        execute_db_query(query, params, commit=True)
+        # 用户的角色可能已被修改
+        permission_resolver.invalidate_user(user['username'])
+        invalidate_user_profile(user_id)
+        after_commit(user_suggest_index.upsert, user_id, user['username'], name)
+        
+        # 记录更新用户的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='更新用户',
+            target=f'用户:{user["username"]}',
+            details={'result': '成功'}
+        )
     
     return make_json_response(200, '用户更新成功')
 
@@ -193,27 +329,32 @@ def update_user_api(user_id):
 @is_logged_in
 @requires_permission('用户管理')
 def delete_user_api(user_id):
-    # 检查用户是否存在
-    user = execute_db_query('SELECT * FROM users WHERE id = %s', [user_id], fetch_one=True)
-    if not user:
-        return make_json_response(404, '用户不存在', status_code=404)
-    
-    # 禁止删除自己
-    if user_id == session.get('user_id'):
-        return make_json_response(400, '不能删除自己', status_code=400)
-    
-    # 删除用户
-    query = "DELETE FROM users WHERE id = %s"
-    execute_db_query(query, [user_id], commit=True)
-    
-    # 记录删除用户的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='删除用户',
-        target=f'用户:{user["username"]}',
-        details={'result': '成功'}
-    )
+    # 检查、删除和审计日志在同一个事务中完成
+    with transaction():
+        # 检查用户是否存在
+        user = execute_db_query('SELECT * FROM users WHERE id = %s', [user_id], fetch_one=True)
+        if not user:
+            return make_json_response(404, '用户不存在', status_code=404)
+        
+        # 禁止删除自己
+        if user_id == session.get('user_id'):
+            return make_json_response(400, '不能删除自己', status_code=400)
+        
+        # 删除用户
+        query = "DELETE FROM users WHERE id = %s"
+        execute_db_query(query, [user_id], commit=True)
+        permission_resolver.invalidate_user(user['username'])
+        invalidate_user_profile(user_id)
+        after_commit(user_suggest_index.remove, user_id)
+        
+        # 记录删除用户的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='删除用户',
+            target=f'用户:{user["username"]}',
+            details={'result': '成功'}
+        )
     
     return make_json_response(200, '用户删除成功')
 
@@ -234,25 +375,30 @@ def bulk_delete_users_api():
     if session.get('user_id') in user_ids:
         return make_json_response(400, '不能删除自己', status_code=400)
     
-    # 获取所有要删除的用户信息
-    users_query = "SELECT username FROM users WHERE id IN (%s)" % (','.join(['%s'] * len(user_ids)))
-    users = execute_db_query(users_query, user_ids)  # fetch_one默认为False，会获取所有结果
-    
-    # 提取用户名列表
-    usernames = [user['username'] for user in users]
-    
-    # 批量删除用户
-    query = "DELETE FROM users WHERE id IN (%s)" % ','.join(['%s'] * len(user_ids))
-    execute_db_query(query, user_ids, commit=True)
-    
-    # 记录批量删除用户的审计日志
-    log_audit(
-        user_id=session.get('user_id'),
-        username=session.get('username'),
-        action='批量删除用户',
-        target=f'用户:{"，".join(usernames)}',
-        details={'result': '成功', 'count': len(user_ids), 'usernames': usernames}
-    )
+    # 查询、删除和审计日志在同一个事务中完成
+    with transaction():
+        # 获取所有要删除的用户信息
+        users_query = "SELECT username FROM users WHERE id IN (%s)" % (','.join(['%s'] * len(user_ids)))
+        users = execute_db_query(users_query, user_ids)  # fetch_one默认为False，会获取所有结果
+        
+        # 提取用户名列表
+        usernames = [user['username'] for user in users]
+        
+        # 批量删除用户
+        query = "DELETE FROM users WHERE id IN (%s)" % ','.join(['%s'] * len(user_ids))
+        execute_db_query(query, user_ids, commit=True)
+        permission_resolver.invalidate_user(*usernames)
+        invalidate_user_profile(*user_ids)
+        after_commit(user_suggest_index.remove, *user_ids)
+        
+        # 记录批量删除用户的审计日志
+        log_audit(
+            user_id=session.get('user_id'),
+            username=session.get('username'),
+            action='批量删除用户',
+            target=f'用户:{"，".join(usernames)}',
+            details={'result': '成功', 'count': len(user_ids), 'usernames': usernames}
+        )
     
     return make_json_response(200, '批量删除用户成功')
 
@@ -279,7 +425,7 @@ def reset_password_api(user_id):
         return make_json_response(404, '用户不存在', status_code=404)
     
     # 密码加密
-    hashed_password = sha256_crypt.encrypt(new_password)
+    hashed_password = hash_password(new_password)
     
     # 更新密码
     query = "UPDATE users SET password = %s WHERE id = %s"
@@ -333,7 +479,7 @@ def bulk_reset_passwords_api():
         usernames = [user['username'] for user in users]
         
         # 密码加密
-        hashed_password = sha256_crypt.encrypt(new_password)
+        hashed_password = hash_password(new_password)
         
         # 批量更新密码
         query = "UPDATE users SET password = %s WHERE id IN (%s)" % ("%s", ','.join(['%s'] * len(user_ids)))
@@ -1,13 +1,16 @@
-from flask import request, jsonify, session, make_response
-from app import mysql, app
+from flask import request, jsonify, session, make_response, g
+from app import mysql, app, query_metrics, query_cache, profile_cache, captcha_pool, captcha_tokens
+from app.query_cache import LRUCache, read_tables, write_tables
+from app.rows import Row, rows_from_cursor
+from app.migrations import upgrade
 import MySQLdb.cursors
 import time
+import logging
 import json
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
-import random
-import string
-import io
+import re
+from contextlib import contextmanager
+from functools import wraps
 from app.common import convert_datetime_fields, json_loads_safe, json_dumps_safe, str_to_bool
 
 # 辅助函数：生成统一格式的JSON响应
@@ -65,35 +68,192 @@ def get_request_data():
     # 将ImmutableMultiDict转换为普通字典以保持一致性
     return dict(request.form) or {}
 
+# 辅助函数：判断当前是否处于显式事务中
+def in_transaction():
+    """当前应用上下文是否处于transaction()开启的显式事务中"""
+    return g.get('_db_transaction_depth', 0) > 0
+
+# 事务上下文管理器
+@contextmanager
+def transaction(read_only=False):
+    """
+    开启一个显式事务（工作单元），with块内的所有execute_db_query共用一个事务，
+    正常退出时提交一次，发生异常时回滚
+
+    连接默认处于自动提交模式，不在事务中的单条语句只需一次往返；
+    需要“先检查再写入”等多语句一致性的场景使用本函数包裹
+    
+    参数:
+        read_only: 是否为只读事务（START TRANSACTION READ ONLY，提供一致性快照且开销更低）
+    
+    用法:
+        with transaction():
+            execute_db_query('SELECT ...')
+            execute_db_query('INSERT ...', params, commit=True)
+    """
+    depth = g.get('_db_transaction_depth', 0)
+    if depth:
+        # 嵌套调用时并入外层事务，由最外层负责提交
+        g._db_transaction_depth = depth + 1
+        try:
+            yield
+        finally:
+            g._db_transaction_depth = depth
+        return
+    
+    conn = mysql.connection
+    # 事务固定在主库上执行，之后本请求内的读取也走主库
+    mysql.mark_primary_sticky()
+    cur = conn.cursor()
+    try:
+        cur.execute('START TRANSACTION READ ONLY' if read_only else 'START TRANSACTION')
+    finally:
+        cur.close()
+    g._db_transaction_depth = 1
+    try:
+        yield
+    except BaseException:
+        g._db_transaction_depth = 0
+        g.pop('_db_pending_tables', None)
+        g.pop('_db_after_commit', None)
+        try:
+            conn.rollback()
+        except Exception:
+            mysql.discard_connection(conn)
+        raise
+    g._db_transaction_depth = 0
+    try:
+        conn.commit()
+    except BaseException:
+        # 提交失败：回滚（连接已断开时丢弃连接），回调不执行
+        try:
+            conn.rollback()
+        except Exception:
+            mysql.discard_connection(conn)
+        raise
+    finally:
+        # 无论提交是否成功都清除本事务的待失效表和回调，不能带入本请求之后的事务
+        pending = g.pop('_db_pending_tables', None)
+        callbacks = g.pop('_db_after_commit', ())
+        # 提交后再次失效事务中写过的表，丢弃事务期间其他请求读入缓存的旧数据；
+        # 提交失败时是否已写入无法确定，同样失效
+        if pending:
+            query_cache.invalidate(pending)
+    for callback, args in callbacks:
+        callback(*args)
+
+# 辅助函数：在当前事务提交后执行回调
+def after_commit(callback, *args):
+    """
+    在当前事务提交后调用callback(*args)（事务回滚时不调用）；不在事务中时立即调用
+    
+    参数:
+        callback: 回调函数（例如使进程内缓存失效）
+        args: 回调参数
+    """
+    if in_transaction():
+        g._db_after_commit = g.get('_db_after_commit', []) + [(callback, args)]
+    else:
+        callback(*args)
+
+# 缓存未命中标记
+_MISSING = object()
+
+# 辅助函数：复制查询结果（缓存中的结果不能被调用方修改）
+def _copy_result(result):
+    if isinstance(result, Row):
+        return result.copy()
+    if isinstance(result, dict):
+        return dict(result)
+    if isinstance(result, list):
+        return [row.copy() if isinstance(row, Row) else dict(row) for row in result]
+    return result
+
+# 辅助函数：写操作后使相关表的缓存失效
+def invalidate_query_cache(query):
+    """
+    根据写语句涉及的表使查询缓存失效；在事务中时记录这些表，提交后再失效一次
+    
+    参数:
+        query: 写操作SQL语句
+    """
+    tables = write_tables(query)
+    if not tables:
+        return
+    query_cache.invalidate(tables)
+    if in_transaction():
+        g._db_pending_tables = g.get('_db_pending_tables', frozenset()) | tables
+
 # 辅助函数：执行数据库查询（自动管理游标）
-def execute_db_query(query, params=None, fetch_one=False, commit=False):
+def execute_db_query(query, params=None, fetch_one=False, commit=False, cache=False, compact=False, primary=False):
     """
     执行数据库查询，自动管理游标和连接
     
+    不在transaction()中时，连接处于自动提交模式，每条语句由服务器自动提交，
+    读查询只有一次往返；在transaction()中时，写操作的提交推迟到事务结束
+    
+    配置了从库时，事务外的只读查询路由到从库；写操作走主库，且之后本请求内的读取也固定走主库。
+    从库连接出错时自动回退到主库重试。用于填充缓存的读取（cache未命中或primary=True）固定走主库，
+    否则从库复制延迟期间读到的旧数据会在写操作使缓存失效之后被重新写入缓存，直到过期
+    
     参数:
         query: SQL查询语句
         params: 查询参数（可选）
         fetch_one: 是否只返回一条结果
-        commit: 是否提交事务
+        commit: 是否为写操作（返回游标以便获取rowcount等属性），执行后使涉及表的缓存失效
+        cache: 是否缓存读查询结果，True使用默认过期时间，也可以传入过期秒数；
+               结果按读取的表打标签，任何写这些表的操作都会使其失效（事务中不使用缓存）
+        compact: 是否返回紧凑行（Row对象：元组存储、共享列名，datetime字段在访问或JSON序列化时才格式化），
+                 适合大列表接口，用法与字典相同
+        primary: 是否固定在主库读取（结果要写入调用方自己的进程内缓存时使用）
     
     返回:
-        查询结果（根据fetch_one返回单个结果或结果列表）
+        查询结果（根据fetch_one返回单个结果或结果列表）；commit=True时返回游标对象
     """
-    cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    if commit:
+        result = _execute_on_connection(mysql.connection, query, params, fetch_one, commit, compact)
+        invalidate_query_cache(query)
+        mysql.mark_primary_sticky()
+        return result
+    
+    if in_transaction():
+        return _execute_on_connection(mysql.connection, query, params, fetch_one, commit, compact)
+    
+    if cache:
+        key = (query, tuple(params) if params else (), fetch_one, compact)
+        cached_result = query_cache.get(key, _MISSING)
+        if cached_result is not _MISSING:
+            return _copy_result(cached_result)
+        tables = read_tables(query)
+        generation = query_cache.generation(tables)
+    
+    result = _MISSING
+    conn = mysql.connection if cache or primary else mysql.read_connection
+    if mysql.is_replica_connection(conn):
+        try:
+            result = _execute_on_connection(conn, query, params, fetch_one, commit, compact)
+        except MySQLdb.OperationalError as e:
+            # 从库不可用，丢弃连接并标记从库下线，回退到主库
+            app.logger.warning("从库查询失败，回退到主库: %s", e)
+            mysql.discard_connection(conn, error=e)
+    if result is _MISSING:
+        result = _execute_on_connection(mysql.connection, query, params, fetch_one, commit, compact)
+    
+    if cache:
+        query_cache.set(key, _copy_result(result), ttl=None if cache is True else cache,
+                        tags=tables, generation=generation)
+    return result
+
+def _execute_on_connection(conn, query, params, fetch_one, commit, compact=False):
+    """在指定连接上执行查询，参数含义同execute_db_query"""
+    cur = conn.cursor(MySQLdb.cursors.Cursor if compact else MySQLdb.cursors.DictCursor)
+    debug = app.logger.isEnabledFor(logging.DEBUG)
+    rows = 0
+    failed = False
+    start = time.perf_counter()
     try:
-        # 记录查询开始日志
-        query_type = query.strip().split()[0].upper() if query.strip() else 'UNKNOWN'
-        app.logger.debug(f"执行数据库查询: {query_type} 查询")
-        app.logger.debug(f"SQL语句: {query}")
-        app.logger.debug(f"参数: {params}")
-        
-        # 对于非提交操作，先检查是否有未提交的事务
-        if not commit:
-            try:
-                mysql.connection.commit()
-                app.logger.debug("自动提交之前的事务")
-            except Exception as e:
-                app.logger.debug(f"自动提交事务失败，可能没有未提交的事务: {e}")
+        if debug:
+            app.logger.debug("执行数据库查询: %s 参数: %s", query, params)
         
         if params:
             cur.execute(query, params)
@@ -101,8 +261,10 @@ def execute_db_query(query, params=None, fetch_one=False, commit=False):
             cur.execute(query)
         
         if commit:
-            mysql.connection.commit()
-            app.logger.debug("事务提交成功")
+            rows = cur.rowcount
+            # 自动提交模式下语句已由服务器提交，只有关闭了自动提交且不在事务中时才需要显式提交
+            if not in_transaction() and not conn.get_autocommit():
+                conn.commit()
             # 返回游标对象，以便获取rowcount等属性
             return cur
         
@@ -110,51 +272,247 @@ def execute_db_query(query, params=None, fetch_one=False, commit=False):
         if fetch_one:
             result = cur.fetchone()
             if result:
-                result = convert_datetime_fields(result)
-            app.logger.debug(f"查询完成，返回1条记录")
+                rows = 1
+                result = rows_from_cursor(cur, [result])[0] if compact else convert_datetime_fields(result)
             return result
         else:
             results = cur.fetchall()
-            if results:
+            rows = len(results)
+            if compact:
+                results = rows_from_cursor(cur, results)
+            elif results:
                 results = convert_datetime_fields(results)
-            app.logger.debug(f"查询完成，返回{len(results) if results else 0}条记录")
+            if debug:
+                app.logger.debug("查询完成，返回%d条记录", rows)
             return results
     except Exception as e:
-        # 发生错误时回滚事务
-        mysql.connection.rollback()
-        app.logger.error(f"数据库查询错误: {str(e)}")
-        app.logger.error(f"SQL语句: {query}")
-        app.logger.error(f"参数: {params}")
-        app.logger.exception("异常堆栈信息")
+        failed = True
+        # 事务中的错误交给transaction()统一回滚
+        if not in_transaction():
+            # 回滚失败说明连接已不可用，直接丢弃
+            try:
+                conn.rollback()
+            except Exception:
+                mysql.discard_connection(conn, error=e)
+        app.logger.error("数据库查询错误: %s SQL语句: %s 参数: %s", e, query, params, exc_info=True)
         raise
     finally:
         cur.close()
-        app.logger.debug("数据库游标已关闭")
+        query_metrics.record(query, time.perf_counter() - start, rows, params, failed)
 
-# 缓存装饰器
-cache = {}
+# 匹配 INSERT/REPLACE ... VALUES (...) [ON DUPLICATE KEY UPDATE ...] 语句
+_INSERT_VALUES_RE = re.compile(
+    r"^(\s*(?:INSERT|REPLACE)\b.+?\bVALUES\s*)(\(.+?\))(\s*(?:ON\s+DUPLICATE\b.*)?)$",
+    re.IGNORECASE | re.DOTALL
+)
+
+# 辅助函数：将一行参数转义为SQL字面量（兼容mysqlclient返回bytes、PyMySQL返回str）
+def _literal_row(conn, params):
+    literals = []
+    for value in params:
+        literal = conn.literal(value)
+        if isinstance(literal, str):
+            literal = literal.encode(conn.encoding)
+        literals.append(literal)
+    return tuple(literals)
 
+# 辅助函数：批量执行写操作
+def execute_db_many(query, params_seq, chunk_rows=None, max_packet=None):
+    """
+    批量执行写操作，整个批次在一个事务中完成
+    
+    INSERT/REPLACE ... VALUES (...) 语句会被改写为多行VALUES语句，按行数和报文大小分块，
+    每块一次往返；其他语句（UPDATE/DELETE等）按块使用executemany执行
+    
+    参数:
+        query: SQL语句，VALUES部分为单行占位符，例如 INSERT INTO t (a, b) VALUES (%s, %s)
+        params_seq: 参数元组的可迭代对象（可以是生成器）
+        chunk_rows: 每块最多行数（默认使用配置MYSQL_BULK_CHUNK_ROWS）
+        max_packet: 每条语句的最大字节数，应小于服务器的max_allowed_packet（默认使用配置MYSQL_BULK_MAX_PACKET）
+    
+    返回:
+        list: 每块影响的行数
+    """
+    chunk_rows = chunk_rows or app.config.get('MYSQL_BULK_CHUNK_ROWS', 1000)
+    max_packet = max_packet or app.config.get('MYSQL_BULK_MAX_PACKET', 4 * 1024 * 1024)
+    match = _INSERT_VALUES_RE.match(query)
+    rowcounts = []
+    
+    with transaction():
+        conn = mysql.connection
+        invalidate_query_cache(query)
+        
+        def run(statement, rows, batch=None):
+            cur = conn.cursor()
+            failed = False
+            start = time.perf_counter()
+            try:
+                if batch is None:
+                    cur.execute(statement)
+                else:
+                    cur.executemany(statement, batch)
+                rowcounts.append(cur.rowcount)
+            except Exception as e:
+                failed = True
+                app.logger.error("批量写入错误: %s SQL语句: %s 行数: %d", e, query, rows, exc_info=True)
+                raise
+            finally:
+                cur.close()
+                query_metrics.record(query, time.perf_counter() - start, rows, None, failed)
+        
+        if match is None:
+            # 非INSERT语句：按块使用executemany
+            batch = []
+            for params in params_seq:
+                batch.append(params)
+                if len(batch) >= chunk_rows:
+                    run(query, len(batch), batch)
+                    batch = []
+            if batch:
+                run(query, len(batch), batch)
+        else:
+            # INSERT语句：拼接多行VALUES，按行数和报文大小分块
+            prefix, values_template, suffix = (part.encode(conn.encoding) for part in match.groups())
+            # 前后缀不参与参数格式化，需要还原其中转义的%%
+            prefix = prefix.replace(b'%%', b'%')
+            suffix = suffix.replace(b'%%', b'%')
+            values_list = []
+            size = len(prefix) + len(suffix)
+            for params in params_seq:
+                row = values_template % _literal_row(conn, params)
+                if values_list and (len(values_list) >= chunk_rows or size + len(row) + 1 > max_packet):
+                    run(prefix + b','.join(values_list) + suffix, len(values_list))
+                    values_list = []
+                    size = len(prefix) + len(suffix)
+                values_list.append(row)
+                size += len(row) + 1
+            if values_list:
+                run(prefix + b','.join(values_list) + suffix, len(values_list))
+    
+    # 批量写入后本请求内的读取固定走主库
+    mysql.mark_primary_sticky()
+    return rowcounts
+
+# 辅助函数：流式执行只读查询（服务端游标）
+def stream_db_query(query, params=None, batch_size=1000, primary=False):
+    """
+    以流式方式执行只读查询：使用非缓冲的服务端游标（SSDictCursor）分批读取，
+    逐行转换datetime字段后产出，内存占用与结果集大小无关
+    
+    查询使用一个独立借出的连接（配置了从库时优先使用从库，primary=True时使用主库），生成器结束时归还；
+    未读完就关闭生成器时，为避免读完剩余结果，直接丢弃该连接
+    
+    参数:
+        query: SQL查询语句
+        params: 查询参数（可选）
+        batch_size: 每次从服务器读取的行数
+        primary: 是否固定从主库读取（需要读到最新数据、不能容忍复制延迟时使用）
+    
+    返回:
+        生成器，逐行产出字典
+    
+    用法:
+        for log in stream_db_query('SELECT * FROM audit_logs ORDER BY created_at DESC'):
+            writer.writerow(...)
+    """
+    pool, record = mysql.acquire_dedicated(read_only=not primary)
+    cur = record.conn.cursor(MySQLdb.cursors.SSDictCursor)
+    rows = 0
+    finished = False
+    failed = False
+    start = time.perf_counter()
+    try:
+        if params:
+            cur.execute(query, params)
+        else:
+            cur.execute(query)
+        
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            for row in batch:
+                rows += 1
+                yield convert_datetime_fields(row)
+        finished = True
+    except Exception as e:
+        failed = True
+        app.logger.error("流式查询错误: %s SQL语句: %s 参数: %s", e, query, params, exc_info=True)
+        raise
+    finally:
+        if finished:
+            cur.close()
+        pool.release(record, discard=not finished)
+        query_metrics.record(query, time.perf_counter() - start, rows, params, failed)
+
+# 个人信息接口返回的字段
+PROFILE_COLUMNS = 'id, username, role, name, phone, email, created_at, avatar'
+
+# 辅助函数：获取用户个人信息（带缓存）
+def get_user_profile(user_id):
+    """
+    获取用户个人信息，按用户ID缓存PROFILE_CACHE_TTL秒
+    
+    参数:
+        user_id: 用户ID
+    
+    返回:
+        dict: 个人信息的副本；用户不存在时返回None
+    """
+    profile = profile_cache.get(user_id, _MISSING)
+    if profile is _MISSING:
+        tags = (user_id,)
+        generation = profile_cache.generation(tags)
+        profile = execute_db_query(f'SELECT {PROFILE_COLUMNS} FROM users WHERE id = %s', [user_id], fetch_one=True,
+                                   primary=True)
+        profile_cache.set(user_id, profile, tags=tags, generation=generation)
+    return dict(profile) if profile else None
+
+# 辅助函数：使用户个人信息缓存失效
+def invalidate_user_profile(*user_ids):
+    """
+    使用户的个人信息缓存失效（修改个人信息、头像或用户被修改/删除时调用）；
+    立即失效一次，在事务中时提交后再失效一次
+    
+    参数:
+        user_ids: 用户ID
+    """
+    profile_cache.invalidate(user_ids)
+    after_commit(profile_cache.invalidate, user_ids)
+
+# 缓存装饰器
 def clear_cache():
-    """清除所有缓存"""
-    global cache
-    cache = {}
+    """清除所有查询缓存"""
+    query_cache.clear()
     app.logger.info("缓存已清除")
 
-def cached(timeout=300):  # 默认缓存5分钟
+def cached(timeout=300, max_entries=256):  # 默认缓存5分钟
+    """
+    函数结果缓存装饰器（有容量上限的LRU+TTL缓存）
+    
+    参数:
+        timeout: 缓存过期时间（秒）
+        max_entries: 最多缓存的结果数
+    """
     def decorator(func):
+        func_cache = LRUCache(max_entries=max_entries, ttl=timeout)
+        
+        @wraps(func)
         def wrapper(*args, **kwargs):
             # 创建缓存键
-            key = str(args) + str(kwargs)
+            key = (args, tuple(sorted(kwargs.items())))
             
             # 检查缓存是否存在且未过期
-            if key in cache and (time.time() - cache[key]['time']) < timeout:
-                return cache[key]['value']
+            result = func_cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
             
             # 执行函数并缓存结果
             result = func(*args, **kwargs)
-            cache[key] = {'value': result, 'time': time.time()}
+            func_cache.set(key, result)
             
             return result
+        wrapper.cache = func_cache
         return wrapper
     return decorator
 
@@ -290,263 +648,56 @@ def log_audit(user_id, username, action, target="", details=None):
         # 记录日志失败不影响主流程
         pass
 
-# 创建数据库和表（如果不存在）
+# 初始化数据库：执行待执行的迁移（已是最新版本时只有一次版本查询）
 def init_db():
-    # 连接到MySQL服务器
-    conn = mysql.connection
-    cur = conn.cursor()
-    
-    # 创建数据库（如果不存在）
-    cur.execute('CREATE DATABASE IF NOT EXISTS login_system')
-    
-    # 选择数据库
-    cur.execute('USE login_system')
-    
-    # 创建用户表（如果不存在）
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            name VARCHAR(50),
-            email VARCHAR(100),
-            phone VARCHAR(20),
-            gender VARCHAR(10),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 如果表已经存在但缺少字段，添加缺少的字段
-    # 添加email字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'email'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD email VARCHAR(100)")
-    
-    # 添加phone字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'phone'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD phone VARCHAR(20)")
-    
-    # 添加gender字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'gender'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD gender VARCHAR(10)")
-    
-    # 移除不需要的字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'is_star'")
-    if cur.fetchone() is not None:
-        cur.execute("ALTER TABLE users DROP COLUMN is_star")
-    
-    # 添加created_at字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'created_at'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-    
-    # 添加name字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'name'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD name VARCHAR(50)")
-    
-    # 添加avatar字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'avatar'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD avatar VARCHAR(255)")
-    
-    # 添加role字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'role'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE users ADD role VARCHAR(20) DEFAULT '普通用户'")
-    
-    # 移除不需要的permissions字段
-    cur.execute("SHOW COLUMNS FROM users LIKE 'permissions'")
-    if cur.fetchone() is not None:
-        cur.execute("ALTER TABLE users DROP COLUMN permissions")
-    
-    # 添加索引优化查询性能
-    # 为username字段添加唯一索引
-    cur.execute("SHOW INDEX FROM users WHERE Key_name = 'idx_users_username'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_users_username ON users (username)")
-    
-    # 为role字段添加索引
-    cur.execute("SHOW INDEX FROM users WHERE Key_name = 'idx_users_role'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_users_role ON users (role)")
-    
-    # 为created_at字段添加索引（用于排序）
-    cur.execute("SHOW INDEX FROM users WHERE Key_name = 'idx_users_created_at'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_users_created_at ON users (created_at)")
-    
-    # 创建权限表（如果不存在）
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS role_permissions (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            permission VARCHAR(50) UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 直接定义初始权限列表并插入数据库
-    initial_permissions = [
-        '个人信息管理',
-        '用户管理',
-        '角色管理',
-        '审计日志管理'
-    ]
-    for permission in initial_permissions:
-        try:
-            cur.execute("INSERT IGNORE INTO role_permissions (permission) VALUES (%s)", 
-                       (permission,))
-        except Exception as e:
-            app.logger.debug(f"插入权限数据失败: {e}")
-    
-    # 创建角色表（如果不存在）
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS roles (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            role VARCHAR(50) UNIQUE NOT NULL,
-            permissions JSON, -- 存储角色拥有的权限列表
-            is_in_use BOOLEAN DEFAULT FALSE, -- 角色是否在使用中
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 为role字段添加索引
-    cur.execute("SHOW INDEX FROM roles WHERE Key_name = 'role'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_roles_role ON roles (role)")
-    
-    # 删除description字段（如果存在）
-    cur.execute("SHOW COLUMNS FROM roles LIKE 'description'")
-    if cur.fetchone() is not None:
-        cur.execute("ALTER TABLE roles DROP COLUMN description")
-    
-    # 添加permissions字段（如果不存在）
-    cur.execute("SHOW COLUMNS FROM roles LIKE 'permissions'")
-    if cur.fetchone() is None:
-        cur.execute("ALTER TABLE roles ADD permissions JSON")
-    
-    # 删除user_count字段（如果存在）
-    cur.execute("SHOW COLUMNS FROM roles LIKE 'user_count'")
-    if cur.fetchone() is not None:
-        cur.execute("ALTER TABLE roles DROP COLUMN user_count")
-    
-    
-    # 创建审计日志表（如果不存在）
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS audit_logs (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT,
-            username VARCHAR(50),
-            action VARCHAR(50) NOT NULL,
-            target VARCHAR(50),
-            details JSON,
-            ip_address VARCHAR(50),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 添加索引优化查询性能
-    # 为created_at字段添加索引
-    cur.execute("SHOW INDEX FROM audit_logs WHERE Key_name = 'idx_audit_logs_created_at'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_audit_logs_created_at ON audit_logs (created_at)")
-    
-    # 为username字段添加索引
-    cur.execute("SHOW INDEX FROM audit_logs WHERE Key_name = 'idx_audit_logs_username'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_audit_logs_username ON audit_logs (username)")
-    
-    # 为action字段添加索引
-    cur.execute("SHOW INDEX FROM audit_logs WHERE Key_name = 'idx_audit_logs_action'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_audit_logs_action ON audit_logs (action)")
-    
-    # 为username+created_at添加组合索引（用于按用户名查询并按时间排序）
-    cur.execute("SHOW INDEX FROM audit_logs WHERE Key_name = 'idx_audit_logs_username_created_at'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_audit_logs_username_created_at ON audit_logs (username, created_at DESC)")
-    
-    # 为action+created_at添加组合索引（用于按操作类型查询并按时间排序）
-    cur.execute("SHOW INDEX FROM audit_logs WHERE Key_name = 'idx_audit_logs_action_created_at'")
-    if cur.fetchone() is None:
-        cur.execute("CREATE INDEX idx_audit_logs_action_created_at ON audit_logs (action, created_at DESC)")
-    
-    # 插入默认角色
-    roles = [
-        ('管理员', '["个人信息管理", "用户管理", "角色管理", "审计日志管理"]'),
-        ('普通用户', '["个人信息管理"]')
-    ]
-    for role in roles:
-        cur.execute("INSERT IGNORE INTO roles (role, permissions) VALUES (%s, %s) ON DUPLICATE KEY UPDATE permissions=VALUES(permissions)", role)
-    
-    # 初始化所有角色的is_in_use字段
-    cur.execute("SELECT id, role FROM roles")
-    all_roles = cur.fetchall()
-    for role in all_roles:
-        # 查询是否有用户使用该角色
-        cur.execute("SELECT COUNT(*) as count FROM users WHERE role = %s", (role['role'],))
-        user_count = cur.fetchone()['count']
-        is_in_use = 1 if user_count > 0 else 0
-        # 更新角色的is_in_use字段
-        cur.execute("UPDATE roles SET is_in_use = %s WHERE id = %s", (is_in_use, role['id']))
-    
-    
-    # 提交更改
-    conn.commit()
-    
-    # 关闭游标
-    cur.close()
+    applied = upgrade()
+    if applied:
+        app.logger.info(f'数据库已迁移到版本 {applied[-1]}')
+
+# 验证码令牌Cookie名称
+CAPTCHA_TOKEN_COOKIE = 'captcha_token'
 
 # 生成随机验证码
 def generate_captcha():
-    # 生成4位随机字符
-    captcha_text = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    
-    # 存储验证码到会话（不区分大小写）
-    session['captcha'] = captcha_text
-    
-    # 创建验证码图片
-    width, height = 100, 38
-    image = Image.new('RGB', (width, height), color=(255, 255, 255))
-    draw = ImageDraw.Draw(image)
-    
-    # 尝试使用默认字体，如果失败则使用ImageFont加载系统字体
-    try:
-        font = ImageFont.truetype('arial.ttf', 20)
-    except:
-        font = ImageFont.load_default()
-    
-    # 在图片上绘制验证码
-    # 使用textbbox替代textsize（Pillow 10+版本不再支持textsize）
-    bbox = draw.textbbox((0, 0), captcha_text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-    x = (width - text_width) // 2
-    y = (height - text_height) // 2
-    draw.text((x, y), captcha_text, font=font, fill=(0, 0, 0))
-    
-    # 添加干扰线
-    for _ in range(5):
-        x1 = random.randint(0, width)
-        y1 = random.randint(0, height)
-        x2 = random.randint(0, width)
-        y2 = random.randint(0, height)
-        draw.line([(x1, y1), (x2, y2)], fill=(0, 0, 0), width=1)
-    
-    # 添加干扰点
-    for _ in range(20):
-        x = random.randint(0, width)
-        y = random.randint(0, height)
-        draw.point((x, y), fill=(0, 0, 0))
-    
-    # 将图片转换为字节流
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr.seek(0)
+    # 从预绘制的验证码池中取出一张（文本, PNG数据）
+    captcha_text, image_bytes = captcha_pool.pop()
     
     # 返回图片响应
-    response = make_response(img_byte_arr.getvalue())
+    response = make_response(image_bytes)
     response.headers['Content-Type'] = 'image/png'
+    response.headers['Cache-Control'] = 'no-store'
+    
+    if app.config.get('CAPTCHA_MODE') == 'session':
+        # 存储验证码到会话（不区分大小写）
+        session['captcha'] = captcha_text
+    else:
+        # 无状态模式：答案签名为令牌，通过响应头和Cookie随图片下发，不写session
+        token = captcha_tokens.issue(captcha_text)
+        response.headers['X-Captcha-Token'] = token
+        response.set_cookie(
+            CAPTCHA_TOKEN_COOKIE,
+            token,
+            max_age=captcha_tokens.ttl,
+            httponly=True,
+            secure=app.config.get('SESSION_COOKIE_SECURE', False),
+            samesite=app.config.get('SESSION_COOKIE_SAMESITE')
+        )
     return response
+
+# 校验验证码
+def verify_captcha(captcha, token=None):
+    """
+    校验用户提交的验证码（每个验证码只能校验一次）
+    
+    参数:
+        captcha: 用户提交的验证码
+        token: 无状态模式下的验证码令牌，未传时从Cookie读取
+    
+    返回:
+        bool: 验证码是否正确
+    """
+    if app.config.get('CAPTCHA_MODE') == 'session':
+        # 校验后清空会话中的验证码以防止重复使用
+        session_captcha = session.pop('captcha', '')
+        return bool(captcha and session_captcha and captcha.upper() == session_captcha.upper())
+    return captcha_tokens.verify(token or request.cookies.get(CAPTCHA_TOKEN_COOKIE), captcha)
@@ -13,14 +13,84 @@ MYSQL_CURSORCLASS = 'DictCursor'
 # MySQL连接配置
 MYSQL_CONNECT_TIMEOUT = int(os.getenv('MYSQL_CONNECT_TIMEOUT', 10))
 
+# MySQL连接池配置
+MYSQL_POOL_MIN_SIZE = int(os.getenv('MYSQL_POOL_MIN_SIZE', 2))  # 最少保持的连接数
+MYSQL_POOL_MAX_SIZE = int(os.getenv('MYSQL_POOL_MAX_SIZE', 20))  # 最多连接数
+MYSQL_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', 5))  # 借出连接的最长等待时间（秒）
+MYSQL_POOL_RECYCLE = int(os.getenv('MYSQL_POOL_RECYCLE', 3600))  # 连接最长存活时间（秒），应小于MySQL的wait_timeout
+MYSQL_POOL_IDLE_TIMEOUT = int(os.getenv('MYSQL_POOL_IDLE_TIMEOUT', 300))  # 空闲连接回收时间（秒）
+MYSQL_POOL_PING_INTERVAL = int(os.getenv('MYSQL_POOL_PING_INTERVAL', 30))  # 空闲超过该秒数的连接借出前先做健康检查
+
+# MySQL从库配置（读写分离）
+# 格式: host1:port1,host2:port2，为空时所有查询都走主库
+MYSQL_REPLICAS = os.getenv('MYSQL_REPLICAS', '')
+MYSQL_REPLICA_MAX_LAG = int(os.getenv('MYSQL_REPLICA_MAX_LAG', 5))  # 允许的最大复制延迟（秒），超过时读请求回退到主库
+MYSQL_REPLICA_CHECK_INTERVAL = int(os.getenv('MYSQL_REPLICA_CHECK_INTERVAL', 10))  # 从库健康和延迟检查间隔（秒）
+
+# 批量写入配置
+MYSQL_BULK_CHUNK_ROWS = int(os.getenv('MYSQL_BULK_CHUNK_ROWS', 1000))  # 多行INSERT每条语句最多行数
+MYSQL_BULK_MAX_PACKET = int(os.getenv('MYSQL_BULK_MAX_PACKET', 4 * 1024 * 1024))  # 每条语句最大字节数，应小于服务器max_allowed_packet
+
+# 查询结果缓存配置（进程内缓存，写操作按表失效；多进程部署时其他进程依赖TTL过期）
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 1024))  # 最多缓存的查询结果数
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 60))  # 缓存过期时间（秒）
+
+# 列表总数配置（count参数未指定时，表的估算行数达到阈值后改用估算值）
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 10))  # 精确总数和估算值的缓存时间（秒），对应表有写操作时失效
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', 1000000))  # 改用估算值的表行数阈值
+
+# 批量导入用户配置
+USER_IMPORT_CHUNK_ROWS = int(os.getenv('USER_IMPORT_CHUNK_ROWS', 1000))  # 每块处理的行数（一次重复检查、一次并行哈希、一次多行写入）
+USER_IMPORT_MAX_ERRORS = int(os.getenv('USER_IMPORT_MAX_ERRORS', 1000))  # 响应中最多返回的错误行数
+
+# 用户自动补全配置（进程内前缀索引）
+SUGGEST_REFRESH_INTERVAL = int(os.getenv('SUGGEST_REFRESH_INTERVAL', 300))  # 从数据库重新加载的间隔（秒），用于同步其他进程的修改
+SUGGEST_MAX_RESULTS = int(os.getenv('SUGGEST_MAX_RESULTS', 20))  # 每次最多返回的用户数
+
+# 权限缓存配置（进程内缓存用户角色和角色权限，角色/用户修改时失效；多进程部署时其他进程依赖TTL过期）
+PERMISSION_CACHE_MAX_ENTRIES = int(os.getenv('PERMISSION_CACHE_MAX_ENTRIES', 4096))  # 最多缓存的用户数/角色数
+PERMISSION_CACHE_TTL = int(os.getenv('PERMISSION_CACHE_TTL', 60))  # 缓存过期时间（秒）
+AUTH_CLAIMS_TTL = int(os.getenv('AUTH_CLAIMS_TTL', 300))  # 登录时写入session的角色/权限声明的有效期（秒），过期后从数据库刷新
+
+# 个人信息缓存配置（/api/profile按用户缓存，修改个人信息/头像/用户时失效）
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', 4096))  # 最多缓存的用户数
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 30))  # 缓存过期时间（秒）
+
+# 密码哈希进程池配置
+HASH_POOL_WORKERS = int(os.getenv('HASH_POOL_WORKERS', 0))  # 工作进程数，0表示使用CPU核数
+HASH_POOL_QUEUE_SIZE = int(os.getenv('HASH_POOL_QUEUE_SIZE', 32))  # 所有进程都在忙时最多排队的任务数，超过时返回503
+HASH_POOL_BULK_WORKERS = int(os.getenv('HASH_POOL_BULK_WORKERS', 0))  # 批量哈希（导入用户）最多同时占用的进程数，0表示工作进程数的一半
+PASSWORD_HASH_TARGET_MS = float(os.getenv('PASSWORD_HASH_TARGET_MS', 100))  # 单次密码校验的目标耗时（毫秒），据此校准哈希轮数（不低于passlib默认轮数）
+PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS', 0))  # 固定的哈希轮数，0表示按目标耗时校准
+PASSWORD_HASH_REHASH_TOLERANCE = float(os.getenv('PASSWORD_HASH_REHASH_TOLERANCE', 0.25))  # 已保存哈希的轮数比当前策略低该比例以上时，登录成功后重新计算哈希
+
+# 验证码配置
+CAPTCHA_POOL_SIZE = int(os.getenv('CAPTCHA_POOL_SIZE', 256))  # 预先绘制的验证码图片数量
+CAPTCHA_REFILL_INTERVAL = float(os.getenv('CAPTCHA_REFILL_INTERVAL', 1.0))  # 补充线程的检查间隔（秒），剩余不足一半时立即补充
+# 验证码校验方式: token（答案签名为短期令牌随图片下发，不占用会话存储）、session（答案保存在会话中）
+CAPTCHA_MODE = os.getenv('CAPTCHA_MODE', 'token')
+CAPTCHA_TOKEN_TTL = int(os.getenv('CAPTCHA_TOKEN_TTL', 300))  # 验证码令牌有效期（秒）
+CAPTCHA_REPLAY_CACHE_SIZE = int(os.getenv('CAPTCHA_REPLAY_CACHE_SIZE', 100000))  # 记录已使用令牌的进程内缓存大小
+CAPTCHA_FONT_PATH = os.getenv('CAPTCHA_FONT_PATH')  # 验证码字体文件路径，未配置时依次尝试arial.ttf、DejaVuSans.ttf和Pillow内置字体
+
+# 查询指标配置
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))  # 慢查询阈值（毫秒），超过的查询写入logs/slow_query.log
+
 # Flask配置
 # 使用强随机生成的密钥用于会话加密
 SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', 'your_very_secure_secret_key_1234567890!@#$%^&*()')
 
 # 会话配置
+# 会话存储方式: cookie（会话数据签名后保存在Cookie中）、filesystem（服务端分片文件）、sqlite（服务端SQLite）
+# 服务端存储时Cookie中只保存随机会话ID
 SESSION_TYPE = os.getenv('SESSION_TYPE', 'filesystem')
+SESSION_FILE_DIR = os.getenv('SESSION_FILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session'))
+SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', os.path.join(SESSION_FILE_DIR, 'sessions.sqlite3'))
 SESSION_PERMANENT = os.getenv('SESSION_PERMANENT', 'False').lower() in ['true', '1', 'yes']
 PERMANENT_SESSION_LIFETIME = int(os.getenv('PERMANENT_SESSION_LIFETIME', 3600))  # 1小时
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', 1024))  # 进程内缓存的会话数（cookie方式缓存验证过的Cookie，服务端方式缓存会话数据）
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', 60))  # 服务端会话进程内缓存的过期时间（秒），命中时都会向存储确认会话版本
+SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 600))  # 清理过期服务端会话的间隔（秒）
 
 # 安全配置
 # 生产环境默认启用安全配置
@@ -7,9 +7,10 @@ echo ==========================================
 echo Select Startup Mode:
 echo 1. Development Mode (Debug Mode)
 echo 2. Production Mode (Production Mode)
+echo 3. Run Database Migrations
 echo ==========================================
 
-set /p choice=Enter option (1/2): 
+set /p choice=Enter option (1/2/3): 
 
 if "%choice%"=="1" (
     echo Starting Development Mode...
@@ -31,8 +32,17 @@ if "%choice%"=="1" (
     
     echo Starting Flask application...
     python app.py
+) else if "%choice%"=="3" (
+    echo Running Database Migrations...
+    
+    echo Activating virtual environment...
+    call .venv\Scripts\activate.bat
+    
+    flask --app app.py db status
+    flask --app app.py db upgrade
+    pause
 ) else (
-    echo Invalid choice. Please run the script again and enter 1 or 2.
+    echo Invalid choice. Please run the script again and enter 1, 2 or 3.
     pause
     exit /b 1
 )
\ No newline at end of file
@@ -0,0 +1,129 @@
+# execute_db_many 多行INSERT改写的测试（使用假连接，不需要MySQL服务器）
+import pytest
+
+try:
+    import MySQLdb  # noqa: F401
+except ImportError:
+    # 未安装mysqlclient时用PyMySQL代替，两者都没有时跳过
+    pytest.importorskip('pymysql').install_as_MySQLdb()
+
+import app.utils as utils
+from app import app
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+
+    def execute(self, statement, params=None):
+        if statement == 'START TRANSACTION':
+            self.conn.transactions += 1
+            return
+        self.conn.statements.append(statement)
+        # 多行INSERT影响的行数等于VALUES的行数
+        self.rowcount = statement.count(b'),(') + 1
+
+    def executemany(self, statement, batch):
+        self.conn.statements.append((statement, list(batch)))
+        self.rowcount = len(batch)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """模拟MySQLdb连接：literal只接受单个值，按驱动返回bytes（mysqlclient）或str（PyMySQL）"""
+    encoding = 'utf8'
+
+    def __init__(self, literal_type=bytes):
+        self.literal_type = literal_type
+        self.statements = []
+        self.transactions = 0
+        self.committed = 0
+        self.rolled_back = 0
+
+    def literal(self, value):
+        if isinstance(value, (tuple, list, dict)):
+            raise TypeError(f'不支持的参数类型: {type(value).__name__}')
+        if value is None:
+            literal = 'NULL'
+        elif isinstance(value, (int, float)):
+            literal = str(value)
+        else:
+            literal = "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+        return literal.encode(self.encoding) if self.literal_type is bytes else literal
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed += 1
+
+    def rollback(self):
+        self.rolled_back += 1
+
+
+class FakeMySQL:
+    def __init__(self, conn):
+        self.connection = conn
+
+    def mark_primary_sticky(self):
+        pass
+
+    def discard_connection(self, conn=None, error=None):
+        pass
+
+
+@pytest.fixture(params=[bytes, str], ids=['mysqlclient', 'pymysql'])
+def conn(request, monkeypatch):
+    conn = FakeConnection(request.param)
+    monkeypatch.setattr(utils, 'mysql', FakeMySQL(conn))
+    with app.app_context():
+        yield conn
+
+
+def test_insert_is_rewritten_to_multi_row_values(conn):
+    rows = [(1, 'alice', None), (2, "o'brien", '100%')]
+    rowcounts = utils.execute_db_many('INSERT INTO t (id, name, note) VALUES (%s, %s, %s)', rows)
+
+    assert conn.statements == [
+        b"INSERT INTO t (id, name, note) VALUES (1, 'alice', NULL),(2, 'o\\'brien', '100%')"
+    ]
+    assert rowcounts == [2]
+    assert conn.transactions == conn.committed == 1
+
+
+def test_insert_is_split_by_chunk_rows_and_keeps_suffix(conn):
+    query = 'INSERT INTO t (id, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + 1'
+    rowcounts = utils.execute_db_many(query, ((i, i * 10) for i in range(5)), chunk_rows=2)
+
+    assert conn.statements == [
+        b'INSERT INTO t (id, n) VALUES (0, 0),(1, 10) ON DUPLICATE KEY UPDATE n = n + 1',
+        b'INSERT INTO t (id, n) VALUES (2, 20),(3, 30) ON DUPLICATE KEY UPDATE n = n + 1',
+        b'INSERT INTO t (id, n) VALUES (4, 40) ON DUPLICATE KEY UPDATE n = n + 1',
+    ]
+    assert rowcounts == [2, 2, 1]
+    assert conn.transactions == conn.committed == 1
+
+
+def test_insert_is_split_by_max_packet(conn):
+    query = 'INSERT INTO t (name) VALUES (%s)'
+    prefix = len(b'INSERT INTO t (name) VALUES ')
+    # 每行('xxxx')占8字节，加上分隔的逗号占9字节，上限只能容纳两行
+    utils.execute_db_many(query, [('xxxx',)] * 3, max_packet=prefix + 9 + 9)
+
+    assert conn.statements == [
+        b"INSERT INTO t (name) VALUES ('xxxx'),('xxxx')",
+        b"INSERT INTO t (name) VALUES ('xxxx')",
+    ]
+
+
+def test_other_statements_use_executemany(conn):
+    rowcounts = utils.execute_db_many('UPDATE t SET n = %s WHERE id = %s', [(1, 1), (2, 2), (3, 3)], chunk_rows=2)
+
+    assert conn.statements == [
+        ('UPDATE t SET n = %s WHERE id = %s', [(1, 1), (2, 2)]),
+        ('UPDATE t SET n = %s WHERE id = %s', [(3, 3)]),
+    ]
+    assert rowcounts == [2, 1]
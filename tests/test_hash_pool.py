@@ -0,0 +1,64 @@
+# 密码哈希进程池批量任务（map）的测试：用线程池代替进程池，统计同时执行的子任务数
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.hash_pool import HashPool, HashPoolBusyError
+
+
+class Probe:
+    """记录同时执行的子任务数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, value):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return value * 2
+
+
+@pytest.fixture
+def pool():
+    pool = HashPool(workers=4, queue_size=2)
+    pool._executor = ThreadPoolExecutor(max_workers=pool.workers)
+    yield pool
+    pool._executor.shutdown()
+
+
+def test_map_uses_at_most_bulk_workers(pool):
+    probe = Probe()
+    results = pool.map('hash', probe, [(i,) for i in range(20)], batch_size=1)
+
+    assert results == [i * 2 for i in range(20)]
+    assert pool.bulk_workers == 2
+    assert probe.max_running == 2
+    assert pool.stats()['max_pending'] == 2
+
+
+def test_map_waits_for_own_batches_when_queue_is_full(pool):
+    # 其他请求占用了除一个之外的全部名额
+    pool._pending = pool.workers + pool.queue_size - 1
+    probe = Probe()
+    results = pool.map('hash', probe, [(i,) for i in range(5)], batch_size=1)
+
+    assert results == [i * 2 for i in range(5)]
+    assert probe.max_running == 1
+    assert pool.stats()['rejected'] == 0
+
+
+def test_map_is_rejected_when_queue_is_full(pool):
+    pool._pending = pool.workers + pool.queue_size
+    with pytest.raises(HashPoolBusyError):
+        pool.map('hash', Probe(), [(1,)])
+
+    assert pool.stats()['rejected'] == 1
+    assert pool._pending == pool.workers + pool.queue_size
@@ -0,0 +1,74 @@
+# session授权声明的测试：两个解析器实例共用一份“数据库”，模拟多进程部署
+import pytest
+
+try:
+    import MySQLdb  # noqa: F401
+except ImportError:
+    # 未安装mysqlclient时用PyMySQL代替，两者都没有时跳过
+    pytest.importorskip('pymysql').install_as_MySQLdb()
+
+from app import app
+from app.permissions import PermissionResolver
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.users = {'alice': '普通用户'}
+        self.roles = {'普通用户': ['view_profile'], '管理员': ['view_profile', 'manage_users']}
+        self.queries = 0
+
+    def execute_db_query(self, query, params=None, fetch_one=False, primary=False):
+        self.queries += 1
+        if query.startswith('SELECT role FROM users'):
+            role = self.users.get(params[0])
+            return {'role': role} if role else None
+        permissions = self.roles.get(params[0])
+        return {'permissions': permissions} if permissions is not None else None
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr('app.utils.execute_db_query', db.execute_db_query)
+    # invalidate_role/invalidate_user通过after_commit判断是否在事务中，需要应用上下文
+    with app.app_context():
+        yield db
+
+
+def test_claims_issued_by_one_worker_are_trusted_by_another(db):
+    worker_a = PermissionResolver()
+    worker_b = PermissionResolver()
+    session = {'username': 'alice', 'auth': worker_a.issue_claims('alice')}
+    claims = session['auth']
+
+    assert worker_b.session_claims(session) is claims
+    # 第二次检查只查进程内缓存
+    queries = db.queries
+    assert worker_b.session_claims(session) is claims
+    assert db.queries == queries
+
+
+def test_claims_are_reissued_after_role_change(db):
+    worker_a = PermissionResolver()
+    worker_b = PermissionResolver()
+    session = {'username': 'alice', 'auth': worker_a.issue_claims('alice')}
+
+    # 另一个进程修改用户角色后使本进程的缓存失效（或缓存TTL过期）
+    db.users['alice'] = '管理员'
+    worker_b.invalidate_user('alice')
+
+    claims = worker_b.session_claims(session)
+    assert claims['role'] == '管理员'
+    assert 'manage_users' in claims['permissions']
+    assert session['auth'] is claims
+
+
+def test_claims_are_reissued_after_role_permissions_change(db):
+    worker_a = PermissionResolver()
+    worker_b = PermissionResolver()
+    session = {'username': 'alice', 'auth': worker_a.issue_claims('alice')}
+
+    db.roles['普通用户'] = ['view_profile', 'export_users']
+    worker_b.invalidate_role('普通用户')
+
+    assert 'export_users' in worker_b.session_claims(session)['permissions']
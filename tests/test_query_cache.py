@@ -0,0 +1,26 @@
+# LRUCache失效代数的测试：失效或清空之前发起的查询结果不能写入缓存
+from app.query_cache import LRUCache
+
+
+def test_result_read_before_invalidate_is_not_cached():
+    cache = LRUCache()
+    generation = cache.generation(('users',))
+    cache.invalidate(('users',))
+
+    assert cache.set('q', 'stale', tags=('users',), generation=generation) is False
+    assert cache.get('q') is None
+
+
+def test_result_read_before_clear_is_not_cached():
+    cache = LRUCache()
+    cache.set('cached', 1, tags=('users',))
+    cache.invalidate(('roles',))
+    users_generation = cache.generation(('users',))
+    roles_generation = cache.generation(('roles',))
+    cache.clear()
+
+    assert cache.set('q1', 'stale', tags=('users',), generation=users_generation) is False
+    assert cache.set('q2', 'stale', tags=('roles',), generation=roles_generation) is False
+    assert cache.stats()['entries'] == 0
+    # 清空之后发起的查询正常写入
+    assert cache.set('q1', 'fresh', tags=('users',), generation=cache.generation(('users',))) is True
@@ -0,0 +1,57 @@
+# 服务端会话进程内缓存的测试：两个接口实例共用一个存储，模拟多进程部署
+import secrets
+import time
+
+import pytest
+
+from app.sessions import FileSessionStore, SQLiteSessionStore, ServerSideSessionInterface
+
+
+@pytest.fixture(params=['filesystem', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'))
+    return FileSessionStore(str(tmp_path / 'sessions'))
+
+
+def save(interface, sid, data):
+    """按save_session的方式保存会话并写入进程内缓存"""
+    expires_at = time.time() + 3600
+    version = interface.store.save(sid, interface.serializer.dumps(data), expires_at)
+    interface._cache.set(sid, (dict(data), expires_at, version))
+
+
+def test_revoke_in_one_worker_is_seen_by_others(store):
+    worker_a = ServerSideSessionInterface(store)
+    worker_b = ServerSideSessionInterface(store)
+    sid = secrets.token_urlsafe(32)
+    save(worker_a, sid, {'user_id': 1})
+    assert worker_b._load(sid)[0] == {'user_id': 1}
+
+    worker_a.revoke(sid)
+
+    assert worker_b._load(sid) is None
+
+
+def test_write_in_one_worker_replaces_cached_copy_in_others(store):
+    worker_a = ServerSideSessionInterface(store)
+    worker_b = ServerSideSessionInterface(store)
+    sid = secrets.token_urlsafe(32)
+    save(worker_a, sid, {'user_id': 1, 'role': '普通用户'})
+    assert worker_b._load(sid)[0]['role'] == '普通用户'
+
+    save(worker_a, sid, {'user_id': 1, 'role': '管理员'})
+
+    assert worker_b._load(sid)[0]['role'] == '管理员'
+
+
+def test_unchanged_session_is_served_from_cache(store, monkeypatch):
+    interface = ServerSideSessionInterface(store)
+    sid = secrets.token_urlsafe(32)
+    save(interface, sid, {'user_id': 1})
+
+    def fail(sid):
+        raise AssertionError('版本未变化时不应重新读取会话数据')
+    monkeypatch.setattr(store, 'load', fail)
+
+    assert interface._load(sid)[0] == {'user_id': 1}
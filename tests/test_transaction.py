@@ -0,0 +1,91 @@
+# transaction()提交阶段的测试（使用假连接，不需要MySQL服务器）
+import pytest
+
+try:
+    import MySQLdb  # noqa: F401
+except ImportError:
+    # 未安装mysqlclient时用PyMySQL代替，两者都没有时跳过
+    pytest.importorskip('pymysql').install_as_MySQLdb()
+
+from flask import g
+
+import app.utils as utils
+from app import app, query_cache
+
+
+class FakeCursor:
+    def execute(self, statement, params=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail_commit=False):
+        self.fail_commit = fail_commit
+        self.rolled_back = 0
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor()
+
+    def commit(self):
+        if self.fail_commit:
+            raise MySQLdb.OperationalError(2013, 'Lost connection to MySQL server during query')
+
+    def rollback(self):
+        self.rolled_back += 1
+
+
+class FakeMySQL:
+    def __init__(self, conn):
+        self.connection = conn
+
+    def mark_primary_sticky(self):
+        pass
+
+    def discard_connection(self, conn=None, error=None):
+        pass
+
+
+@pytest.fixture
+def use_connection(monkeypatch):
+    def use(conn):
+        monkeypatch.setattr(utils, 'mysql', FakeMySQL(conn))
+        return conn
+    with app.test_request_context():
+        yield use
+
+
+def test_commit_runs_callbacks_and_invalidates_tables(use_connection):
+    use_connection(FakeConnection())
+    called = []
+    generation = query_cache.generation(('users',))
+    with utils.transaction():
+        g._db_pending_tables = frozenset({'users'})
+        utils.after_commit(called.append, 'done')
+
+    assert called == ['done']
+    assert query_cache.generation(('users',)) != generation
+
+
+def test_failed_commit_clears_pending_state(use_connection):
+    conn = use_connection(FakeConnection(fail_commit=True))
+    called = []
+    generation = query_cache.generation(('users',))
+    with pytest.raises(MySQLdb.OperationalError):
+        with utils.transaction():
+            g._db_pending_tables = frozenset({'users'})
+            utils.after_commit(called.append, 'done')
+
+    assert called == []
+    assert conn.rolled_back == 1
+    assert '_db_pending_tables' not in g and '_db_after_commit' not in g
+    # 提交结果不确定，写过的表仍然失效
+    assert query_cache.generation(('users',)) != generation
+
+    # 之后的事务不会执行失败事务的回调
+    conn.fail_commit = False
+    with utils.transaction():
+        pass
+    assert called == []